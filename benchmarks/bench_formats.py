@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Compare encode time and output size of the output formats.
+
+Usage: python benchmarks/bench_formats.py stem.wav [-r 3]
+
+Encodes the WAV file to every output format with the settings demix uses,
+with and without a tempo change, and prints the best wall time, the
+real-time factor and the output size relative to the WAV input. The wav
+format without effects is a hardlink, so it shows the cost of the fast path.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import wav_info  # noqa: E402
+from demix.cli import OUTPUT_FORMATS, export_audio  # noqa: E402
+
+
+def bench(wav_file, fmt, tempo, repeats):
+    best = None
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_file = os.path.join(tmpdir, f"out.{fmt}")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            export_audio(wav_file, output_file, tempo=tempo, fmt=fmt)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        size = os.path.getsize(output_file)
+    return best, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark output format encoding.")
+    parser.add_argument("wav_file", help="WAV file to encode, e.g. a separated stem")
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    frames, rate, _ = wav_info(args.wav_file)
+    duration = frames / rate
+    wav_size = os.path.getsize(args.wav_file)
+    print(f"{args.wav_file}: {duration:.1f}s, {wav_size / 1e6:.1f} MB, best of {args.repeats}")
+    print(f"{'format':<16}{'seconds':>10}{'x realtime':>12}{'size MB':>10}{'% of wav':>10}")
+    for tempo in (1.0, 0.9):
+        for fmt in OUTPUT_FORMATS:
+            seconds, size = bench(args.wav_file, fmt, tempo, args.repeats)
+            label = fmt if tempo == 1.0 else f"{fmt} (tempo {tempo})"
+            print(f"{label:<16}{seconds:>10.3f}{duration / max(seconds, 1e-9):>12.0f}"
+                  f"{size / 1e6:>10.1f}{100 * size / wav_size:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
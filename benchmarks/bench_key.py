@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Compare fast (excerpt) key detection with full key detection.
+
+Usage: python benchmarks/bench_key.py song1.wav [song2.wav ...] [-n 8] [-s 10]
+
+For each file, times detect_key (MonoLoader + KeyExtractor on the whole
+track), the excerpt estimate alone and fast_key (excerpts with the full
+analysis fallback). Reports the speedup and whether the key labels agree,
+then the overall agreement and fallback rate.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.analysis import (  # noqa: E402
+    FAST_KEY_EXCERPT_SECONDS,
+    FAST_KEY_EXCERPTS,
+    FAST_KEY_MIN_STRENGTH,
+    fast_key,
+    sampled_key,
+)
+from demix.audio import wav_info  # noqa: E402
+from demix.cli import detect_key  # noqa: E402
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fast key detection against full analysis.")
+    parser.add_argument("wav_files", nargs="+", help="44.1 kHz WAV files")
+    parser.add_argument("-n", "--excerpts", type=int, default=FAST_KEY_EXCERPTS)
+    parser.add_argument("-s", "--seconds", type=float, default=FAST_KEY_EXCERPT_SECONDS)
+    args = parser.parse_args()
+
+    print(f"{'file':<32}{'length':>8}{'full s':>9}{'fast s':>9}{'speedup':>9}  {'full key':<12}{'fast key':<12}")
+    agree = fallbacks = 0
+    for wav_file in args.wav_files:
+        frames, rate, _ = wav_info(wav_file)
+        full_seconds, full = timed(detect_key, wav_file)
+        sampled = sampled_key(wav_file, args.excerpts, args.seconds)
+        fallbacks += sampled[2] < FAST_KEY_MIN_STRENGTH
+        fast_seconds, fast = timed(fast_key, wav_file, args.excerpts, args.seconds)
+        agree += fast[:2] == full[:2]
+        name = os.path.basename(wav_file)[:30]
+        print(f"{name:<32}{frames / rate:>7.0f}s{full_seconds:>9.2f}{fast_seconds:>9.2f}"
+              f"{full_seconds / fast_seconds:>8.1f}x  {' '.join(full[:2]):<12}{' '.join(fast[:2]):<12}")
+
+    total = len(args.wav_files)
+    print(f"\nagreement: {agree}/{total} ({100 * agree / total:.0f}%), "
+          f"fallback to full analysis: {fallbacks}/{total}")
+
+
+if __name__ == "__main__":
+    main()
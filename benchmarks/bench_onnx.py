@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Compare the ONNX Runtime engine with in-process TensorFlow Spleeter.
+
+Usage: python benchmarks/bench_onnx.py song.wav [-m 4stems] [-t 1 2 4 8]
+
+Reports the separation time of the TensorFlow backend and of the ONNX
+backend for each intra-op thread count, and checks that the ONNX stems match
+the TensorFlow ones (max absolute difference and SNR per stem). Export the
+models first with `demix export-onnx`.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import read_wav  # noqa: E402
+from demix.backends import BACKENDS  # noqa: E402
+from demix.stems import STEM_MODES  # noqa: E402
+
+TOLERANCE = 1e-3
+
+
+def timed(backend, samples, mode, repeats):
+    backend.separate(samples, mode)
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        stems = backend.separate(samples, mode)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, stems
+
+
+def snr_db(reference, estimate):
+    noise = np.sum((reference - estimate) ** 2)
+    return 10 * np.log10(np.sum(reference ** 2) / max(noise, 1e-20))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ONNX Runtime against TensorFlow Spleeter.")
+    parser.add_argument("wav_file", help="44.1 kHz stereo WAV file to separate")
+    parser.add_argument("-m", "--mode", choices=list(STEM_MODES), default="2stems")
+    parser.add_argument("-t", "--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    samples, rate = read_wav(args.wav_file)
+    duration = len(samples) / rate
+    print(f"{args.wav_file}: {duration:.1f}s, mode {args.mode}, best of {args.repeats}")
+
+    tf_seconds, reference = timed(BACKENDS["spleeter-tf"](), samples, args.mode, args.repeats)
+    print(f"{'backend':<16}{'seconds':>10}{'x realtime':>12}")
+    print(f"{'tensorflow':<16}{tf_seconds:>10.2f}{duration / tf_seconds:>12.1f}")
+
+    for threads in args.threads:
+        backend = BACKENDS["onnx"]()
+        backend.configure(threads=threads)
+        seconds, stems = timed(backend, samples, args.mode, args.repeats)
+        print(f"{f'onnx ({threads} thr)':<16}{seconds:>10.2f}{duration / seconds:>12.1f}")
+
+    print(f"\n{'stem':<16}{'max diff':>10}{'SNR dB':>10}")
+    for stem in STEM_MODES[args.mode]:
+        diff = np.abs(reference[stem] - stems[stem]).max()
+        status = "ok" if diff <= TOLERANCE else "MISMATCH"
+        print(f"{stem:<16}{diff:>10.2e}{snr_db(reference[stem], stems[stem]):>10.1f}  {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Compare decoding a source with ffmpeg to reading it from the decoded-PCM cache.
+
+Usage: python benchmarks/bench_pcm_cache.py song.mp3 [-s 30] [-e 90] [-r 3]
+
+Times, for the same cut, the ffmpeg decode to WAV that runs without the
+cache, filling the cache (one full decode to .npy) and writing the cut WAV
+from the memory-mapped cache file. Uses a temporary cache directory, so the
+real cache is left alone.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import write_pcm_wav  # noqa: E402
+from demix.cli import convert_to_wav  # noqa: E402
+from demix.pcmcache import cached_pcm, cut_pcm  # noqa: E402
+
+
+def timed(run):
+    start = time.perf_counter()
+    result = run()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the decoded-PCM cache.")
+    parser.add_argument("source", help="audio file to decode")
+    parser.add_argument("-s", "--start", type=float, help="start of the cut in seconds")
+    parser.add_argument("-e", "--end", type=float, help="end of the cut in seconds")
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir, patch("demix.paths.CACHE_DIR", tmpdir):
+        wav_file = os.path.join(tmpdir, "music.wav")
+        decode = min(
+            timed(lambda: convert_to_wav(args.source, wav_file, args.start, args.end))[0]
+            for _ in range(args.repeats)
+        )
+        fill, _ = timed(lambda: cached_pcm(args.source))
+
+        def from_cache():
+            pcm, _ = cached_pcm(args.source)
+            write_pcm_wav(wav_file, cut_pcm(pcm, args.start, args.end))
+        hit = min(timed(from_cache)[0] for _ in range(args.repeats))
+
+    print(f"{args.source}, cut {args.start or 0:g}s to {args.end if args.end is not None else 'end'}, "
+          f"best of {args.repeats}")
+    print(f"{'ffmpeg decode':<20}{decode:>10.3f}s")
+    print(f"{'fill cache':<20}{fill:>10.3f}s")
+    print(f"{'cache hit':<20}{hit:>10.3f}s ({decode / max(hit, 1e-9):.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""
+Benchmark separation time of the quality tiers.
+
+Usage: python benchmarks/bench_quality.py song.wav [-m 4stems] [-r 3]
+
+Each tier is run once to warm up (and download the model if needed), then
+timed over the given number of repetitions. Prints wall time and the
+real-time factor (audio duration / processing time) per tier.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import wav_info  # noqa: E402
+from demix.cli import separate_audio  # noqa: E402
+from demix.stems import QUALITY_TIERS, STEM_MODES  # noqa: E402
+
+
+def bench(wav_file, mode, quality, repeats):
+    timings = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        separate_audio(wav_file, tmpdir, mode, quality)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            separate_audio(wav_file, tmpdir, mode, quality)
+            timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark separation quality tiers.")
+    parser.add_argument("wav_file", help="44.1 kHz stereo WAV file to separate")
+    parser.add_argument("-m", "--mode", choices=list(STEM_MODES), default="2stems")
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    frames, rate, _ = wav_info(args.wav_file)
+    duration = frames / rate
+    print(f"{args.wav_file}: {duration:.1f}s, mode {args.mode}, best of {args.repeats}")
+    print(f"{'tier':<10}{'seconds':>10}{'x realtime':>12}")
+    for quality in QUALITY_TIERS:
+        seconds = bench(args.wav_file, args.mode, quality, args.repeats)
+        print(f"{quality:<10}{seconds:>10.2f}{duration / seconds:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Play a WAV file through a pipe at 1x speed into the streaming separator.
+
+Usage: python benchmarks/bench_stream.py song.wav [-b onnx] [-m 2stems] [--latency 1.0] [--context 2.0]
+
+A player thread writes the file as 16-bit PCM into a pipe in real time,
+block by block, the way a live input would deliver it. The separator reads
+from the other end as `demix stream` does. Prints the real-time load, the
+number of blocks that took longer than their duration, and the measured
+delay between a block being played and its stems being written, which
+should stay close to the configured latency.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import read_wav, to_int16  # noqa: E402
+from demix.backends import get_backend  # noqa: E402
+from demix.streaming import DEFAULT_CONTEXT, DEFAULT_LATENCY, stream_separate  # noqa: E402
+
+PLAYER_BLOCK = 0.02
+
+
+class TimedOutput:
+    """Byte sink recording when each output block was written."""
+
+    def __init__(self, channels):
+        self.frame_bytes = channels * 2
+        self.frames = 0
+        self.times = []
+
+    def write(self, data):
+        self.times.append((self.frames, time.perf_counter()))
+        self.frames += len(data) // self.frame_bytes
+
+    def flush(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming separation at real-time speed.")
+    parser.add_argument("wav_file", help="44.1 kHz stereo WAV file to play")
+    parser.add_argument("-b", "--backend", default="onnx")
+    parser.add_argument("-m", "--mode", default="2stems")
+    parser.add_argument("-q", "--quality", default="fast")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY)
+    parser.add_argument("--context", type=float, default=DEFAULT_CONTEXT)
+    args = parser.parse_args()
+
+    samples, rate = read_wav(args.wav_file)
+    backend = get_backend(args.backend)
+    stems = backend.modes[args.mode]
+    read_fd, write_fd = os.pipe()
+    started = []
+
+    def play():
+        block = int(PLAYER_BLOCK * rate)
+        with os.fdopen(write_fd, "wb") as pipe:
+            started.append(time.perf_counter())
+            for start in range(0, len(samples), block):
+                pipe.write(to_int16(samples[start:start + block]).tobytes())
+                pipe.flush()
+                # Sleep until the next block is due, so the pipe runs at 1x speed
+                time.sleep(max(0.0, started[0] + (start + block) / rate - time.perf_counter()))
+
+    outputs = {stem: TimedOutput(samples.shape[1]) for stem in stems}
+    player = threading.Thread(target=play)
+    player.start()
+    with os.fdopen(read_fd, "rb") as pipe:
+        report = stream_separate(
+            pipe, outputs, lambda block: backend.separate(block, args.mode, args.quality), stems,
+            latency=args.latency, context=args.context,
+        )
+    player.join()
+
+    # Delay of each output block: written at `when`, its first frame was played at frame / rate
+    delays = [when - started[0] - frame / rate for frame, when in outputs[stems[0]].times]
+    print(f"{args.wav_file}: {len(samples) / rate:.1f}s, {args.backend} {args.mode} {args.quality}, "
+          f"latency {args.latency:g}s, context {args.context:g}s")
+    print(f"real-time load  {report.load:.2f}x (worst block {report.worst:.2f}x)")
+    print(f"late blocks     {report.late} of {report.blocks}")
+    print(f"output delay    {sum(delays) / len(delays):.3f}s mean, {max(delays):.3f}s max")
+
+
+if __name__ == "__main__":
+    main()
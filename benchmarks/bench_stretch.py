@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Compare the ffmpeg and the built-in NumPy tempo/transpose engines.
+
+Usage: python benchmarks/bench_stretch.py vocals.wav drums.wav bass.wav other.wav [-t 0.9] [-p -2] [-r 3]
+
+Applies the same effects to all stems, once with ffmpeg (rubberband filter,
+one process per stem, as demix does with --stretch-engine ffmpeg) and once
+per quality with the NumPy engine, which processes all stems in one batch.
+Prints the best wall time and the real-time factor of the whole set. The
+ffmpeg rows are skipped when ffmpeg is not installed.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import wav_info  # noqa: E402
+from demix.cli import export_audio  # noqa: E402
+from demix.stretch import STRETCH_QUALITIES, stretch_files  # noqa: E402
+
+
+def best_of(repeats, run):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tempo/transpose engines.")
+    parser.add_argument("wav_files", nargs="+", help="stem WAV files with the same sample rate and channels")
+    parser.add_argument("-t", "--tempo", type=float, default=0.9)
+    parser.add_argument("-p", "--transpose", type=int, default=-2)
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    frames, rate, channels = wav_info(args.wav_files[0])
+    duration = frames / rate
+    print(f"{len(args.wav_files)} files of {duration:.1f}s, {channels} channels, "
+          f"tempo {args.tempo}, transpose {args.transpose:+d}, best of {args.repeats}")
+    print(f"{'engine':<20}{'seconds':>10}{'x realtime':>12}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        outputs = [os.path.join(tmpdir, os.path.basename(path)) for path in args.wav_files]
+
+        def ffmpeg():
+            for path, output in zip(args.wav_files, outputs):
+                export_audio(path, output, args.tempo, args.transpose, "wav")
+
+        rows = []
+        if shutil.which("ffmpeg"):
+            rows.append(("ffmpeg", ffmpeg))
+        else:
+            print("ffmpeg not found, skipping the ffmpeg engine")
+        for quality in STRETCH_QUALITIES:
+            rows.append((
+                f"numpy ({quality})",
+                lambda quality=quality: stretch_files(args.wav_files, outputs, args.tempo, args.transpose, quality),
+            ))
+        for label, run in rows:
+            seconds = best_of(args.repeats, run)
+            print(f"{label:<20}{seconds:>10.3f}{duration / max(seconds, 1e-9):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,12 @@ for tempo/pitch adjustments and audio cutting.
 __version__ = "1.2.1"
 __author__ = "Piotr Wittchen"
 
+from demix.stems import STEM_MODES
+from demix.backends import SeparationBackend, register_backend, get_backend
 from demix.cli import (
     main,
-    STEM_MODES,
     DEFAULT_VIDEO_RESOLUTION,
+    OUTPUT_FORMATS,
     Spinner,
     parse_args,
     parse_time,
@@ -20,11 +22,20 @@ from demix.cli import (
     remove_dir,
     clean,
     convert_wav_to_mp3,
+    encode_audio,
+    export_audio,
+    publish_wav,
     convert_to_wav,
+    decode_source,
     separate_audio,
     detect_key,
+    detect_key_profiles,
     download_video,
     create_empty_mkv_with_audio,
+    mux_tracks,
+    parse_stem_effects,
+    parse_stdout_stems,
+    job_slug,
     check_ffmpeg,
     search_youtube,
     _resolve_search,
@@ -34,7 +45,11 @@ __all__ = [
     "__version__",
     "main",
     "STEM_MODES",
+    "SeparationBackend",
+    "register_backend",
+    "get_backend",
     "DEFAULT_VIDEO_RESOLUTION",
+    "OUTPUT_FORMATS",
     "Spinner",
     "parse_args",
     "parse_time",
@@ -42,11 +57,20 @@ __all__ = [
     "remove_dir",
     "clean",
     "convert_wav_to_mp3",
+    "encode_audio",
+    "export_audio",
+    "publish_wav",
     "convert_to_wav",
+    "decode_source",
     "separate_audio",
     "detect_key",
+    "detect_key_profiles",
     "download_video",
     "create_empty_mkv_with_audio",
+    "mux_tracks",
+    "parse_stem_effects",
+    "parse_stdout_stems",
+    "job_slug",
     "check_ffmpeg",
     "search_youtube",
     "_resolve_search",
@@ -0,0 +1,600 @@
+"""Single-pass audio analysis: key, tempo and loudness from one read.
+
+The WAV file is read block by block. Every block feeds a loudness meter,
+and its mono mix is cut into frames whose spectra are shared by the key
+estimation (HPCP) and by the onset detection function used for beat
+tracking. Only small per-frame features are kept, so memory does not grow
+with the length of the audio.
+"""
+
+import json
+import math
+
+import numpy as np
+import essentia.standard as es
+
+from demix.audio import iter_stem_blocks, iter_wav_blocks, read_wav, wav_info
+
+FRAME_SIZE = 4096
+HOP_SIZE = 1024
+# HPCP is computed on every 4th frame, i.e. with the 4096 hop KeyExtractor uses.
+# Frames 2, 6, 10, ... start where KeyExtractor's frames, centered on multiples of 4096, start.
+HPCP_INTERVAL = 4
+HPCP_PHASE = 2
+HPCP_SIZE = 12
+# Bins of the averaged HPCP below this fraction of its peak are zeroed, as KeyExtractor does
+PCP_THRESHOLD = 0.2
+KEY_PROFILE = "bgate"
+# Key profiles of essentia's Key algorithm (weichai is left out, it rejects minor keys)
+KEY_PROFILES = [
+    "bgate", "braw", "diatonic", "edma", "edmm", "gomez", "krumhansl", "noland",
+    "shaath", "temperley", "temperley2005", "thpcp", "tonictriad",
+]
+BLOCK_SECONDS = 30
+
+# Key names as spelled by essentia's Key algorithm
+KEY_NAMES = ["C", "C#", "D", "Eb", "E", "F", "F#", "G", "Ab", "A", "Bb", "B"]
+_ENHARMONICS = {"Db": "C#", "D#": "Eb", "Gb": "F#", "G#": "Ab", "A#": "Bb"}
+KEY_EXCERPT_SECONDS = 30
+# Fast key detection: excerpts spread over the file, full analysis below the strength threshold
+FAST_KEY_EXCERPTS = 8
+FAST_KEY_EXCERPT_SECONDS = 10
+FAST_KEY_MIN_STRENGTH = 0.5
+
+# Key timeline: sliding windows over the HPCP frames
+TIMELINE_WINDOW_SECONDS = 20
+TIMELINE_HOP_SECONDS = 5
+TIMELINE_MIN_SEGMENT_SECONDS = 15
+# Krumhansl-Kessler key profiles, starting on the tonic
+MAJOR_PROFILE = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
+MINOR_PROFILE = [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
+
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+
+def _k_weighting(sample_rate):
+    """Return the two BS.1770 K-weighting biquads (shelf, high-pass) as (b, a) pairs."""
+    f0 = 1681.974450955533
+    gain = 3.999843853973347
+    q = 0.7071752369554196
+    k = math.tan(math.pi * f0 / sample_rate)
+    vh = 10 ** (gain / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = (
+        [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0],
+        [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0],
+    )
+    f0 = 38.13547087602444
+    q = 0.5003270373238773
+    k = math.tan(math.pi * f0 / sample_rate)
+    a0 = 1 + k / q + k * k
+    high_pass = ([1.0, -2.0, 1.0], [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+    return shelf, high_pass
+
+
+def gated_loudness(block_powers):
+    """Integrated loudness (LUFS) of 400 ms block powers with BS.1770 gating."""
+    block_powers = np.asarray(block_powers, dtype=np.float64)
+    if not len(block_powers):
+        return float("-inf")
+    loudness = -0.691 + 10 * np.log10(np.maximum(block_powers, 1e-20))
+    gated = block_powers[loudness > ABSOLUTE_GATE_LUFS]
+    if not len(gated):
+        return float("-inf")
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+    gated = block_powers[(loudness > ABSOLUTE_GATE_LUFS) & (loudness > relative_gate)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def _k_filters(sample_rate, channels):
+    return [
+        [es.IIR(numerator=b, denominator=a) for b, a in _k_weighting(sample_rate)]
+        for _ in range(channels)
+    ]
+
+
+def _k_weight(filters, block):
+    """K-weight each channel of a (frames, channels) block with its own (stateful) filters."""
+    # essentia filters in single precision, a float64 copy would only cost memory
+    weighted = np.empty(block.shape, dtype=np.float32)
+    for channel, stages in enumerate(filters):
+        signal = np.ascontiguousarray(block[:, channel])
+        for stage in stages:
+            signal = stage(signal)
+        weighted[:, channel] = signal
+    return weighted
+
+
+def _split_steps(squares, step):
+    """Return the per-step sums of complete steps of `squares` and the remainder."""
+    n_steps = len(squares) // step
+    steps = squares[:n_steps * step].reshape(n_steps, step, squares.shape[1]).sum(axis=1)
+    return steps, squares[n_steps * step:]
+
+
+def _block_powers(step_energies, step):
+    """Mean powers of 400 ms blocks overlapping by 75%, from 100 ms step energies."""
+    energies = np.asarray(step_energies)
+    if len(energies) < 4:
+        return energies[:0]
+    return (energies[:-3] + energies[1:-2] + energies[2:-1] + energies[3:]) / (4 * step)
+
+
+class LoudnessMeter:
+    """Streaming EBU R128 integrated loudness and sample peak."""
+
+    def __init__(self, sample_rate, channels):
+        self.filters = _k_filters(sample_rate, channels)
+        self.step = int(round(0.1 * sample_rate))
+        self.pending = np.zeros((0, channels), dtype=np.float64)
+        self.step_energies = []
+        self.peak = 0.0
+
+    def process(self, block):
+        self.peak = max(self.peak, float(np.abs(block).max(initial=0.0)))
+        weighted = _k_weight(self.filters, block)
+        steps, self.pending = _split_steps(np.concatenate([self.pending, weighted ** 2]), self.step)
+        self.step_energies.extend(steps.sum(axis=1))
+
+    def integrated(self):
+        """Integrated loudness over 400 ms blocks overlapping by 75%."""
+        return gated_loudness(_block_powers(self.step_energies, self.step))
+
+    def peak_db(self):
+        return 20 * math.log10(self.peak) if self.peak > 0 else float("-inf")
+
+
+class StemLoudnessMeter:
+    """Streaming integrated loudness and sample peak of several signals (e.g. stems) at once.
+
+    The signals are K-weighted and gated together, one vectorized pass per block.
+    """
+
+    def __init__(self, sample_rate, signals, channels):
+        self.filters = _k_filters(sample_rate, signals * channels)
+        self.step = int(round(0.1 * sample_rate))
+        self.pending = np.zeros((0, signals), dtype=np.float64)
+        self.step_energies = np.zeros((0, signals), dtype=np.float64)
+        self.peaks = np.zeros(signals)
+
+    def process(self, blocks):
+        """Measure a (signals, frames, channels) block."""
+        signals, frames, channels = blocks.shape
+        self.peaks = np.maximum(self.peaks, np.abs(blocks).max(axis=(1, 2), initial=0.0))
+        flat = blocks.transpose(1, 0, 2).reshape(frames, signals * channels)
+        weighted = _k_weight(self.filters, flat).reshape(frames, signals, channels)
+        squares = np.empty((len(self.pending) + frames, signals), dtype=np.float64)
+        squares[:len(self.pending)] = self.pending
+        squares[len(self.pending):] = np.einsum("fsc,fsc->fs", weighted, weighted)
+        steps, self.pending = _split_steps(squares, self.step)
+        self.step_energies = np.concatenate([self.step_energies, steps])
+
+    def integrated(self):
+        """Return the integrated loudness (LUFS) of each signal."""
+        powers = _block_powers(self.step_energies, self.step)
+        return [gated_loudness(powers[:, i]) for i in range(powers.shape[1])]
+
+    def peaks_db(self):
+        """Return the sample peak (dBFS) of each signal."""
+        return [20 * math.log10(peak) if peak > 0 else float("-inf") for peak in self.peaks]
+
+
+def normalization_gains(stem_files, mix_file, target_lufs, per_stem=False, block_seconds=BLOCK_SECONDS):
+    """Return ({stem: gain dB}, mix gain dB) that bring the output to `target_lufs`.
+
+    The stems and the mix they were separated from are measured together in
+    one read. By default every stem gets the gain that brings the mix to the
+    target, so the balance of the mix is kept; with `per_stem`, each stem is
+    brought to the target on its own. Gains are limited so that no sample
+    peak exceeds 0 dBFS, and silent stems are left unchanged.
+    """
+    names = list(stem_files)
+    paths = [stem_files[name] for name in names] + [mix_file]
+    _, rate, channels = wav_info(mix_file)
+    meter = StemLoudnessMeter(rate, len(paths), channels)
+    for blocks in iter_stem_blocks(paths, int(block_seconds * rate)):
+        meter.process(blocks)
+
+    def gain(loudness, peak):
+        if loudness == float("-inf"):
+            return 0.0
+        return min(target_lufs - loudness, -peak)
+
+    loudness, peaks = meter.integrated(), meter.peaks_db()
+    if not per_stem:
+        mix_gain = gain(loudness[-1], max(peaks))
+        return {name: mix_gain for name in names}, mix_gain
+    return {name: gain(loudness[i], peaks[i]) for i, name in enumerate(names)}, gain(loudness[-1], peaks[-1])
+
+
+class SpectralFrames:
+    """Cuts a stream of mono blocks into overlapping windowed frames.
+
+    With `centered`, the first frame is centered on the first sample, like
+    the frames of essentia's FrameCutter (and so KeyExtractor).
+    """
+
+    def __init__(self, frame_size=FRAME_SIZE, hop_size=HOP_SIZE, centered=False):
+        self.frame_size = frame_size
+        self.hop_size = hop_size
+        window = np.hanning(frame_size + 1)[:-1]
+        # Normalized like essentia's Windowing, so spectral thresholds match
+        self.window = (window * 2 / window.sum()).astype(np.float32)
+        self.buffer = np.zeros(frame_size // 2 if centered else 0, dtype=np.float32)
+
+    def spectra(self, mono, final=False):
+        """Return the complex spectra (frames, bins) of all frames completed by `mono`."""
+        self.buffer = np.concatenate([self.buffer, mono])
+        if final and len(self.buffer):
+            # Zero-pad so the last samples end up in a frame
+            pad = (-(len(self.buffer) - self.frame_size)) % self.hop_size
+            pad = pad if len(self.buffer) >= self.frame_size else self.frame_size - len(self.buffer)
+            self.buffer = np.concatenate([self.buffer, np.zeros(pad, dtype=np.float32)])
+        if len(self.buffer) < self.frame_size:
+            return np.zeros((0, self.frame_size // 2 + 1), dtype=np.complex64)
+        n_frames = (len(self.buffer) - self.frame_size) // self.hop_size + 1
+        index = np.arange(n_frames)[:, np.newaxis] * self.hop_size + np.arange(self.frame_size)
+        spectra = np.fft.rfft(self.buffer[index] * self.window, axis=1).astype(np.complex64)
+        self.buffer = self.buffer[n_frames * self.hop_size:]
+        return spectra
+
+
+class HpcpAccumulator:
+    """Harmonic pitch class profiles of spectra, computed like essentia's KeyExtractor.
+
+    Every frame goes through the same chain and parameters: spectral peaks,
+    spectral whitening and an unnormalized HPCP. The mean is normalized to
+    its peak and thresholded as KeyExtractor does before estimating the key.
+    """
+
+    def __init__(self, sample_rate, keep_frames=False, interval=HPCP_INTERVAL, phase=0):
+        self.peaks = es.SpectralPeaks(
+            orderBy="magnitude", magnitudeThreshold=0.0001, minFrequency=25,
+            maxFrequency=3500, maxPeaks=60, sampleRate=sample_rate,
+        )
+        self.whitening = es.SpectralWhitening(maxFrequency=3500, sampleRate=sample_rate)
+        self.hpcp = es.HPCP(
+            size=HPCP_SIZE, referenceFrequency=440, bandPreset=False, minFrequency=25,
+            maxFrequency=3500, weightType="cosine", nonLinear=False, windowSize=1.0,
+            harmonics=4, normalized="none", maxShifted=False, sampleRate=sample_rate,
+        )
+        self.interval = interval
+        self.phase = phase
+        self.keep_frames = keep_frames
+        self.frames = []
+        self.total = np.zeros(HPCP_SIZE, dtype=np.float64)
+        self.count = 0
+        self.seen = 0
+
+    def process(self, magnitudes):
+        offset = (self.phase - self.seen) % self.interval
+        for magnitude in magnitudes[offset::self.interval]:
+            magnitude = np.ascontiguousarray(magnitude, dtype=np.float32)
+            frequencies, peak_magnitudes = self.peaks(magnitude)
+            peak_magnitudes = self.whitening(magnitude, frequencies, peak_magnitudes)
+            pcp = np.asarray(self.hpcp(frequencies, peak_magnitudes), dtype=np.float64)
+            self.total += pcp
+            self.count += 1
+            if self.keep_frames:
+                self.frames.append(pcp.astype(np.float32))
+        self.seen += len(magnitudes)
+
+    def mean(self):
+        mean = self.total / max(self.count, 1)
+        peak = mean.max()
+        mean = mean / peak if peak > 0 else mean
+        # KeyExtractor's averageDetuningCorrection only acts on HPCPs finer than 12 bins
+        return np.where(mean < PCP_THRESHOLD, 0.0, mean).astype(np.float32)
+
+
+def estimate_key(mean_hpcp, profile=KEY_PROFILE):
+    """Return (key, scale, strength) of an averaged HPCP for a key profile."""
+    key, scale, strength, _ = es.Key(
+        profileType=profile, pcpSize=HPCP_SIZE, numHarmonics=4, slope=0.6,
+        usePolyphony=False, useThreeChords=False,
+    )(np.asarray(mean_hpcp, dtype=np.float32))
+    return key, scale, float(strength)
+
+
+def estimate_keys(mean_hpcp, profiles):
+    """Return {profile: (key, scale, strength)} for several key profiles of one averaged HPCP."""
+    return {profile: estimate_key(mean_hpcp, profile) for profile in profiles}
+
+
+def key_consensus(results):
+    """Return the (key, scale, strength) most supported by {profile: (key, scale, strength)} results.
+
+    Every profile votes for its key with its strength. The consensus
+    strength is the winning key's votes divided by the number of profiles,
+    so it is only high when most profiles agree confidently.
+    """
+    votes = {}
+    for key, scale, strength in results.values():
+        votes[(key, scale)] = votes.get((key, scale), 0.0) + strength
+    (key, scale), total = max(votes.items(), key=lambda item: item[1])
+    return key, scale, total / len(results)
+
+
+def parse_key_profiles(value):
+    """Parse a comma-separated list of key profiles; "all" selects every profile."""
+    if value.strip() == "all":
+        return list(KEY_PROFILES)
+    profiles = [profile.strip() for profile in value.split(",") if profile.strip()]
+    if not profiles:
+        raise ValueError("No key profiles given")
+    unknown = [profile for profile in profiles if profile not in KEY_PROFILES]
+    if unknown:
+        raise ValueError(f"Unknown key profile: {unknown[0]}. Choose from: {', '.join(KEY_PROFILES)}")
+    return profiles
+
+
+def signal_hpcp(mono, rate, chunk_seconds=BLOCK_SECONDS):
+    """Return the averaged HPCP of a mono signal, framed like KeyExtractor."""
+    frames = SpectralFrames(FRAME_SIZE, FRAME_SIZE, centered=True)
+    hpcp = HpcpAccumulator(rate, interval=1)
+    chunk = int(chunk_seconds * rate)
+    # Chunks bound the size of the frame matrix
+    for start in range(0, len(mono), chunk):
+        hpcp.process(np.abs(frames.spectra(np.asarray(mono[start:start + chunk], dtype=np.float32))))
+    hpcp.process(np.abs(frames.spectra(np.zeros(0, dtype=np.float32), final=True)))
+    return hpcp.mean()
+
+
+def _stream_hpcp(wav_file, keep_frames=False, block_seconds=BLOCK_SECONDS):
+    """Compute the HPCP of a whole WAV file, reading it block by block."""
+    _, rate, _ = wav_info(wav_file)
+    # Frames don't overlap, the same hop KeyExtractor uses
+    frames = SpectralFrames(FRAME_SIZE, FRAME_SIZE, centered=True)
+    hpcp = HpcpAccumulator(rate, keep_frames=keep_frames, interval=1)
+    for block in iter_wav_blocks(wav_file, int(block_seconds * rate)):
+        hpcp.process(np.abs(frames.spectra(block.mean(axis=1))))
+    hpcp.process(np.abs(frames.spectra(np.zeros(0, dtype=np.float32), final=True)))
+    return hpcp
+
+
+def full_key(wav_file, block_seconds=BLOCK_SECONDS):
+    """Estimate the key of a whole WAV file, reading it block by block."""
+    return estimate_key(_stream_hpcp(wav_file, block_seconds=block_seconds).mean())
+
+
+def sampled_key(wav_file, excerpts=FAST_KEY_EXCERPTS, seconds=FAST_KEY_EXCERPT_SECONDS):
+    """Estimate the key from short excerpts spread evenly across a WAV file.
+
+    Each excerpt is read by seeking to it, the rest of the file is never
+    decoded. The HPCP is averaged over all excerpts.
+    """
+    total, rate, _ = wav_info(wav_file)
+    length = int(seconds * rate)
+    hpcp = HpcpAccumulator(rate, interval=1)
+    for i in range(excerpts):
+        center = int((i + 0.5) * total / excerpts)
+        samples, _ = read_wav(wav_file, max(0, center - length // 2), length)
+        frames = SpectralFrames(FRAME_SIZE, FRAME_SIZE, centered=True)
+        hpcp.process(np.abs(frames.spectra(samples.mean(axis=1), final=True)))
+    return estimate_key(hpcp.mean())
+
+
+def fast_key(wav_file, excerpts=FAST_KEY_EXCERPTS, seconds=FAST_KEY_EXCERPT_SECONDS,
+             min_strength=FAST_KEY_MIN_STRENGTH):
+    """Estimate the key from excerpts, falling back to the full file when not confident.
+
+    Files no longer than the excerpts combined are analyzed in full right away.
+    """
+    total, rate, _ = wav_info(wav_file)
+    if total <= excerpts * seconds * rate:
+        return full_key(wav_file)
+    key, scale, strength = sampled_key(wav_file, excerpts, seconds)
+    if strength < min_strength:
+        return full_key(wav_file)
+    return key, scale, strength
+
+
+def _key_profiles():
+    """Return the 24 standardized key profiles (12 major, 12 minor) and their labels."""
+    profiles, labels = [], []
+    for scale, profile in (("major", MAJOR_PROFILE), ("minor", MINOR_PROFILE)):
+        for tonic, name in enumerate(KEY_NAMES):
+            # HPCP bins start at A (440 Hz reference), three semitones below C
+            profiles.append(np.roll(profile, (tonic + 3) % HPCP_SIZE))
+            labels.append((name, scale))
+    profiles = np.array(profiles)
+    profiles = (profiles - profiles.mean(axis=1, keepdims=True)) / profiles.std(axis=1, keepdims=True)
+    return profiles, labels
+
+
+def _join(first, second, owner):
+    """Join two adjacent segments under the key of `owner`, weighting strengths by length."""
+    lengths = [segment["end"] - segment["start"] for segment in (first, second)]
+    strength = (first["strength"] * lengths[0] + second["strength"] * lengths[1]) / max(sum(lengths), 1e-9)
+    return dict(owner, start=first["start"], end=second["end"], strength=strength)
+
+
+def _coalesce(segments):
+    """Join adjacent segments that have the same key."""
+    joined = []
+    for segment in segments:
+        if joined and (joined[-1]["key"], joined[-1]["scale"]) == (segment["key"], segment["scale"]):
+            joined[-1] = _join(joined[-1], segment, joined[-1])
+        else:
+            joined.append(segment)
+    return joined
+
+
+def _merge_short_segments(segments, min_seconds):
+    """Absorb segments shorter than `min_seconds` into their longer neighbour."""
+    segments = _coalesce(segments)
+    while len(segments) > 1:
+        lengths = [segment["end"] - segment["start"] for segment in segments]
+        shortest = int(np.argmin(lengths))
+        if lengths[shortest] >= min_seconds:
+            break
+        neighbours = [i for i in (shortest - 1, shortest + 1) if 0 <= i < len(segments)]
+        neighbour = max(neighbours, key=lambda i: lengths[i])
+        first, second = sorted((shortest, neighbour))
+        segments[first:second + 1] = [_join(segments[first], segments[second], segments[neighbour])]
+        segments = _coalesce(segments)
+    return segments
+
+
+def key_segments(hpcp_frames, frame_rate, window_seconds=TIMELINE_WINDOW_SECONDS,
+                 hop_seconds=TIMELINE_HOP_SECONDS, min_seconds=TIMELINE_MIN_SEGMENT_SECONDS):
+    """Split a sequence of HPCP frames into segments of constant key.
+
+    Windows of `window_seconds` every `hop_seconds` are averaged with a
+    cumulative sum and correlated with all 24 key profiles in one matrix
+    product. Runs of windows with the same best key become segments, and
+    segments shorter than `min_seconds` are merged into their longer neighbour.
+
+    Returns a list of dicts with start and end (seconds), key, scale and
+    strength (correlation with the winning profile, averaged over the segment).
+    """
+    hpcp_frames = np.asarray(hpcp_frames, dtype=np.float64).reshape(-1, HPCP_SIZE)
+    n_frames = len(hpcp_frames)
+    if not n_frames:
+        return []
+    duration = n_frames / frame_rate
+    window = max(1, min(n_frames, int(round(window_seconds * frame_rate))))
+    hop = max(1, int(round(hop_seconds * frame_rate)))
+    starts = np.arange(0, n_frames - window + 1, hop)
+
+    cumulative = np.concatenate([np.zeros((1, HPCP_SIZE)), np.cumsum(hpcp_frames, axis=0)])
+    means = (cumulative[starts + window] - cumulative[starts]) / window
+    spread = means.std(axis=1, keepdims=True)
+    standardized = (means - means.mean(axis=1, keepdims=True)) / np.where(spread > 0, spread, 1)
+    profiles, labels = _key_profiles()
+    correlations = standardized @ profiles.T / HPCP_SIZE
+    best = correlations.argmax(axis=1)
+    strengths = correlations[np.arange(len(best)), best]
+
+    # Window i owns the time between the midpoints to its neighbours' centers
+    centers = (starts + window / 2) / frame_rate
+    bounds = np.concatenate([[0.0], (centers[1:] + centers[:-1]) / 2, [duration]])
+    segments = [
+        {"start": float(bounds[i]), "end": float(bounds[i + 1]), "key": labels[label][0],
+         "scale": labels[label][1], "strength": float(strengths[i])}
+        for i, label in enumerate(best)
+    ]
+    return _merge_short_segments(segments, min_seconds)
+
+
+def key_timeline(wav_file, **kwargs):
+    """Return the key segments of a WAV file (see key_segments for the options)."""
+    _, rate, _ = wav_info(wav_file)
+    hpcp = _stream_hpcp(wav_file, keep_frames=True)
+    return key_segments(hpcp.frames, rate / FRAME_SIZE, **kwargs)
+
+
+def transpose_key(key, semitones):
+    """Return the key name `semitones` above (or below, if negative) `key`.
+
+    A pitch shift moves every pitch class by the same interval, so the scale
+    is unchanged and only the tonic moves.
+    """
+    key = _ENHARMONICS.get(key, key)
+    if key not in KEY_NAMES:
+        raise ValueError(f"Unknown key: {key}")
+    return KEY_NAMES[(KEY_NAMES.index(key) + semitones) % len(KEY_NAMES)]
+
+
+def key_excerpt(duration, seconds=KEY_EXCERPT_SECONDS):
+    """Return (start, end) in seconds of an excerpt from the middle of the audio."""
+    if duration <= seconds:
+        return 0.0, duration
+    start = (duration - seconds) / 2
+    return start, start + seconds
+
+
+class OnsetAccumulator:
+    """Complex-domain onset detection function of consecutive spectra."""
+
+    def __init__(self):
+        self.previous = None
+        self.values = []
+
+    def process(self, spectra):
+        if not len(spectra):
+            return
+        if self.previous is None:
+            zeros = np.zeros((2, spectra.shape[1]), dtype=spectra.dtype)
+            self.previous = zeros
+        extended = np.concatenate([self.previous, spectra])
+        magnitude = np.abs(extended)
+        phase = np.angle(extended)
+        predicted = magnitude[1:-1] * np.exp(1j * (2 * phase[1:-1] - phase[:-2]))
+        self.values.extend(np.abs(spectra - predicted).sum(axis=1))
+        self.previous = extended[-2:]
+
+
+def track_beats(onset_values, frame_rate, offset=0.0):
+    """Return (bpm, beat times in seconds) from an onset detection function.
+
+    `offset` is added to the beat times (the frame center of the first
+    onset value). The BPM is the slope of a line fitted through the beats,
+    which is not quantized to the onset frame rate.
+    """
+    if len(onset_values) < 8 or max(onset_values) <= 0:
+        return 0.0, []
+    ticks = es.TempoTapDegara(sampleRateODF=frame_rate)(np.asarray(onset_values, dtype=np.float32))
+    ticks = [float(t) + offset for t in ticks]
+    if len(ticks) < 2:
+        return 0.0, ticks
+    period = np.polyfit(np.arange(len(ticks)), ticks, 1)[0]
+    return float(60.0 / period), ticks
+
+
+def analyze_blocks(blocks, rate, channels):
+    """Analyze key, tempo and loudness of audio given as consecutive (frames, channels) blocks.
+
+    Returns a dict with the duration, the key (key, scale, strength), the
+    tempo (bpm and beat positions in seconds) and the loudness (integrated
+    LUFS and sample peak in dBFS).
+    """
+    meter = LoudnessMeter(rate, channels)
+    frames = SpectralFrames()
+    hpcp = HpcpAccumulator(rate, phase=HPCP_PHASE)
+    onsets = OnsetAccumulator()
+    total_frames = 0
+
+    def consume(spectra):
+        hpcp.process(np.abs(spectra))
+        onsets.process(spectra)
+
+    for block in blocks:
+        total_frames += len(block)
+        meter.process(block)
+        consume(frames.spectra(block.mean(axis=1)))
+    consume(frames.spectra(np.zeros(0, dtype=np.float32), final=True))
+
+    key, scale, strength = estimate_key(hpcp.mean())
+    bpm, beats = track_beats(onsets.values, rate / HOP_SIZE, offset=FRAME_SIZE / 2 / rate)
+    return {
+        "duration": total_frames / rate,
+        "key": {"key": key, "scale": scale, "strength": strength},
+        "tempo": {"bpm": bpm, "beats": beats},
+        "loudness": {"integrated_lufs": meter.integrated(), "peak_dbfs": meter.peak_db()},
+    }
+
+
+def analyze_audio(wav_file, block_seconds=BLOCK_SECONDS):
+    """Analyze key, tempo and loudness of a WAV file in one pass (see analyze_blocks)."""
+    _, rate, channels = wav_info(wav_file)
+    return analyze_blocks(iter_wav_blocks(wav_file, int(block_seconds * rate)), rate, channels)
+
+
+def _json_safe(value):
+    if isinstance(value, float) and math.isinf(value):
+        return None
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_json_safe(v) for v in value]
+    return value
+
+
+def write_sidecar(path, analysis):
+    """Write analysis results as JSON (-inf levels of silent audio become null)."""
+    with open(path, "w") as f:
+        json.dump(_json_safe(analysis), f, indent=2)
+        f.write("\n")
@@ -0,0 +1,205 @@
+"""PCM WAV reading and writing with NumPy."""
+
+import os
+import subprocess
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+_INT_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def _decode_frames(raw, sample_width, channels):
+    if sample_width == 3:
+        bytes_ = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        ints = (bytes_[:, 0].astype(np.int32)
+                | (bytes_[:, 1].astype(np.int32) << 8)
+                | (bytes_[:, 2].astype(np.int32) << 16))
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        scale = float(1 << 23)
+    elif sample_width in _INT_DTYPES:
+        ints = np.frombuffer(raw, dtype=_INT_DTYPES[sample_width]).astype(np.float32)
+        if sample_width == 1:
+            ints -= 128
+        scale = float(1 << (8 * sample_width - 1))
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {sample_width} bytes")
+    return (ints / scale).astype(np.float32).reshape(-1, channels)
+
+
+def read_wav(path, start=0, frames=None):
+    """Read a PCM WAV file.
+
+    Returns a tuple of (samples, sample_rate) where samples is a float32 array
+    of shape (frames, channels) scaled to [-1.0, 1.0]. `start` and `frames`
+    select a range of sample frames without reading the rest of the file.
+    """
+    with wave.open(path, "rb") as w:
+        channels = w.getnchannels()
+        sample_width = w.getsampwidth()
+        rate = w.getframerate()
+        total = w.getnframes()
+        start = min(start, total)
+        w.setpos(start)
+        count = total - start if frames is None else min(frames, total - start)
+        raw = w.readframes(count)
+    return _decode_frames(raw, sample_width, channels), rate
+
+
+def iter_wav_blocks(path, block_frames):
+    """Yield consecutive float32 blocks of up to `block_frames` sample frames from a WAV file.
+
+    Only one block is held in memory at a time.
+    """
+    with wave.open(path, "rb") as w:
+        channels = w.getnchannels()
+        sample_width = w.getsampwidth()
+        while True:
+            raw = w.readframes(block_frames)
+            if not raw:
+                return
+            yield _decode_frames(raw, sample_width, channels)
+
+
+def iter_stem_blocks(paths, block_frames):
+    """Read several WAV files in lockstep.
+
+    Returns an iterator of float32 blocks of shape (len(paths), frames,
+    channels). Files that end early are padded with silence. Raises ValueError if the
+    files differ in sample rate or channel count.
+    """
+    infos = [wav_info(path) for path in paths]
+    if len({info[1:] for info in infos}) > 1:
+        raise ValueError(f"WAV files differ in sample rate or channel count: {', '.join(paths)}")
+    # Validated here rather than in the generator, so errors surface before any output is written
+    return _stem_blocks(paths, block_frames, max(frames for frames, _, _ in infos), infos[0][2])
+
+
+def _stem_blocks(paths, block_frames, total_frames, channels):
+    readers = [iter_wav_blocks(path, block_frames) for path in paths]
+    for _ in range(0, total_frames, block_frames):
+        parts = [next(reader, None) for reader in readers]
+        block = np.zeros((len(paths), max(len(part) for part in parts if part is not None), channels),
+                         dtype=np.float32)
+        for i, part in enumerate(parts):
+            if part is not None:
+                block[i, :len(part)] = part
+        yield block
+
+
+def iter_pcm_blocks(stream, block_frames, channels=CHANNELS):
+    """Yield float32 blocks of `block_frames` frames read from a binary stream of 16-bit PCM.
+
+    Only the last block can be shorter. Reads block by block, so it works on
+    pipes and FIFOs that deliver audio as it plays.
+    """
+    block_bytes = block_frames * channels * 2
+    while True:
+        raw = stream.read(block_bytes)
+        if not raw:
+            break
+        # Keep whole frames only, in case the stream ends mid-frame
+        raw = raw[:len(raw) - len(raw) % (channels * 2)]
+        if raw:
+            yield _decode_frames(raw, 2, channels)
+
+
+def iter_decoded_blocks(path, block_frames, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """Decode any audio file with ffmpeg and yield float32 blocks of up to `block_frames` frames.
+
+    The decoded audio is streamed through a pipe, nothing is written to disk.
+    Raises RuntimeError if ffmpeg cannot decode the file.
+    """
+    cmd = ["ffmpeg", "-v", "error", "-i", path, "-vn", "-f", "s16le", "-acodec", "pcm_s16le",
+           "-ar", str(sample_rate), "-ac", str(channels), "-"]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    finished = False
+    try:
+        yield from iter_pcm_blocks(process.stdout, block_frames, channels)
+        finished = True
+    finally:
+        if not finished:
+            process.kill()
+        process.stdout.close()
+        error = process.stderr.read().decode(errors="replace").strip()
+        process.stderr.close()
+        if process.wait() != 0 and finished:
+            raise RuntimeError(f"ffmpeg could not decode {path}: {error}")
+
+
+def probe_duration(path):
+    """Return the duration of a media file in seconds, or None if ffprobe cannot tell."""
+    cmd = ["ffprobe", "-i", path, "-show_entries", "format=duration", "-v", "quiet", "-of", "csv=p=0"]
+    try:
+        return float(subprocess.check_output(cmd).decode().strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def wav_info(path):
+    """Return (frames, sample_rate, channels) of a PCM WAV file."""
+    with wave.open(path, "rb") as w:
+        return w.getnframes(), w.getframerate(), w.getnchannels()
+
+
+def to_int16(samples):
+    """Convert float samples in [-1.0, 1.0] to clipped int16 PCM."""
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).round().astype("<i2")
+
+
+def write_wav(path, samples, sample_rate=SAMPLE_RATE):
+    """Write float samples of shape (frames, channels) as 16-bit PCM WAV."""
+    samples = np.asarray(samples)
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(samples.shape[1])
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(to_int16(samples).tobytes())
+
+
+def write_pcm_wav(path, pcm, sample_rate=SAMPLE_RATE, block_frames=1024 * 1024):
+    """Write int16 PCM of shape (frames, channels) as WAV, block by block.
+
+    Works on memory-mapped arrays without loading them: only the pages of the
+    block being written are read.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(pcm.shape[1])
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.setnframes(len(pcm))
+        for start in range(0, len(pcm), block_frames):
+            w.writeframesraw(np.ascontiguousarray(pcm[start:start + block_frames], "<i2").tobytes())
+
+
+def write_interleaved_wav(paths, stream, gains=None, block_frames=65536):
+    """Write PCM WAV files side by side as one 16-bit WAV to `stream`, which need not be seekable.
+
+    The channels of the first file come first, then those of the second and
+    so on. `gains` are linear gains per file. Files that end early are padded
+    with silence.
+    """
+    blocks = iter_stem_blocks(paths, block_frames)
+    frames = max(wav_info(path)[0] for path in paths)
+    _, rate, channels = wav_info(paths[0])
+    weights = np.asarray(gains if gains is not None else [1.0] * len(paths), np.float32)[:, np.newaxis, np.newaxis]
+    with wave.open(stream, "wb") as out:
+        out.setnchannels(channels * len(paths))
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        # With the length known up front the header is never rewritten, so pipes work
+        out.setnframes(frames)
+        for block in blocks:
+            interleaved = (block * weights).transpose(1, 0, 2).reshape(block.shape[1], -1)
+            out.writeframesraw(to_int16(interleaved).tobytes())
@@ -0,0 +1,167 @@
+"""Pluggable source separation backends.
+
+A backend turns a mix into named stems. Backends register themselves with
+`register_backend` and advertise the modes (stem layouts) they support, so
+the separation engine can be chosen per job with `--backend`.
+"""
+
+import os
+import subprocess
+import tempfile
+
+import numpy as np
+
+from demix.audio import SAMPLE_RATE, read_wav, wav_info, write_wav
+from demix.onnx_engine import load_separator
+from demix.stems import STEM_MODES, model_spec
+
+DEFAULT_BACKEND = "spleeter"
+
+BACKENDS = {}
+_instances = {}
+
+
+def register_backend(cls):
+    """Class decorator adding a backend to the registry under its `name`."""
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+def get_backend(name):
+    """Return the shared instance of the registered backend `name`.
+
+    Instances are kept for the lifetime of the process, so backends that load
+    a model do it only once.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown separation backend: {name}. Available: {', '.join(sorted(BACKENDS))}")
+    if name not in _instances:
+        _instances[name] = BACKENDS[name]()
+    return _instances[name]
+
+
+def _load(audio):
+    """Return (samples, sample_rate) for a path or an already decoded array."""
+    if isinstance(audio, str):
+        return read_wav(audio)
+    return np.asarray(audio, dtype=np.float32), SAMPLE_RATE
+
+
+class SeparationBackend:
+    """Base class of separation backends.
+
+    Subclasses set `name`, `modes` (mode -> stem names) and implement
+    `separate`. File based backends can override `separate_to_files` instead
+    to avoid a round trip through memory.
+    """
+
+    name = None
+    modes = STEM_MODES
+    threads = None
+
+    def supports(self, mode):
+        return mode in self.modes
+
+    def configure(self, threads=None):
+        """Set the number of CPU threads the backend may use (None for its default)."""
+        self.threads = threads
+
+    def separate(self, audio, mode, quality="standard"):
+        """Separate `audio` (WAV path or (frames, channels) array) into stems.
+
+        Returns a dict of stem name -> float32 array of shape (frames, channels).
+        """
+        raise NotImplementedError
+
+    def separate_to_files(self, input_file, output_folder, mode, quality="standard"):
+        """Separate `input_file` and write each stem to `<output_folder>/<stem>.wav`."""
+        os.makedirs(output_folder, exist_ok=True)
+        _, rate, _ = wav_info(input_file)
+        for stem, samples in self.separate(input_file, mode, quality).items():
+            write_wav(os.path.join(output_folder, f"{stem}.wav"), samples, rate)
+
+
+@register_backend
+class SpleeterCLIBackend(SeparationBackend):
+    """Spleeter run as a `spleeter separate` subprocess."""
+
+    name = "spleeter"
+
+    def separate(self, audio, mode, quality="standard"):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_file = audio
+            if not isinstance(audio, str):
+                input_file = os.path.join(tmpdir, "input.wav")
+                write_wav(input_file, audio)
+            self.separate_to_files(input_file, tmpdir, mode, quality)
+            return {stem: read_wav(os.path.join(tmpdir, f"{stem}.wav"))[0] for stem in self.modes[mode]}
+
+    def separate_to_files(self, input_file, output_folder, mode, quality="standard"):
+        os.makedirs(output_folder, exist_ok=True)
+        subprocess.run([
+            "spleeter", "separate", "-p", model_spec(mode, quality),
+            "-o", output_folder, "-f", "{instrument}.{codec}", input_file
+        ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@register_backend
+class SpleeterBackend(SeparationBackend):
+    """Spleeter running inside this process.
+
+    The TensorFlow model is loaded once and kept for subsequent calls, which
+    saves the interpreter and graph start-up of the CLI on every job.
+    """
+
+    name = "spleeter-tf"
+
+    def __init__(self):
+        self._separators = {}
+
+    def _separator(self, mode, quality):
+        spec = model_spec(mode, quality)
+        if spec not in self._separators:
+            from spleeter.separator import Separator
+            self._separators[spec] = Separator(spec, multiprocess=False)
+        return self._separators[spec]
+
+    def separate(self, audio, mode, quality="standard"):
+        samples, _ = _load(audio)
+        prediction = self._separator(mode, quality).separate(samples)
+        return {stem: prediction[stem].astype(np.float32) for stem in self.modes[mode]}
+
+
+@register_backend
+class OnnxBackend(SeparationBackend):
+    """Spleeter models exported to ONNX, run with onnxruntime on the CPU.
+
+    Models have to be exported once with `demix export-onnx`.
+    """
+
+    name = "onnx"
+
+    def __init__(self):
+        self._separators = {}
+
+    def separate(self, audio, mode, quality="standard"):
+        key = (mode, quality, self.threads)
+        if key not in self._separators:
+            self._separators[key] = load_separator(mode, quality, self.threads)
+        samples, _ = _load(audio)
+        return self._separators[key].separate(samples)
+
+
+@register_backend
+class PassthroughBackend(SeparationBackend):
+    """Trivial backend splitting the mix evenly between the stems.
+
+    The stems sum to the input, which makes it useful for testing and for
+    measuring the cost of the rest of the pipeline without a model.
+    """
+
+    name = "passthrough"
+
+    def separate(self, audio, mode, quality="standard"):
+        samples, _ = _load(audio)
+        stems = self.modes[mode]
+        share = (samples / len(stems)).astype(np.float32)
+        return {stem: share for stem in stems}
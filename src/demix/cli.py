@@ -1,16 +1,70 @@
 """Command-line interface for demix."""
 
 import argparse
+import contextlib
+import ctypes
+import errno
+import hashlib
+import json
 import subprocess
 import os
 import shutil
 import sys
 import threading
 import itertools
+import math
+import re
+import tempfile
 import time
+from urllib.parse import parse_qs, urlparse
 from pytubefix import YouTube, Search
 import essentia.standard as es
 
+from demix.analysis import (
+    ABSOLUTE_GATE_LUFS,
+    analyze_audio,
+    estimate_keys,
+    fast_key,
+    key_consensus,
+    key_excerpt,
+    key_timeline,
+    normalization_gains,
+    parse_key_profiles,
+    signal_hpcp,
+    transpose_key,
+    write_sidecar,
+)
+from demix.audio import (
+    CHANNELS,
+    SAMPLE_RATE,
+    probe_duration,
+    read_wav,
+    wav_info,
+    write_interleaved_wav,
+    write_pcm_wav,
+    write_wav,
+)
+from demix.backends import BACKENDS, DEFAULT_BACKEND, get_backend
+from demix.download import download_resumable, partial_download_path
+from demix.onnx_engine import ONNX_DIR, export_model
+from demix.paths import CACHE_DIR, DATA_DIR, tmpfs_dir
+from demix.pcmcache import cached_pcm, cut_pcm
+from demix.remix import CLIP_MODES, find_stems, mix_gains, parse_gain, remix
+from demix.scan import EXPORT_FORMATS, default_index_path, export_index, open_index, scan_library
+from demix.silence import DEFAULT_THRESHOLD_DB, separate_active_regions
+from demix.stems import (
+    QUALITY_TIERS,
+    STEM_MODES,
+    build_composite_stems,
+    mode_stems,
+    model_name,
+    parse_modes,
+    parse_stems,
+    select_mode,
+)
+from demix.streaming import DEFAULT_CONTEXT, DEFAULT_LATENCY, stream_separate
+from demix.stretch import STRETCH_QUALITIES, stretch_files
+
 
 def get_version():
     """Get version from package metadata or fallback."""
@@ -23,10 +77,26 @@ def get_version():
 
 DEFAULT_VIDEO_RESOLUTION = "1280x720"
 
-STEM_MODES = {
-    "2stems": ["vocals", "accompaniment"],
-    "4stems": ["vocals", "drums", "bass", "other"],
-    "5stems": ["vocals", "drums", "bass", "piano", "other"],
+OUTPUT_FORMATS = ["mp3", "wav", "flac", "opus"]
+CONTAINER_FORMATS = ["mka", "mkv"]
+# Size of one second of the 16-bit WAV intermediates, to estimate the space a job needs
+WAV_BYTES_PER_SECOND = SAMPLE_RATE * CHANNELS * 2
+# Length assumed for sources whose duration is unknown before they are downloaded
+UNKNOWN_SOURCE_SECONDS = 15 * 60
+# Formats that can be streamed to stdout with --stdout
+STDOUT_FORMATS = ["wav", "flac"]
+# Engines that apply tempo and transpose effects
+STRETCH_ENGINES = ["ffmpeg", "numpy"]
+# Which of the tempo and pitch effects a stem gets with --stem-effects
+STEM_EFFECTS = ["all", "tempo", "transpose", "none"]
+# Encoder settings per output format, chosen for encoding speed
+ENCODER_ARGS = {
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "192k"],
+    "wav": ["-c:a", "pcm_s16le"],
+    # Level 0 is the fastest FLAC setting (default 5), at the cost of slightly larger files
+    "flac": ["-c:a", "flac", "-compression_level", "0"],
+    # Lower libopus complexity (default 10) trades a little quality for encoding speed
+    "opus": ["-c:a", "libopus", "-b:a", "160k", "-compression_level", "5"],
 }
 
 
@@ -115,6 +185,30 @@ def clean_url(url):
     return url
 
 
+def job_slug(url=None, file=None, start_time=None, end_time=None, settings=None):
+    """Return the name of a job's result directory: a readable slug of the source and a short hash.
+
+    The hash covers the source, the cut and the `settings` that shape the
+    outputs, so the same job always maps to the same directory and jobs with
+    different inputs or options never share one. Input from stdin gets a new
+    name on every run.
+    """
+    if url:
+        parsed = urlparse(url)
+        name = parse_qs(parsed.query).get("v", [""])[0] or os.path.basename(parsed.path.rstrip("/"))
+        identity = url
+    elif file and file != "-":
+        name = os.path.splitext(os.path.basename(file))[0]
+        identity = os.path.abspath(file)
+    else:
+        name = "stdin"
+        identity = f"stdin:{os.getpid()}:{time.time()}"
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")[:40].strip("-") or "audio"
+    key = f"{identity}|{start_time}|{end_time}|{json.dumps(settings, sort_keys=True)}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:8]
+    return f"{slug}-{digest}"
+
+
 def search_youtube(query):
     """Search YouTube and return the URL of the first video result."""
     results = Search(query)
@@ -130,9 +224,10 @@ def download_video(url, output_path):
     yt = YouTube(url)
     stream = yt.streams.filter(only_audio=True).order_by("abr").desc().first()
     ext = stream.mime_type.split("/")[-1]
-    filename = f"video.{ext}"
-    stream.download(output_path=output_path, filename=filename)
-    return os.path.join(output_path, filename)
+    output_file = os.path.join(output_path, f"video.{ext}")
+    part_file = partial_download_path(f"{yt.video_id}-{stream.itag}.{ext}")
+    download_resumable(stream.url, output_file, part_file, expected_size=stream.filesize)
+    return output_file
 
 
 def convert_to_wav(input_file, output_file, start_time=None, end_time=None):
@@ -146,10 +241,31 @@ def convert_to_wav(input_file, output_file, start_time=None, end_time=None):
     subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
 
-def convert_wav_to_mp3(input_file, output_file, tempo=1.0, transpose=0):
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    cmd = ["ffmpeg", "-i", input_file]
+def decode_source(input_file, output_file, start_time=None, end_time=None, use_cache=True):
+    """Decode `input_file` (cut) to a WAV file through the decoded-PCM cache. Returns True on a cache hit.
+
+    The whole source is decoded into the cache once; every cut is then a
+    slice of it. Falls back to convert_to_wav, which decodes only the cut,
+    for stdin, with `use_cache` off, on a cache miss for a cut that is a
+    small part of the source, or when the cache can't be used.
+    """
+    if use_cache and input_file != "-":
+        try:
+            pcm, hit = cached_pcm(input_file, start_time=start_time, end_time=end_time)
+        except (OSError, RuntimeError):
+            pcm = None
+        if pcm is not None:
+            write_pcm_wav(output_file, cut_pcm(pcm, start_time, end_time))
+            return hit
+    convert_to_wav(input_file, output_file, start_time, end_time)
+    return False
+
+
+def _effect_filters(tempo=1.0, transpose=0, gain_db=0.0):
+    """Return the ffmpeg audio filters for a gain, a tempo change and a pitch shift."""
     filters = []
+    if gain_db != 0:
+        filters.append(f"volume={gain_db:.2f}dB")
     # Apply transpose (pitch shift) using rubberband filter
     # Formula: pitch_ratio = 2^(semitones/12)
     if transpose != 0:
@@ -167,34 +283,110 @@ def convert_wav_to_mp3(input_file, output_file, tempo=1.0, transpose=0):
             filters.append("atempo=2.0")
             tempo_value /= 2.0
         filters.append(f"atempo={tempo_value}")
+    return filters
+
+
+def encode_audio(input_file, output_file, tempo=1.0, transpose=0, fmt="mp3", gain_db=0.0):
+    """Encode an audio file to one of OUTPUT_FORMATS with optional gain, tempo and pitch effects."""
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    cmd = ["ffmpeg", "-i", input_file]
+    filters = _effect_filters(tempo, transpose, gain_db)
     if filters:
         cmd.extend(["-af", ",".join(filters)])
-    cmd.extend(["-b:a", "192k", output_file])
+    cmd.extend(ENCODER_ARGS[fmt] + [output_file])
     subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
 
-def separate_audio(mp3_file, output_folder, mode="2stems"):
-    os.makedirs(output_folder, exist_ok=True)
-    subprocess.run([
-        "spleeter", "separate", "-p", f"spleeter:{mode}",
-        "-o", output_folder, "-f", "{instrument}.{codec}", mp3_file
-    ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+def convert_wav_to_mp3(input_file, output_file, tempo=1.0, transpose=0, gain_db=0.0):
+    encode_audio(input_file, output_file, tempo, transpose, "mp3", gain_db)
+
+
+def publish_file(input_file, output_file):
+    """Move a finished file to `output_file` with an atomic rename, also across filesystems.
+
+    Across filesystems the file is first copied next to `output_file` under
+    a temporary name and renamed from there, so readers never see a partial file.
+    """
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    try:
+        os.replace(input_file, output_file)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        partial = f"{output_file}.partial"
+        shutil.copyfile(input_file, partial)
+        os.replace(partial, output_file)
+        os.remove(input_file)
+
+
+def publish_wav(input_file, output_file, keep_source=True):
+    """Put a WAV file at `output_file` without re-encoding it.
+
+    The file is hardlinked. If the filesystem can't do that, it is copied,
+    or moved when the source is not needed anymore (`keep_source=False`).
+    """
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    if os.path.lexists(output_file):
+        if os.path.samefile(input_file, output_file):
+            return
+        os.remove(output_file)
+    try:
+        os.link(input_file, output_file)
+    except OSError:
+        if keep_source:
+            shutil.copyfile(input_file, output_file)
+        else:
+            shutil.move(input_file, output_file)
+
+
+def export_audio(input_file, output_file, tempo=1.0, transpose=0, fmt="mp3", keep_source=True, gain_db=0.0):
+    """Write a WAV file in the output format, taking the fastest path that gives the same result."""
+    if fmt == "mp3":
+        convert_wav_to_mp3(input_file, output_file, tempo, transpose, gain_db)
+    elif fmt == "wav" and tempo == 1.0 and transpose == 0 and gain_db == 0:
+        publish_wav(input_file, output_file, keep_source)
+    else:
+        encode_audio(input_file, output_file, tempo, transpose, fmt, gain_db)
+
+
+def separate_audio(mp3_file, output_folder, mode="2stems", quality="standard", backend=DEFAULT_BACKEND):
+    get_backend(backend).separate_to_files(mp3_file, output_folder, mode, quality)
+
 
+def _load_mono(audio_file, start=None, end=None):
+    """Load an audio file (or the excerpt between `start` and `end` seconds) as mono at 44.1 kHz."""
+    if start is None and end is None:
+        return es.MonoLoader(filename=audio_file)()
+    return es.EasyLoader(filename=audio_file, startTime=start or 0, endTime=end or 1e6)()
 
-def detect_key(audio_file):
+
+def detect_key(audio_file, start=None, end=None):
     """Detect the musical key of an audio file using Essentia.
 
+    `start` and `end` (in seconds) restrict the detection to an excerpt.
+
     Returns a tuple of (key, scale, strength) where:
     - key: The detected key (e.g., 'C', 'F#', 'Bb')
     - scale: 'major' or 'minor'
     - strength: Confidence score (0.0-1.0)
     """
-    audio = es.MonoLoader(filename=audio_file)()
     key_extractor = es.KeyExtractor()
-    key, scale, strength = key_extractor(audio)
+    key, scale, strength = key_extractor(_load_mono(audio_file, start, end))
     return key, scale, strength
 
 
+def detect_key_profiles(audio_file, profiles, start=None, end=None):
+    """Detect the key of an audio file with several key profiles.
+
+    The HPCP is computed once and every profile is evaluated on it. Returns
+    a tuple of ({profile: (key, scale, strength)}, consensus (key, scale,
+    strength)).
+    """
+    # MonoLoader and EasyLoader resample to 44.1 kHz
+    results = estimate_keys(signal_hpcp(_load_mono(audio_file, start, end), 44100), profiles)
+    return results, key_consensus(results)
+
+
 def create_empty_mkv_with_audio(mp3_file, output_file):
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     duration_cmd = [
@@ -210,6 +402,45 @@ def create_empty_mkv_with_audio(mp3_file, output_file):
     subprocess.run(ffmpeg_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
 
+def mux_tracks(tracks, output_file, tempo=1.0, transpose=0, fmt="mp3", video=False, gains=None,
+               track_effects=None):
+    """Encode several WAV files as named audio tracks of one Matroska file in a single ffmpeg run.
+
+    `tracks` is a list of (title, wav file); the first track is the default
+    one. Effects are applied to every track unless `track_effects` gives a
+    (tempo, transpose) per track; `gains` optionally gives a gain in dB per
+    track. With `video`, a black video track is added, as in
+    create_empty_mkv_with_audio.
+    """
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    cmd = ["ffmpeg"]
+    for _, wav_file in tracks:
+        cmd.extend(["-i", wav_file])
+    if video:
+        cmd.extend(["-f", "lavfi", "-i", f"color=c=black:s={DEFAULT_VIDEO_RESOLUTION}"])
+    track_effects = track_effects or [(tempo, transpose)] * len(tracks)
+    chains = [
+        ",".join(_effect_filters(track_tempo, track_transpose, gain))
+        for (track_tempo, track_transpose), gain in zip(track_effects, gains or [0.0] * len(tracks))
+    ]
+    if any(chains):
+        cmd.extend(["-filter_complex", ";".join(
+            f"[{i}:a]{chain or 'anull'}[a{i}]" for i, chain in enumerate(chains)
+        )])
+        streams = [f"[a{i}]" for i in range(len(tracks))]
+    else:
+        streams = [f"{i}:a" for i in range(len(tracks))]
+    for stream in streams:
+        cmd.extend(["-map", stream])
+    if video:
+        cmd.extend(["-map", f"{len(tracks)}:v", "-c:v", "libx264", "-tune", "stillimage", "-shortest"])
+    cmd.extend(ENCODER_ARGS[fmt])
+    for i, (title, _) in enumerate(tracks):
+        cmd.extend([f"-metadata:s:a:{i}", f"title={title}", f"-disposition:a:{i}", "default" if i == 0 else "0"])
+    cmd.append(output_file)
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
 def remove_dir(path):
     if os.path.exists(path):
         shutil.rmtree(path)
@@ -223,9 +454,14 @@ def clean(target, output_dir="output"):
         remove_dir(output_dir)
     elif target == "models":
         remove_dir("pretrained_models")
+        remove_dir(os.path.join(DATA_DIR, ONNX_DIR))
+    elif target == "cache":
+        remove_dir(CACHE_DIR)
     elif target == "all":
         remove_dir(output_dir)
         remove_dir("pretrained_models")
+        remove_dir(os.path.join(DATA_DIR, ONNX_DIR))
+        remove_dir(CACHE_DIR)
 
 
 def parse_args():
@@ -259,19 +495,20 @@ def parse_args():
     parser.add_argument(
         "-f", "--file",
         metavar="FILE",
-        help="local audio file to process (mp3, wav, flac, etc.)"
+        help="local audio file to process (mp3, wav, flac, etc.), or - to read any format ffmpeg decodes from stdin"
     )
     parser.add_argument(
         "-o", "--output",
         default="output",
         metavar="DIR",
-        help="output directory (default: output)"
+        help="output directory; results go to a subdirectory per source, e.g. output/song-1a2b3c4d "
+             "(default: output)"
     )
     parser.add_argument(
         "-c", "--clean",
-        choices=["output", "models", "all"],
+        choices=["output", "models", "cache", "all"],
         metavar="TARGET",
-        help="clean up files: output, models, or all"
+        help="clean up files: output, models, cache (partial downloads, decoded audio, model configs), or all"
     )
     parser.add_argument(
         "-t", "--tempo",
@@ -287,11 +524,51 @@ def parse_args():
         metavar="SEMITONES",
         help="transpose pitch by semitones (default: 0, range: -12 to +12, e.g., -5 for 5 semitones down)"
     )
+    parser.add_argument(
+        "--stretch-engine",
+        choices=STRETCH_ENGINES,
+        default="ffmpeg",
+        help="engine for tempo/transpose: ffmpeg (rubberband filter, per file) or numpy "
+             "(built-in phase vocoder, all stems at once). Default: ffmpeg"
+    )
+    parser.add_argument(
+        "--stretch-quality",
+        choices=STRETCH_QUALITIES,
+        default="standard",
+        help="quality of the numpy stretch engine: fast, standard or high (slower). Default: standard"
+    )
     parser.add_argument(
         "-k", "--key",
         action="store_true",
         help="detect and display the musical key of the audio"
     )
+    parser.add_argument(
+        "--fast-key",
+        action="store_true",
+        help="with -k, detect the key from short excerpts spread across the audio "
+             "(falls back to the whole audio when the result is not confident)"
+    )
+    parser.add_argument(
+        "--key-profiles",
+        metavar="LIST",
+        help="with -k, compare comma-separated key profiles (e.g. bgate,edma,temperley or all) "
+             "and use their consensus"
+    )
+    parser.add_argument(
+        "--verify-key",
+        action="store_true",
+        help="with -k and -p, check the derived key after transpose on a short excerpt of the transposed audio"
+    )
+    parser.add_argument(
+        "--key-timeline",
+        action="store_true",
+        help="detect key changes over time and save the key segments to key_timeline.json"
+    )
+    parser.add_argument(
+        "-a", "--analyze",
+        action="store_true",
+        help="analyze key, tempo (BPM and beats) and loudness in one pass and save them to analysis.json"
+    )
     parser.add_argument(
         "-ss", "--start",
         metavar="TIME",
@@ -304,13 +581,122 @@ def parse_args():
     )
     parser.add_argument(
         "-m", "--mode",
-        choices=["2stems", "4stems", "5stems"],
         default="2stems",
         metavar="MODE",
         help="separation mode: 2stems (vocals/accompaniment), "
              "4stems (vocals/drums/bass/other), "
              "5stems (vocals/drums/bass/piano/other). "
-             "Default: 2stems"
+             "Several comma-separated modes (e.g. 2stems,4stems) run the largest model once "
+             "and sum its stems for the others. Default: 2stems"
+    )
+    parser.add_argument(
+        "-q", "--quality",
+        choices=QUALITY_TIERS,
+        default="standard",
+        metavar="TIER",
+        help="separation quality: fast (reduced bandwidth, for previews), "
+             "standard (11 kHz models), high (16 kHz models, slower). Default: standard"
+    )
+    parser.add_argument(
+        "-b", "--backend",
+        choices=sorted(BACKENDS),
+        default=DEFAULT_BACKEND,
+        metavar="NAME",
+        help=f"separation backend: {', '.join(sorted(BACKENDS))} (default: {DEFAULT_BACKEND})"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        metavar="N",
+        help="number of CPU threads for in-process backends such as onnx (default: all cores)"
+    )
+    parser.add_argument(
+        "--stems",
+        metavar="LIST",
+        help="comma-separated stems to output, e.g. vocals,bass; "
+             "no_<stem> gives everything except that stem (e.g. no_vocals). "
+             "The smallest model that can produce them is used (overrides --mode)"
+    )
+    parser.add_argument(
+        "--stem-effects",
+        metavar="LIST",
+        help="comma-separated STEM=EFFECTS limiting the tempo/transpose effects of single stems, "
+             "EFFECTS being all, tempo, transpose or none (e.g. drums=tempo to not pitch-shift drums)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="mp3",
+        help="audio format of the output files: mp3 (192 kbps), wav (no re-encoding without effects), "
+             "flac or opus (default: mp3)"
+    )
+    parser.add_argument(
+        "--container",
+        choices=CONTAINER_FORMATS,
+        help="write the original and all stems as named audio tracks of a single "
+             "mka (audio only) or mkv (with a black video track) file, in one encoding pass, "
+             "instead of separate files"
+    )
+    parser.add_argument(
+        "--normalize",
+        type=float,
+        metavar="LUFS",
+        help="normalize the integrated loudness of the output to LUFS (e.g. -14), "
+             "with one gain for all stems that keeps the balance of the mix"
+    )
+    parser.add_argument(
+        "--normalize-stems",
+        action="store_true",
+        help="with --normalize, bring each stem to the target loudness on its own"
+    )
+    parser.add_argument(
+        "--skip-silence",
+        action="store_true",
+        help="detect silent regions and separate only the audible parts of the audio"
+    )
+    parser.add_argument(
+        "--silence-threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD_DB,
+        metavar="DB",
+        help=f"level in dBFS below which audio counts as silence (default: {DEFAULT_THRESHOLD_DB:g})"
+    )
+    parser.add_argument(
+        "--stdout",
+        metavar="STEMS",
+        help="stream the comma-separated stems to stdout as one audio stream (one group of channels "
+             "per stem, e.g. vocals or vocals,drums) instead of writing files; messages go to stderr"
+    )
+    parser.add_argument(
+        "--stdout-format",
+        choices=STDOUT_FORMATS,
+        default="wav",
+        help="format of the --stdout stream: wav or flac (at most 8 channels). Default: wav"
+    )
+    parser.add_argument(
+        "--workdir",
+        metavar="DIR",
+        help="directory for intermediate files, removed after the job (default: /dev/shm if it has "
+             "room, else next to the output directory); only final outputs are moved to --output"
+    )
+    parser.add_argument(
+        "--keep-wav",
+        action="store_true",
+        help="also keep the separated WAV files in music/wav of the result (e.g. for demix remix)"
+    )
+    parser.add_argument(
+        "--no-pcm-cache",
+        dest="pcm_cache",
+        action="store_false",
+        help="decode the source again instead of using the cache of decoded audio "
+             "(in the demix cache directory, removed by --clean cache)"
+    )
+    parser.add_argument(
+        "--preview",
+        type=float,
+        metavar="SECONDS",
+        help="separate and publish the first SECONDS of the stems first, then replace them "
+             "with the full-length stems once the whole track is separated"
     )
     parser.add_argument(
         "-v", "--version",
@@ -320,25 +706,101 @@ def parse_args():
     return parser.parse_args()
 
 
-def _validate_args(args):
-    """Validate command line arguments. Returns error message or None."""
+def _validate_source(args):
     sources = sum([bool(args.url), bool(args.search), bool(args.file)])
     if sources == 0:
         return "Error: --url, --search, or --file is required when not using --clean"
     if sources > 1:
         return "Error: --url, --search, and --file cannot be used together"
-    if args.file and not os.path.isfile(args.file):
+    # "-" reads from stdin
+    if args.file and args.file != "-" and not os.path.isfile(args.file):
         return f"Error: File not found: {args.file}"
     return None
 
 
-def _setup_directories(output_dir):
+def _validate_key_args(args):
+    if args.verify_key and not args.key:
+        return "Error: --verify-key requires --key"
+    if args.fast_key and not args.key:
+        return "Error: --fast-key requires --key"
+    if args.key_profiles:
+        if not args.key:
+            return "Error: --key-profiles requires --key"
+        if args.fast_key:
+            return "Error: --key-profiles and --fast-key cannot be used together"
+        try:
+            parse_key_profiles(args.key_profiles)
+        except ValueError as e:
+            return f"Error: {e}"
+    return None
+
+
+def _validate_output_args(args):
+    if args.normalize_stems and args.normalize is None:
+        return "Error: --normalize-stems requires --normalize"
+    if args.normalize is not None and not ABSOLUTE_GATE_LUFS < args.normalize <= 0:
+        return f"Error: --normalize must be between {ABSOLUTE_GATE_LUFS:g} and 0 LUFS"
+    if args.preview is not None and args.preview <= 0:
+        return "Error: --preview must be greater than 0 seconds"
+    if args.preview is not None and args.container:
+        return "Error: --preview cannot be used with --container"
+    return None
+
+
+def _validate_stream_args(args):
+    """Reject options that write extra files or process stems one by one together with --stdout."""
+    if not args.stdout:
+        return None
+    for option, used in (("--container", args.container), ("--preview", args.preview is not None),
+                         ("--verify-key", args.verify_key), ("--stem-effects", args.stem_effects),
+                         ("--stretch-engine numpy", args.stretch_engine == "numpy")):
+        if used:
+            return f"Error: --stdout cannot be used with {option}"
+    return None
+
+
+def _validate_stems(args):
+    try:
+        mode, stems = _resolve_stems(args)
+        if args.stem_effects:
+            parse_stem_effects(args.stem_effects, stems)
+        if args.stdout:
+            parse_stdout_stems(args.stdout, stems, args.stdout_format)
+    except ValueError as e:
+        return f"Error: {e}"
+    if not get_backend(args.backend).supports(mode):
+        return f"Error: Backend '{args.backend}' does not support {mode}"
+    return None
+
+
+def _validate_args(args):
+    """Validate command line arguments. Returns error message or None."""
+    for validate in (_validate_source, _validate_key_args, _validate_output_args, _validate_stream_args,
+                     _validate_stems):
+        error = validate(args)
+        if error:
+            return error
+    return None
+
+
+def _resolve_stems(args):
+    """Return the separation mode and the stems to output."""
+    modes = get_backend(args.backend).modes
+    if args.stems:
+        stems = parse_stems(args.stems, modes)
+    else:
+        stems = mode_stems(parse_modes(args.mode, modes), modes)
+    return select_mode(stems, modes), stems
+
+
+def _setup_directories(output_dir, fmt="mp3"):
     """Create and return directory paths."""
     music_dir = os.path.join(output_dir, "music")
     return {
         "music": music_dir,
         "wav": os.path.join(music_dir, "wav"),
-        "mp3": os.path.join(music_dir, "mp3"),
+        # music/wav holds the separation output, so WAV outputs need their own directory
+        "stems": os.path.join(music_dir, "stems" if fmt == "wav" else fmt),
         "video": os.path.join(output_dir, "video"),
     }
 
@@ -356,11 +818,13 @@ def _resolve_search(search_query):
     return url, True
 
 
-def _print_info(source, output_dir, mode, stems, start_time, end_time, start_str, end_str):
+def _print_info(source, output_dir, mode, stems, start_time, end_time, start_str, end_str, quality="standard"):
     """Print processing information."""
     print(f"Processing: {source}")
     print(f"Output directory: {output_dir}")
     print(f"Separation mode: {mode} ({', '.join(stems)})")
+    if quality != "standard":
+        print(f"Quality: {quality}")
     if start_time is not None or end_time is not None:
         cut_info = "Cutting: "
         if start_time is not None:
@@ -371,10 +835,9 @@ def _print_info(source, output_dir, mode, stems, start_time, end_time, start_str
     print()
 
 
-def _convert_source(url, local_file, dirs, start_time, end_time):
-    """Download (if URL) and convert source to WAV and MP3."""
+def _convert_source(url, local_file, dirs, start_time, end_time, with_mix=True, fmt="mp3", pcm_cache=True):
+    """Download (if URL) and convert source to WAV and (optionally) the output format."""
     wav_file = os.path.join(dirs["wav"], "music.wav")
-    mp3_file = os.path.join(dirs["mp3"], "music.mp3")
     cut_msg = " and cutting" if start_time is not None or end_time is not None else ""
 
     if url:
@@ -382,72 +845,452 @@ def _convert_source(url, local_file, dirs, start_time, end_time):
             video_file = download_video(url, dirs["video"])
         with Spinner(f"Converting to WAV{cut_msg}..."):
             os.makedirs(dirs["wav"], exist_ok=True)
-            convert_to_wav(video_file, wav_file, start_time, end_time)
+            hit = decode_source(video_file, wav_file, start_time, end_time, pcm_cache)
     else:
         with Spinner(f"Converting audio file to WAV{cut_msg}..."):
             os.makedirs(dirs["wav"], exist_ok=True)
-            convert_to_wav(local_file, wav_file, start_time, end_time)
-
-    with Spinner("Generating MP3 file..."):
-        os.makedirs(dirs["mp3"], exist_ok=True)
-        convert_wav_to_mp3(wav_file, mp3_file)
-
-    return wav_file, mp3_file
+            hit = decode_source(local_file, wav_file, start_time, end_time, pcm_cache)
+    if hit:
+        print("  Decoded audio taken from the cache")
+
+    if not with_mix:
+        return wav_file, None
+    return wav_file, _export_mix(wav_file, dirs, fmt)
+
+
+def _export_mix(wav_file, dirs, fmt="mp3", gain_db=0.0):
+    """Write the full mix in the output format. Returns its path."""
+    mix_file = os.path.join(dirs["stems"], f"music.{fmt}")
+    with Spinner(f"Generating {fmt.upper()} file..."):
+        os.makedirs(dirs["stems"], exist_ok=True)
+        export_audio(wav_file, mix_file, fmt=fmt, gain_db=gain_db)
+    return mix_file
+
+
+def parse_stdout_stems(value, stems, fmt="wav"):
+    """Parse the comma-separated --stdout stems, which must be among the output `stems` and fit `fmt`."""
+    selected = [stem.strip() for stem in value.split(",") if stem.strip()]
+    if not selected:
+        raise ValueError("--stdout needs at least one stem")
+    for stem in selected:
+        if stem not in stems:
+            raise ValueError(f"Stem not in the output: {stem}. Output stems: {', '.join(stems)}")
+    # FLAC holds up to 8 channels, i.e. 4 stereo stems
+    if fmt == "flac" and len(selected) > 4:
+        raise ValueError("FLAC holds at most 4 stereo stems, use --stdout-format wav")
+    return selected
+
+
+def parse_stem_effects(value, stems):
+    """Parse comma-separated STEM=EFFECTS (e.g. 'drums=tempo,piano=none') for the output `stems`."""
+    stem_effects = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        stem, sep, effects = (part.strip() for part in item.partition("="))
+        if not sep or effects not in STEM_EFFECTS:
+            raise ValueError(f"Invalid stem effects: {item.strip()}. Use STEM=EFFECTS with EFFECTS one of: "
+                             f"{', '.join(STEM_EFFECTS)}")
+        if stem not in stems:
+            raise ValueError(f"Stem not in the output: {stem}. Output stems: {', '.join(stems)}")
+        stem_effects[stem] = effects
+    return stem_effects
+
+
+def _stem_effect_values(tempo, transpose, effects="all"):
+    """Return the (tempo, transpose) a stem gets with the given STEM_EFFECTS setting."""
+    return (
+        tempo if effects in ("all", "tempo") else 1.0,
+        transpose if effects in ("all", "transpose") else 0,
+    )
 
 
-def _convert_stems(tempo, transpose, dirs, stems):
-    """Convert separated stems to MP3 with optional effects."""
+def _describe_effects(tempo, transpose):
+    """Return human-readable descriptions of the tempo and pitch effects."""
     effects = []
     if tempo != 1.0:
         effects.append(f"tempo: {tempo}x")
     if transpose != 0:
         sign = "+" if transpose > 0 else ""
         effects.append(f"transpose: {sign}{transpose} semitones")
+    return effects
 
-    convert_msg = "Converting separated tracks to MP3..."
+
+def _convert_stems(tempo, transpose, dirs, stems, fmt="mp3", gains=None, stem_effects=None, sources=None):
+    """Convert separated stems to the output format with optional effects and gains (dB per stem).
+
+    `stem_effects` maps stems to a STEM_EFFECTS setting; stems that end up
+    without effects are encoded (or, for WAV, linked) as they are. Stems in
+    `sources` were already stretched in process and are encoded from there.
+    """
+    effects = _describe_effects(tempo, transpose)
+    stem_effects = stem_effects or {}
+
+    convert_msg = f"Converting separated tracks to {fmt.upper()}..."
     if effects:
-        convert_msg = f"Converting separated tracks to MP3 ({', '.join(effects)})..."
+        convert_msg = f"Converting separated tracks to {fmt.upper()} ({', '.join(effects)})..."
+        if stem_effects:
+            print(f"  Effects per stem: {', '.join(f'{stem} ({setting})' for stem, setting in stem_effects.items())}")
 
     with Spinner(convert_msg):
         for stem in stems:
-            convert_wav_to_mp3(
-                os.path.join(dirs["wav"], f"{stem}.wav"),
-                os.path.join(dirs["mp3"], f"{stem}.mp3"),
-                tempo,
-                transpose
+            stem_tempo, stem_transpose = _stem_effect_values(tempo, transpose, stem_effects.get(stem, "all"))
+            source = (sources or {}).get(stem)
+            if source:
+                stem_tempo, stem_transpose = 1.0, 0
+            export_audio(
+                source or os.path.join(dirs["wav"], f"{stem}.wav"),
+                os.path.join(dirs["stems"], f"{stem}.{fmt}"),
+                stem_tempo,
+                stem_transpose,
+                fmt,
+                keep_source=False,
+                gain_db=(gains or {}).get(stem, 0.0),
             )
     return effects
 
 
+def _separate_stems(wav_file, dirs, mode, skip_silence=False, silence_threshold=DEFAULT_THRESHOLD_DB,
+                    quality="standard", backend=DEFAULT_BACKEND):
+    """Separate the WAV file into stems, optionally skipping silent regions."""
+    if not skip_silence:
+        with Spinner(f"Separating audio ({mode})..."):
+            separate_audio(wav_file, dirs["wav"], mode, quality, backend)
+        return
+    with Spinner(f"Separating audible regions ({mode})..."):
+        skipped = separate_active_regions(
+            wav_file, dirs["wav"], get_backend(backend).modes[mode],
+            lambda input_file, output_folder: separate_audio(input_file, output_folder, mode, quality, backend),
+            silence_threshold,
+        )
+    if skipped > 0:
+        print(f"  Skipped {skipped:.0%} of the audio as silence")
+
+
+def _build_composites(dirs, mode, stems, backend=DEFAULT_BACKEND):
+    """Build requested stems that the model does not output directly."""
+    modes = get_backend(backend).modes
+    composites = [stem for stem in stems if stem not in modes[mode]]
+    if not composites:
+        return
+    with Spinner(f"Building composite stems ({', '.join(composites)})..."):
+        build_composite_stems(dirs["wav"], composites, mode, modes)
+
+
 def _build_source_description(searched_url, url, search_query, file):
     """Build source description string for display."""
     if searched_url:
         return f"{searched_url} (searched: '{search_query}')"
     if url:
         return url
-    return file
+    return "stdin" if file == "-" else file
+
 
+def _apply_effects_to_original(wav_file, dirs, tempo, transpose, effects, fmt="mp3", gain_db=0.0,
+                               stretched_file=None):
+    """Apply tempo/transpose effects to original music file if needed.
 
-def _apply_effects_to_original(wav_file, dirs, tempo, transpose, effects):
-    """Apply tempo/transpose effects to original music file if needed."""
+    `stretched_file` is the original already stretched in process.
+    """
     if tempo == 1.0 and transpose == 0:
         return
-    modified_mp3 = os.path.join(dirs["music"], "music_modified.mp3")
+    modified_file = os.path.join(dirs["music"], f"music_modified.{fmt}")
     with Spinner(f"Applying effects to original music file ({', '.join(effects)})..."):
-        convert_wav_to_mp3(wav_file, modified_mp3, tempo, transpose)
+        if stretched_file:
+            export_audio(stretched_file, modified_file, fmt=fmt, gain_db=gain_db)
+        else:
+            export_audio(wav_file, modified_file, tempo, transpose, fmt, gain_db=gain_db)
+
+
+def _mux_container(wav_file, dirs, stems, container, tempo, transpose, effects, fmt="mp3",
+                   gains=None, mix_gain=0.0, stem_effects=None, sources=None):
+    """Write the original and the stems as tracks of music/stems.<container>. Returns its path.
+
+    Tracks in `sources` ("original" or a stem) were already stretched in process.
+    """
+    output_file = os.path.join(dirs["music"], f"stems.{container}")
+    tracks = [("original", wav_file)] + [(stem, os.path.join(dirs["wav"], f"{stem}.wav")) for stem in stems]
+    track_gains = [mix_gain] + [(gains or {}).get(stem, 0.0) for stem in stems]
+    track_effects = None
+    if stem_effects or sources:
+        track_effects = [(tempo, transpose)] + [
+            _stem_effect_values(tempo, transpose, (stem_effects or {}).get(stem, "all")) for stem in stems
+        ]
+    if sources:
+        track_effects = [(1.0, 0) if name in sources else values for (name, _), values in zip(tracks, track_effects)]
+        tracks = [(name, sources.get(name, path)) for name, path in tracks]
+    effects_msg = f" ({', '.join(effects)})" if effects else ""
+    with Spinner(f"Writing original and {len(stems)} stems to {os.path.basename(output_file)}{effects_msg}..."):
+        mux_tracks(tracks, output_file, tempo, transpose, fmt, video=container == "mkv", gains=track_gains,
+                   track_effects=track_effects)
+    return output_file
+
+
+def _stretch_tracks(wav_file, dirs, stems, tempo, transpose, stem_effects=None, quality="standard",
+                    with_original=True):
+    """Apply tempo/transpose with the built-in engine, all tracks sharing effects in one pass.
+
+    Returns {track: stretched WAV path}, the original being "original".
+    """
+    tracks = {stem: os.path.join(dirs["wav"], f"{stem}.wav") for stem in stems}
+    if with_original:
+        tracks = {"original": wav_file, **tracks}
+    groups = {}
+    for name in tracks:
+        values = _stem_effect_values(tempo, transpose, (stem_effects or {}).get(name, "all"))
+        if values != (1.0, 0):
+            groups.setdefault(values, []).append(name)
+    stretched = {}
+    stretch_dir = os.path.join(dirs["wav"], "stretched")
+    for (group_tempo, group_transpose), names in groups.items():
+        outputs = [os.path.join(stretch_dir, f"{name}.wav") for name in names]
+        effects = ", ".join(_describe_effects(group_tempo, group_transpose))
+        with Spinner(f"Stretching {len(names)} tracks in process ({effects}, {quality} quality)..."):
+            stretch_files([tracks[name] for name in names], outputs, group_tempo, group_transpose, quality)
+        stretched.update(zip(names, outputs))
+    return stretched
+
+
+def _stream_stems(dirs, stems, stream, fmt="wav", tempo=1.0, transpose=0, gains=None):
+    """Write the stems as one WAV or FLAC stream to `stream`, one group of channels per stem.
+
+    WAV without effects is written directly; FLAC and effects go through
+    an ffmpeg pipe, so nothing is written to disk either way.
+    """
+    stem_files = [os.path.join(dirs["wav"], f"{stem}.wav") for stem in stems]
+    linear_gains = [10 ** ((gains or {}).get(stem, 0.0) / 20) for stem in stems]
+    filters = _effect_filters(tempo, transpose)
+    try:
+        with Spinner(f"Streaming {', '.join(stems)} to stdout as {fmt.upper()}..."):
+            if fmt == "wav" and not filters:
+                write_interleaved_wav(stem_files, stream, linear_gains)
+                stream.flush()
+                return
+            cmd = ["ffmpeg", "-v", "error", "-f", "wav", "-i", "-"]
+            if filters:
+                cmd.extend(["-af", ",".join(filters)])
+            cmd.extend(ENCODER_ARGS[fmt] + ["-f", fmt, "-"])
+            stream.flush()
+            process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=stream, stderr=subprocess.DEVNULL)
+            try:
+                write_interleaved_wav(stem_files, process.stdin, linear_gains)
+            finally:
+                process.stdin.close()
+                process.wait()
+    except BrokenPipeError:
+        print("Error: stdout was closed before all audio was written")
+
+
+def _publish_preview(stems_dir, job_output):
+    """Publish the preview stems of `stems_dir` as `job_output`/preview with one directory rename. Returns its path.
+
+    The previous result in `job_output` is left alone until the full-length
+    result replaces it, preview included.
+    """
+    os.makedirs(job_output, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".preview.", dir=job_output)
+    try:
+        _publish_staged(stems_dir, staging)
+        target = os.path.join(job_output, "preview")
+        _replace_dir(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return target
+
+
+def _staging_dir(dirs):
+    """Return the directory outputs are written to before they replace the published ones."""
+    return os.path.join(dirs["music"], ".staging")
 
 
-def _create_accompaniment_video(dirs, mode):
-    """Create video for accompaniment track in 2stems mode."""
-    if mode != "2stems":
+def _publish_staged(staging_dir, target_dir):
+    """Move every file of `staging_dir` into `target_dir`, replacing each existing file atomically."""
+    for name in sorted(os.listdir(staging_dir)):
+        publish_file(os.path.join(staging_dir, name), os.path.join(target_dir, name))
+    os.rmdir(staging_dir)
+
+
+def _workdir_size(args, start_time, end_time):
+    """Estimate the bytes of intermediate files a job writes to its scratch directory.
+
+    Every intermediate is a WAV of the cut's length: the decoded source, the
+    stems of the separation mode, the output stems (twice, when they are
+    stretched) and the modified original.
+    """
+    end = end_time
+    if end is None:
+        local = args.file and args.file != "-"
+        end = (probe_duration(args.file) if local else None) or UNKNOWN_SOURCE_SECONDS
+    mode, stems = _resolve_stems(args)
+    tracks = len(get_backend(args.backend).modes[mode]) + 2 * len(stems) + 2
+    return int(max(end - (start_time or 0), 0) * WAV_BYTES_PER_SECOND * tracks)
+
+
+def _create_workdir(workdir, output_dir, size=0):
+    """Create the scratch directory of a job and return its path.
+
+    It is created in `workdir`, else on tmpfs if it has `size` bytes free,
+    else next to `output_dir` (so that publishing is a rename on the same
+    filesystem).
+    """
+    if workdir is None:
+        workdir = tmpfs_dir(size) or os.path.dirname(os.path.abspath(output_dir))
+    os.makedirs(workdir, exist_ok=True)
+    return tempfile.mkdtemp(prefix="demix-", dir=workdir)
+
+
+# renameat2() flag and "current directory" file descriptor, from <linux/fs.h> and <fcntl.h>
+RENAME_EXCHANGE = 2
+AT_FDCWD = -100
+
+
+def _exchange_paths(first, second):
+    """Swap two paths atomically with renameat2(RENAME_EXCHANGE).
+
+    Returns False where that is not available (not Linux, old C library or a
+    filesystem without support).
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return False
+    renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    if renameat2(AT_FDCWD, os.fsencode(first), AT_FDCWD, os.fsencode(second), RENAME_EXCHANGE) == 0:
+        return True
+    error = ctypes.get_errno()
+    if error in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+        return False
+    raise OSError(error, os.strerror(error), second)
+
+
+def _replace_dir(source, target):
+    """Rename directory `source` to `target`, replacing an existing `target`.
+
+    An existing `target` is swapped with `source` in one atomic exchange
+    rename and then removed, so readers always see a complete result. Where
+    exchange renames are not supported, `target` is renamed out of the way
+    first, and it is missing for the moment between the two renames.
+    """
+    old = f"{source}.old"
+    while True:
+        try:
+            os.rename(source, target)
+            break
+        except OSError as e:
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+        try:
+            if _exchange_paths(source, target):
+                # `source` now holds the previous result
+                old = source
+                break
+            os.rename(target, old)
+        except FileNotFoundError:
+            # Another job moved it away in the meantime, try again
+            pass
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _publish_job(work_dir, output_root, slug, keep_wav=False):
+    """Publish the outputs of a job as `output_root`/`slug` with one directory rename. Returns its path.
+
+    The outputs are first moved to a staging directory inside `output_root`,
+    which is on the same filesystem as the target, so that the final rename is atomic.
+    """
+    os.makedirs(output_root, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{slug}.", dir=output_root)
+    try:
+        _publish_outputs(work_dir, staging, keep_wav)
+        target = os.path.join(output_root, slug)
+        _replace_dir(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return target
+
+
+def _publish_outputs(work_dir, output_dir, keep_wav=False):
+    """Move the outputs of a job from `work_dir` to `output_dir`, keeping their relative paths.
+
+    The separation WAV files in music/wav are intermediates and stay behind
+    unless `keep_wav` is set. Returns the number of published files.
+    """
+    wav_dir = os.path.join(work_dir, "music", "wav")
+    published = 0
+    for root, subdirs, files in os.walk(work_dir):
+        subdirs.sort()
+        if not keep_wav and os.path.commonpath([root, wav_dir]) == wav_dir:
+            continue
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            publish_file(path, os.path.join(output_dir, os.path.relpath(path, work_dir)))
+            published += 1
+    return published
+
+
+def _preview(wav_file, dirs, job_output, mode, stems, seconds, tempo, transpose, fmt="mp3", stem_effects=None,
+             quality="standard", backend=DEFAULT_BACKEND, stretch_quality=None):
+    """Separate the first `seconds` of the track and publish the stems to `job_output`/preview right away.
+
+    `stretch_quality` selects the numpy stretch engine (None for ffmpeg).
+    Returns False without a preview if the track is not longer than `seconds`.
+    """
+    frames, rate, _ = wav_info(wav_file)
+    preview_frames = int(seconds * rate)
+    if preview_frames >= frames:
+        return False
+    preview_dirs = dict(dirs, wav=os.path.join(dirs["wav"], "preview"), stems=_staging_dir(dirs))
+    preview_file = os.path.join(preview_dirs["wav"], "music.wav")
+    samples, _ = read_wav(wav_file, frames=preview_frames)
+    write_wav(preview_file, samples, rate)
+    with Spinner(f"Separating a {seconds:g} s preview ({mode})..."):
+        separate_audio(preview_file, preview_dirs["wav"], mode, quality, backend)
+    _build_composites(preview_dirs, mode, stems, backend)
+    sources = None
+    if stretch_quality:
+        sources = _stretch_tracks(preview_file, preview_dirs, stems, tempo, transpose, stem_effects,
+                                  stretch_quality, with_original=False)
+    _convert_stems(tempo, transpose, preview_dirs, stems, fmt, stem_effects=stem_effects, sources=sources)
+    preview_dir = _publish_preview(preview_dirs["stems"], job_output)
+    shutil.rmtree(preview_dirs["wav"], ignore_errors=True)
+    print(f"  Preview of {seconds:g} s ready in {preview_dir}/, separating the full track...")
+    return True
+
+
+def _normalize(wav_file, dirs, stems, target_lufs, per_stem=False):
+    """Measure the stems and the mix and return ({stem: gain dB}, mix gain dB) for `target_lufs`."""
+    stem_files = {stem: os.path.join(dirs["wav"], f"{stem}.wav") for stem in stems}
+    with Spinner(f"Measuring loudness of {len(stems)} stems..."):
+        gains, mix_gain = normalization_gains(stem_files, wav_file, target_lufs, per_stem)
+    if per_stem:
+        print(f"  Gains to {target_lufs:g} LUFS: {', '.join(f'{stem} {gain:+.1f} dB' for stem, gain in gains.items())}")
+    else:
+        print(f"  Gain to {target_lufs:g} LUFS: {mix_gain:+.1f} dB (all stems)")
+    return gains, mix_gain
+
+
+def _create_accompaniment_video(dirs, stems, fmt="mp3"):
+    """Create video for accompaniment track if it is among the output stems."""
+    if "accompaniment" not in stems:
         return
     with Spinner("Creating video for accompaniment track..."):
         create_empty_mkv_with_audio(
-            os.path.join(dirs["mp3"], "accompaniment.mp3"),
+            os.path.join(dirs["stems"], f"accompaniment.{fmt}"),
             os.path.join(dirs["video"], "accompaniment.mkv"),
         )
 
 
+def _write_manifest(output_dir, manifest):
+    """Record how the output was produced in demix.json inside the output directory."""
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "demix.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+
+
 def _print_first_run_notice():
     """Print notice about model download on first run."""
     if not os.path.exists("pretrained_models"):
@@ -456,35 +1299,389 @@ def _print_first_run_notice():
         print("  Subsequent operations will be faster.\n")
 
 
-def _detect_key_after_transpose(dirs, transpose):
-    """Detect and display key after transpose if pitch was changed."""
+def _display_key_after_transpose(detected, transpose, modified_file, wav_file, tempo=1.0, verify=False):
+    """Display the key after transpose, derived from the detected key and the semitone shift.
+
+    With `verify`, the key is also detected on an excerpt of the transposed
+    audio in `modified_file` (its first audio track).
+    """
     if transpose == 0:
         return
-    modified_mp3 = os.path.join(dirs["music"], "music_modified.mp3")
-    if os.path.exists(modified_mp3):
-        _detect_and_display_key(modified_mp3, label="after transpose")
+    key, scale, strength = detected
+    key = transpose_key(key, transpose)
+    if verify and os.path.exists(modified_file):
+        frames, rate, _ = wav_info(wav_file)
+        start, end = key_excerpt(frames / rate / tempo)
+        with Spinner("Verifying key after transpose on an excerpt..."):
+            found = detect_key(modified_file, start, end)
+        if found[:2] != (key, scale):
+            print(f"\033[33mℹ\033[0m Excerpt analysis after transpose found {found[0]} {found[1]} "
+                  f"(confidence: {int(found[2] * 100)}%)")
+    _display_key(key, scale, strength, label="after transpose")
+
+
+def _save_sidecar(name, data, dirs, output_dirs=None):
+    """Write a JSON sidecar next to the stems and print where it is published.
+
+    `output_dirs` are the directories of the published result (None when
+    nothing is published, e.g. with --stdout).
+    """
+    os.makedirs(dirs["stems"], exist_ok=True)
+    write_sidecar(os.path.join(dirs["stems"], name), data)
+    if output_dirs:
+        print(f"  Saved: {os.path.join(output_dirs['stems'], name)}")
+    print()
+
+
+def _analyze(wav_file, dirs, output_dirs=None):
+    """Analyze the audio, print a summary and save analysis.json next to the stems."""
+    with Spinner("Analyzing key, tempo and loudness..."):
+        analysis = analyze_audio(wav_file)
+    loudness = analysis["loudness"]
+    print(f"\033[34m♪\033[0m Tempo: {analysis['tempo']['bpm']:.1f} BPM, "
+          f"loudness: {loudness['integrated_lufs']:.1f} LUFS (peak {loudness['peak_dbfs']:.1f} dBFS)")
+    _save_sidecar("analysis.json", analysis, dirs, output_dirs)
+    return analysis
+
+
+def _key_timeline(wav_file, dirs, output_dirs=None):
+    """Detect and display the key segments and save them to key_timeline.json next to the stems."""
+    with Spinner("Detecting key changes..."):
+        segments = key_timeline(wav_file)
+    print("\033[34m♪\033[0m Key timeline:")
+    for segment in segments:
+        print(f"  {format_time(segment['start'])} - {format_time(segment['end'])}  "
+              f"{segment['key']} {segment['scale']} (confidence: {int(segment['strength'] * 100)}%)")
+    _save_sidecar("key_timeline.json", segments, dirs, output_dirs)
+    return segments
+
+
+def _detect_and_display_key_profiles(audio_file, profiles):
+    """Detect and display the key with several profiles and return their consensus."""
+    with Spinner(f"Detecting musical key with {len(profiles)} profiles..."):
+        results, consensus = detect_key_profiles(audio_file, profiles)
+    print("\033[34m♪\033[0m Key by profile:")
+    for profile, (key, scale, strength) in results.items():
+        print(f"  {profile:<14} {key} {scale} ({int(strength * 100)}%)")
+    _display_key(*consensus, label="consensus")
+    return consensus
+
+
+def _display_key(key, scale, strength, label=None):
+    confidence_pct = int(strength * 100)
+    label_suffix = f" ({label})" if label else ""
+    print(f"\033[34m♪\033[0m Detected key{label_suffix}: {key} {scale} (confidence: {confidence_pct}%)\n")
+
 
+def _detect_and_display_key(audio_file, label=None, fast=False):
+    """Detect and display the musical key of the audio file.
 
-def _detect_and_display_key(audio_file, label=None):
-    """Detect and display the musical key of the audio file."""
+    `fast` samples excerpts of a WAV file instead of analyzing all of it.
+    """
     spinner_msg = "Detecting musical key..."
     if label:
         spinner_msg = f"Detecting musical key ({label})..."
     with Spinner(spinner_msg):
-        key, scale, strength = detect_key(audio_file)
-    confidence_pct = int(strength * 100)
-    label_suffix = f" ({label})" if label else ""
-    print(f"\033[34m♪\033[0m Detected key{label_suffix}: {key} {scale} (confidence: {confidence_pct}%)\n")
+        key, scale, strength = fast_key(audio_file) if fast else detect_key(audio_file)
+    _display_key(key, scale, strength, label)
     return key, scale, strength
 
 
+def export_onnx_main(argv):
+    """Export pretrained Spleeter models to ONNX for use with --backend onnx."""
+    parser = argparse.ArgumentParser(
+        prog="demix export-onnx",
+        description="Export the pretrained Spleeter models to ONNX for use with --backend onnx. "
+                    "Requires tensorflow, spleeter and tf2onnx."
+    )
+    parser.add_argument(
+        "-m", "--mode",
+        nargs="+",
+        choices=list(STEM_MODES),
+        default=list(STEM_MODES),
+        metavar="MODE",
+        help="separation modes to export (default: all)"
+    )
+    parser.add_argument(
+        "-q", "--quality",
+        choices=QUALITY_TIERS,
+        default="standard",
+        metavar="TIER",
+        help="quality tier of the models to export (default: standard)"
+    )
+    args = parser.parse_args(argv)
+    for mode in args.mode:
+        with Spinner(f"Exporting {model_name(mode, args.quality)} model to ONNX..."):
+            path = export_model(mode, args.quality)
+        print(f"  Saved: {path}")
+
+
+def _positive_int(value):
+    """argparse type for counts of at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return number
+
+
+def _scan_parser():
+    parser = argparse.ArgumentParser(
+        prog="demix scan",
+        description="Analyze key, BPM and loudness of all audio files in a directory (no separation). "
+                    "Results are kept in an index, so re-scans only analyze new or changed files."
+    )
+    parser.add_argument("directory", nargs="?", help="directory to scan recursively")
+    parser.add_argument(
+        "-j", "--jobs",
+        type=_positive_int,
+        metavar="N",
+        help="number of worker processes (default: all cores)"
+    )
+    parser.add_argument(
+        "--index",
+        default=None,
+        metavar="PATH",
+        help="SQLite index file (default: library.sqlite in the demix data directory)"
+    )
+    parser.add_argument(
+        "--export",
+        metavar="FILE",
+        help="export the index to a CSV or JSON file"
+    )
+    parser.add_argument(
+        "--format",
+        choices=EXPORT_FORMATS,
+        help="export format (default: from the --export file extension)"
+    )
+    return parser
+
+
+def _validate_scan_args(args):
+    """Validate the scan arguments. Returns True if valid."""
+    if not args.directory and not args.export:
+        print("Error: a directory to scan or --export is required")
+        return False
+    if args.directory and not os.path.isdir(args.directory):
+        print(f"Error: Directory not found: {args.directory}")
+        return False
+    return not args.directory or check_ffmpeg()
+
+
+def _scan_directory(directory, connection, jobs):
+    """Scan `directory` into the index, printing a line per analyzed file."""
+    def report(done, total, row):
+        if row["error"]:
+            result = f"\033[31m✗\033[0m {row['error']}"
+        else:
+            result = f"{row['key']} {row['scale']}, {row['bpm']:.1f} BPM"
+        print(f"[{done}/{total}] {os.path.relpath(row['path'], directory)}: {result}")
+
+    analyzed = scan_library(directory, connection, jobs, report)
+    print(f"\033[32m✓\033[0m Analyzed {analyzed} new or changed file(s)")
+
+
+def scan_main(argv):
+    """Analyze key, BPM and loudness of a music library into an SQLite index."""
+    args = _scan_parser().parse_args(argv)
+    if not _validate_scan_args(args):
+        return
+
+    connection = open_index(args.index or default_index_path())
+    try:
+        if args.directory:
+            _scan_directory(args.directory, connection, args.jobs)
+        if args.export:
+            try:
+                count = export_index(connection, args.export, args.format)
+            except ValueError as e:
+                print(f"Error: {e}")
+                return
+            print(f"  Exported {count} track(s) to {args.export}")
+    finally:
+        connection.close()
+
+
+def remix_main(argv):
+    """Mix separated stems with per-stem gains and mutes, without separating again."""
+    parser = argparse.ArgumentParser(
+        prog="demix remix",
+        description="Build a custom mix from the stems of an earlier run, e.g. drums 6 dB down "
+                    "and vocals muted. The stems are mixed block by block without separating again."
+    )
+    parser.add_argument("output", help="output file; the format comes from the extension (mp3, wav, flac, opus)")
+    parser.add_argument(
+        "-d", "--dir",
+        required=True,
+        metavar="DIR",
+        help="directory with the separated stem WAV files, kept by a run with --keep-wav "
+             "(e.g. output/song-1a2b3c4d/music/wav)"
+    )
+    parser.add_argument(
+        "-g", "--gain",
+        action="append",
+        default=[],
+        metavar="STEM=DB",
+        help="gain of a stem in dB, e.g. drums=-6 (can be repeated)"
+    )
+    parser.add_argument(
+        "-m", "--mute",
+        action="append",
+        default=[],
+        metavar="STEM",
+        help="leave a stem out of the mix (can be repeated)"
+    )
+    parser.add_argument(
+        "--only",
+        metavar="STEMS",
+        help="comma-separated stems to mix, all others are muted (e.g. bass,drums)"
+    )
+    parser.add_argument(
+        "--clip",
+        choices=CLIP_MODES,
+        default="normalize",
+        help="clipping protection: normalize lowers the whole mix to -0.1 dBFS peak if it would clip, "
+             "soft compresses only the peaks, none clips hard (default: normalize)"
+    )
+    parser.add_argument("-t", "--tempo", type=float, default=1.0, metavar="FACTOR", help="tempo factor (default: 1.0)")
+    parser.add_argument("-p", "--transpose", type=int, default=0, metavar="SEMITONES",
+                        help="transpose pitch by semitones (default: 0)")
+    args = parser.parse_args(argv)
+
+    fmt = os.path.splitext(args.output)[1].lstrip(".").lower()
+    if fmt not in OUTPUT_FORMATS:
+        print(f"Error: Unsupported output format: {fmt or args.output}. Use one of: {', '.join(OUTPUT_FORMATS)}")
+        return
+    try:
+        stem_files = find_stems(args.dir)
+        gains_db = dict(parse_gain(spec) for spec in args.gain)
+        only = [s.strip() for s in args.only.split(",") if s.strip()] if args.only else None
+        gains = mix_gains(stem_files, gains_db, args.mute, only)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    needs_encoding = fmt != "wav" or args.tempo != 1.0 or args.transpose != 0
+    if needs_encoding and not check_ffmpeg():
+        return
+
+    mixed = [stem for stem, gain in gains.items() if gain > 0]
+    wav_file = f"{os.path.splitext(args.output)[0]}.remix.wav" if needs_encoding else args.output
+    try:
+        with Spinner(f"Mixing {', '.join(mixed) or 'stems'}..."):
+            peak = remix(stem_files, wav_file, gains, args.clip)
+        if needs_encoding:
+            with Spinner(f"Encoding {args.output}..."):
+                export_audio(wav_file, os.path.abspath(args.output), args.tempo, args.transpose, fmt)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    finally:
+        if needs_encoding and os.path.exists(wav_file):
+            os.remove(wav_file)
+    if peak > 1.0:
+        result = "clipped" if args.clip == "none" else f"protected with {args.clip}"
+        print(f"  Mix peaked at {20 * math.log10(peak):+.1f} dBFS, {result}")
+    print(f"\033[32m✓\033[0m Saved {args.output}")
+
+
+def stream_main(argv):
+    """Separate PCM audio from stdin or a FIFO as it plays, with a fixed latency."""
+    parser = argparse.ArgumentParser(
+        prog="demix stream",
+        description="Separate live audio: reads 16-bit little-endian stereo PCM at 44.1 kHz from stdin "
+                    "or a FIFO and writes each stem as PCM of the same format to DIR/<stem>.pcm "
+                    "(existing FIFOs there are written to), a fixed latency behind the input."
+    )
+    parser.add_argument("-i", "--input", default="-", metavar="PATH",
+                        help="PCM input, a file or a FIFO (default: - for stdin)")
+    parser.add_argument("-d", "--dir", default=os.path.join("output", "stream"), metavar="DIR",
+                        help="directory for the stem streams (default: output/stream)")
+    parser.add_argument("-m", "--mode", default="2stems", help="separation mode (default: 2stems)")
+    parser.add_argument("-q", "--quality", choices=QUALITY_TIERS, default="fast", metavar="TIER",
+                        help="separation quality (default: fast)")
+    parser.add_argument("-b", "--backend", choices=sorted(BACKENDS), default="onnx", metavar="NAME",
+                        help="in-process separation backend (default: onnx)")
+    parser.add_argument("--threads", type=int, metavar="N", help="number of CPU threads for the backend")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, metavar="SECONDS",
+                        help=f"delay of the stems behind the input; half of it is the block size, half the "
+                             f"lookahead (default: {DEFAULT_LATENCY:g})")
+    parser.add_argument("--context", type=float, default=DEFAULT_CONTEXT, metavar="SECONDS",
+                        help=f"past audio separated together with each block (default: {DEFAULT_CONTEXT:g})")
+    args = parser.parse_args(argv)
+
+    if args.latency <= 0:
+        print("Error: --latency must be greater than 0 seconds")
+        return
+    if args.context < 0:
+        print("Error: --context cannot be negative")
+        return
+    backend = get_backend(args.backend)
+    if not backend.supports(args.mode):
+        print(f"Error: Backend '{args.backend}' does not support {args.mode}")
+        return
+    backend.configure(threads=args.threads)
+    stems = backend.modes[args.mode]
+
+    def warn(report):
+        print(f"  Warning: block {report.blocks} took {report.worst:.2f}x its duration, "
+              f"the stems fall behind real time")
+
+    os.makedirs(args.dir, exist_ok=True)
+    print(f"Streaming {args.mode} ({', '.join(stems)}) to {args.dir}/ with {args.latency:g} s latency...")
+    outputs = {}
+    try:
+        for stem in stems:
+            outputs[stem] = open(os.path.join(args.dir, f"{stem}.pcm"), "wb")
+        with (sys.stdin.buffer if args.input == "-" else open(args.input, "rb")) as stream:
+            report = stream_separate(
+                stream, outputs, lambda samples: backend.separate(samples, args.mode, args.quality), stems,
+                latency=args.latency, context=args.context, on_late=warn,
+            )
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return
+    finally:
+        for output in outputs.values():
+            output.close()
+    result = "kept up with real time"
+    if not report.keeps_up:
+        result = f"fell behind in {report.late} of {report.blocks} blocks (worst {report.worst:.2f}x)"
+    print(f"  Separated {report.audio_seconds:.1f} s at {report.load:.2f}x real-time load, {result}")
+    print(f"\033[32m✓\033[0m Stems in {args.dir}/")
+
+
+COMMANDS = {
+    "export-onnx": export_onnx_main,
+    "scan": scan_main,
+    "remix": remix_main,
+    "stream": stream_main,
+}
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
     args = parse_args()
 
     if args.clean:
         clean(args.clean, args.output)
         return
 
+    if args.stdout:
+        # stdout carries the audio, so messages go to stderr
+        audio_out = sys.stdout.buffer
+        with contextlib.redirect_stdout(sys.stderr):
+            _run(args, audio_out)
+        return
+    _run(args)
+
+
+def _run(args, audio_out=None):
+    """Check the arguments and run the job in a scratch directory that is removed afterwards."""
     if not check_ffmpeg():
         return
 
@@ -510,33 +1707,162 @@ def main():
         print(f"Error: {e}")
         return
 
-    dirs = _setup_directories(args.output)
-    stems = STEM_MODES[args.mode]
+    size = _workdir_size(args, start_time, end_time) if args.workdir is None else 0
+    work_dir = _create_workdir(args.workdir, args.output, size)
+    try:
+        _run_job(args, url, searched_url, start_time, end_time, work_dir, audio_out)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _detect_source_key(args, wav_file, analysis=None):
+    """Detect and display the key of the source as --key, --key-profiles and --fast-key ask."""
+    if args.key_profiles:
+        return _detect_and_display_key_profiles(wav_file, parse_key_profiles(args.key_profiles))
+    if analysis:
+        # The analysis already estimated the key, no need to decode again
+        detected = (analysis["key"]["key"], analysis["key"]["scale"], analysis["key"]["strength"])
+        _display_key(*detected)
+        return detected
+    return _detect_and_display_key(wav_file, fast=args.fast_key)
+
+
+def _write_outputs(args, wav_file, dirs, stems, stem_effects, gains, mix_gain):
+    """Apply the effects and encode the stems and the modified original. Returns the modified original's path."""
+    # Verifying the key after transpose still needs the modified original
+    with_original = bool(args.container) or not args.stems or args.verify_key
+    stretched = {}
+    if args.stretch_engine == "numpy":
+        stretched = _stretch_tracks(
+            wav_file, dirs, stems, args.tempo, args.transpose, stem_effects, args.stretch_quality, with_original
+        )
+
+    if args.container:
+        effects = _describe_effects(args.tempo, args.transpose)
+        # The first track of the container is the modified original
+        modified_file = _mux_container(
+            wav_file, dirs, stems, args.container, args.tempo, args.transpose, effects, args.format,
+            gains, mix_gain, stem_effects, stretched,
+        )
+    else:
+        effects = _convert_stems(
+            args.tempo, args.transpose, dirs, stems, args.format, gains, stem_effects, stretched
+        )
+        modified_file = os.path.join(dirs["music"], f"music_modified.{args.format}")
+        if with_original:
+            _apply_effects_to_original(
+                wav_file, dirs, args.tempo, args.transpose, effects, args.format, mix_gain,
+                stretched.get("original"),
+            )
+
+    if stretched:
+        shutil.rmtree(os.path.join(dirs["wav"], "stretched"), ignore_errors=True)
+    return modified_file
+
+
+def _finish_job(args, work_dir, slug, manifest, previewed=False):
+    """Write the manifest and publish the outputs of `work_dir` as the job's result directory."""
+    _write_manifest(work_dir, manifest)
+    job_output = _publish_job(work_dir, args.output, slug, args.keep_wav)
+    if previewed:
+        stems_dir = _setup_directories(job_output, args.format)["stems"]
+        print(f"  Preview replaced with the full-length stems in {stems_dir}/")
+    print(f"\n\033[32m✓\033[0m Done! Check the '{job_output}/' directory for results.")
+    print(f"  Separated stems: {', '.join(manifest['stems'])}")
+
+
+def _output_settings(args, mode, stems):
+    """Return the options that change the published outputs of a job."""
+    numpy_engine = args.stretch_engine == "numpy"
+    return {
+        "mode": mode,
+        "quality": args.quality,
+        "backend": args.backend,
+        "model": model_name(mode, args.quality),
+        "stems": stems,
+        "format": args.format,
+        "container": args.container,
+        "tempo": args.tempo,
+        "transpose": args.transpose,
+        "stem_effects": parse_stem_effects(args.stem_effects, stems) if args.stem_effects else None,
+        "stretch_engine": args.stretch_engine,
+        "stretch_quality": args.stretch_quality if numpy_engine else None,
+        "normalize": args.normalize,
+        "normalize_stems": args.normalize_stems,
+        "skip_silence": args.skip_silence,
+        "silence_threshold": args.silence_threshold if args.skip_silence else None,
+        "analyze": args.analyze,
+        "key_timeline": args.key_timeline,
+        "keep_wav": args.keep_wav,
+    }
+
+
+def _run_job(args, url, searched_url, start_time, end_time, work_dir, audio_out=None):
+    """Separate in `work_dir`, then publish the outputs to --output or stream the --stdout stems to `audio_out`."""
+    dirs = _setup_directories(work_dir, args.format)
+    mode, stems = _resolve_stems(args)
+    settings = _output_settings(args, mode, stems)
+    # Each job gets its own result directory, so jobs sharing --output don't clobber each other
+    slug = job_slug(url, args.file, start_time, end_time, settings)
+    job_output = os.path.join(args.output, slug)
+    output_dirs = _setup_directories(job_output, args.format)
     source = _build_source_description(searched_url, url, args.search, args.file)
 
-    _print_info(source, args.output, args.mode, stems, start_time, end_time, args.start, args.end)
-    remove_dir(args.output)
+    destination = "stdout" if audio_out is not None else job_output
+    _print_info(source, destination, mode, stems, start_time, end_time, args.start, args.end, args.quality)
+    print(f"Working directory: {work_dir}")
 
-    wav_file, _ = _convert_source(url, args.file, dirs, start_time, end_time)
+    # With an explicit stem selection, a container or stdout the full mix is not a separate output
+    with_mix = not args.stems and not args.container and audio_out is None
+    # A normalized mix is written once its gain is known, and a preview comes before the mix
+    late_mix = args.normalize is not None or args.preview is not None
+    wav_file, _ = _convert_source(
+        url, args.file, dirs, start_time, end_time, with_mix and not late_mix, args.format, args.pcm_cache
+    )
 
-    if args.key:
-        _detect_and_display_key(wav_file)
+    # Sidecars are published with the outputs, nothing is published with --stdout
+    published_dirs = output_dirs if audio_out is None else None
+    analysis = _analyze(wav_file, dirs, published_dirs) if args.analyze else None
+    detected = _detect_source_key(args, wav_file, analysis) if args.key else None
+    if args.key_timeline:
+        _key_timeline(wav_file, dirs, published_dirs)
 
     _print_first_run_notice()
+    get_backend(args.backend).configure(threads=args.threads)
 
-    with Spinner(f"Separating audio ({args.mode})..."):
-        separate_audio(wav_file, dirs["wav"], args.mode)
+    stem_effects = settings["stem_effects"]
+    # The full-length result replaces the preview when it is published
+    previewed = args.preview is not None and _preview(
+        wav_file, dirs, job_output, mode, stems, args.preview, args.tempo, args.transpose, args.format,
+        stem_effects, args.quality, args.backend, args.stretch_quality if args.stretch_engine == "numpy" else None,
+    )
 
-    effects = _convert_stems(args.tempo, args.transpose, dirs, stems)
-    _apply_effects_to_original(wav_file, dirs, args.tempo, args.transpose, effects)
+    _separate_stems(wav_file, dirs, mode, args.skip_silence, args.silence_threshold, args.quality, args.backend)
+    _build_composites(dirs, mode, stems, args.backend)
 
-    if args.key:
-        _detect_key_after_transpose(dirs, args.transpose)
+    gains, mix_gain = None, 0.0
+    if args.normalize is not None:
+        gains, mix_gain = _normalize(wav_file, dirs, stems, args.normalize, args.normalize_stems)
+    if with_mix and late_mix:
+        _export_mix(wav_file, dirs, args.format, mix_gain)
 
-    _create_accompaniment_video(dirs, args.mode)
+    if audio_out is not None:
+        stdout_stems = parse_stdout_stems(args.stdout, stems, args.stdout_format)
+        _stream_stems(dirs, stdout_stems, audio_out, args.stdout_format, args.tempo, args.transpose, gains)
+        if args.key:
+            _display_key_after_transpose(detected, args.transpose, None, wav_file, args.tempo)
+        return
 
-    print(f"\n\033[32m✓\033[0m Done! Check the '{args.output}/' directory for results.")
-    print(f"  Separated stems: {', '.join(stems)}")
+    modified_file = _write_outputs(args, wav_file, dirs, stems, stem_effects, gains, mix_gain)
+    if args.key:
+        _display_key_after_transpose(
+            detected, args.transpose, modified_file, wav_file, args.tempo, args.verify_key
+        )
+    if not args.container:
+        _create_accompaniment_video(dirs, stems, args.format)
+    _finish_job(args, work_dir, slug, dict(
+        {"version": get_version(), "source": source, "slug": slug}, **settings, preview=args.preview,
+    ), previewed)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+"""Resumable HTTP downloads with retry and exponential backoff."""
+
+import os
+import random
+import shutil
+import socket
+import time
+import urllib.error
+import urllib.request
+
+from demix.paths import cache_path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+REQUEST_TIMEOUT = 30
+USER_AGENT = "Mozilla/5.0"
+
+
+def partial_download_path(name):
+    """Return the location of the partial file for a download.
+
+    Partial files live in the demix cache rather than the output directory,
+    so that cleaning the output between runs does not throw away progress.
+    """
+    return cache_path("downloads", f"{name}.part")
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Return the delay before retry number `attempt` (exponential, full jitter)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _is_retryable(error):
+    """Network errors are retried; local filesystem errors (e.g. a full disk) are not."""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500 or error.code in (408, 429)
+    return isinstance(error, (urllib.error.URLError, socket.timeout, ConnectionError))
+
+
+def _open_range(url, offset):
+    headers = {"User-Agent": USER_AGENT}
+    if offset > 0:
+        headers["Range"] = f"bytes={offset}-"
+    request = urllib.request.Request(url, headers=headers)
+    return urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT)
+
+
+def _range_total(headers):
+    """Return the full size from a Content-Range header ("bytes 0-99/1000" or "bytes */1000"), or None."""
+    content_range = (headers or {}).get("Content-Range")
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        if total.isdigit():
+            return int(total)
+    return None
+
+
+def _total_size(response, offset):
+    """Work out the full size of the resource from the response headers."""
+    total = _range_total(response.headers)
+    if total is not None:
+        return total
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit():
+        return int(length) + (offset if response.status == 206 else 0)
+    return None
+
+
+def _fetch(url, part_file, expected_size):
+    """Fetch the remaining bytes of `url` into `part_file`. Returns the total size."""
+    offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+    if expected_size is not None and offset > expected_size:
+        os.remove(part_file)
+        offset = 0
+    if expected_size is not None and offset == expected_size:
+        return expected_size
+    try:
+        response = _open_range(url, offset)
+    except urllib.error.HTTPError as e:
+        if e.code == 416:
+            if offset > 0 and _range_total(e.headers) == offset:
+                # The partial file already holds the whole resource
+                return offset
+            # Stale partial file that no longer matches the resource
+            os.remove(part_file)
+            return _fetch(url, part_file, expected_size)
+        raise
+    with response:
+        if offset > 0 and response.status != 206:
+            # Server ignored the Range header, start over
+            offset = 0
+        total = _total_size(response, offset) or expected_size
+        with open(part_file, "ab" if offset > 0 else "wb") as f:
+            shutil.copyfileobj(response, f, CHUNK_SIZE)
+    return total
+
+
+def download_resumable(url, output_file, part_file, expected_size=None, retries=DEFAULT_RETRIES):
+    """Download `url` to `output_file`, resuming from `part_file` if present.
+
+    Transient failures are retried with exponential backoff and jitter. The
+    partial file is kept between attempts (and between runs) and resumed with
+    an HTTP Range request. The completed file is verified against the expected
+    size before it is moved to `output_file`. If another job is already
+    downloading to `part_file`, this one uses a partial file of its own.
+    """
+    lock = _lock_part(part_file)
+    if lock is None:
+        part_file = f"{part_file}.{os.getpid()}"
+    try:
+        _fetch_with_retries(url, part_file, expected_size, retries)
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        shutil.move(part_file, output_file)
+    except BaseException:
+        if lock is None and os.path.exists(part_file):
+            # A private partial file can't be resumed by a later run
+            os.remove(part_file)
+        raise
+    finally:
+        if lock is not None:
+            lock.close()
+    return output_file
+
+
+def _lock_part(part_file):
+    """Lock `part_file` against other jobs. Returns the open lock file, or None if another job holds it."""
+    lock = open(f"{part_file}.lock", "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return None
+    return lock
+
+
+def _fetch_with_retries(url, part_file, expected_size, retries):
+    attempt = 0
+    while True:
+        try:
+            total = _fetch(url, part_file, expected_size)
+            size = os.path.getsize(part_file)
+            if total is not None and size != total:
+                raise ConnectionError(f"Incomplete download: got {size} of {total} bytes")
+            return
+        except Exception as e:
+            if attempt >= retries or not _is_retryable(e):
+                raise
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
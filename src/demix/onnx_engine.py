@@ -0,0 +1,207 @@
+"""ONNX Runtime inference for the Spleeter U-Net models.
+
+Only the U-Net runs in ONNX Runtime. The STFT, the ratio masks and the
+inverse STFT are computed with NumPy, the same way Spleeter does it in
+TensorFlow, one batch of spectrogram segments at a time. Segments are
+independent, so memory stays bounded by the batch size while the result is
+identical to processing the whole file at once.
+
+Models are exported once with `demix export-onnx` (needs tensorflow, spleeter
+and tf2onnx) and then only onnxruntime is needed for inference.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from demix.paths import data_path
+from demix.stems import model_name, model_spec
+
+DEFAULT_BATCH_SIZE = 4
+DEFAULT_OPSET = 13
+EPSILON = 1e-10
+WINDOW_COMPENSATION_FACTOR = 2.0 / 3.0
+# Subdirectory of the data directory holding the exported models
+ONNX_DIR = "onnx"
+
+# Spleeter parameters the NumPy side of the inference needs
+CONFIG_KEYS = [
+    "instrument_list", "sample_rate", "frame_length", "frame_step", "T", "F",
+    "n_channels", "separation_exponent", "mask_extension",
+]
+
+
+def model_paths(mode, quality="standard"):
+    """Return the (onnx model, config) paths of an exported model."""
+    name = model_name(mode, quality)
+    return data_path(ONNX_DIR, f"{name}.onnx"), data_path(ONNX_DIR, f"{name}.json")
+
+
+def export_model(mode, quality="standard", opset=DEFAULT_OPSET):
+    """Export the pretrained Spleeter U-Net of `mode` to ONNX.
+
+    Builds the model on a spectrogram placeholder of shape
+    (batch, T, F, channels), restores the pretrained checkpoint (downloading
+    it if needed) and converts the frozen graph. Returns the model path.
+    """
+    import tensorflow as tf
+    import tf2onnx
+    from spleeter.model import get_model_function
+    from spleeter.model.provider import ModelProvider
+    from spleeter.utils.configuration import load_configuration
+
+    params = load_configuration(model_spec(mode, quality))
+    model_dir = ModelProvider.default().get(params["model_dir"])
+    instruments = params["instrument_list"]
+    graph = tf.Graph()
+    with graph.as_default():
+        spectrogram = tf.compat.v1.placeholder(
+            tf.float32, [None, params["T"], params["F"], params["n_channels"]], name="spectrogram"
+        )
+        apply_model = get_model_function(params["model"]["type"])
+        outputs = apply_model(spectrogram, instruments, params["model"]["params"])
+        output_names = [outputs[f"{instrument}_spectrogram"].op.name for instrument in instruments]
+        with tf.compat.v1.Session() as session:
+            tf.compat.v1.train.Saver().restore(session, tf.train.latest_checkpoint(model_dir))
+            frozen = tf.compat.v1.graph_util.convert_variables_to_constants(
+                session, graph.as_graph_def(), output_names
+            )
+
+    onnx_path, config_path = model_paths(mode, quality)
+    tf2onnx.convert.from_graph_def(
+        frozen,
+        input_names=["spectrogram:0"],
+        output_names=[f"{name}:0" for name in output_names],
+        opset=opset,
+        output_path=onnx_path,
+    )
+    config = {key: params[key] for key in CONFIG_KEYS}
+    config["output_names"] = [f"{name}:0" for name in output_names]
+    with open(config_path, "w") as f:
+        json.dump(config, f, indent=2)
+    return onnx_path
+
+
+def create_session(model_path, intra_op_threads=None):
+    """Create a CPU onnxruntime session; `intra_op_threads` of None uses all cores."""
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.inter_op_num_threads = 1
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    return ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+
+def load_separator(mode, quality="standard", intra_op_threads=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Load an exported model as an OnnxSeparator."""
+    onnx_path, config_path = model_paths(mode, quality)
+    if not os.path.exists(onnx_path) or not os.path.exists(config_path):
+        raise FileNotFoundError(
+            f"No ONNX model for {model_name(mode, quality)}. "
+            f"Export it first with: demix export-onnx -m {mode} -q {quality}"
+        )
+    with open(config_path) as f:
+        config = json.load(f)
+    return OnnxSeparator(config, create_session(onnx_path, intra_op_threads), batch_size)
+
+
+def _hann(length):
+    """Periodic Hann window, as used by Spleeter."""
+    return (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(length) / length)).astype(np.float32)
+
+
+class OnnxSeparator:
+    """Spleeter-compatible separation running the U-Net through an ONNX session."""
+
+    def __init__(self, config, session, batch_size=DEFAULT_BATCH_SIZE):
+        self.config = config
+        self.session = session
+        self.batch_size = max(1, batch_size)
+        self.instruments = config["instrument_list"]
+        self.frame_length = config["frame_length"]
+        self.frame_step = config["frame_step"]
+        self.window = _hann(self.frame_length)
+        self.input_name = session.get_inputs()[0].name
+        self.output_names = config.get("output_names") or [output.name for output in session.get_outputs()]
+
+    def _frames(self, padded, start, count):
+        """Return `count` windowed frames (channels, count, frame_length) starting at frame `start`."""
+        step = self.frame_step
+        index = (start + np.arange(count))[:, np.newaxis] * step + np.arange(self.frame_length)
+        return padded[:, index] * self.window
+
+    def _masks(self, outputs, stft_bins):
+        """Compute Spleeter's ratio masks, extended to the full STFT bandwidth."""
+        exponent = self.config["separation_exponent"]
+        powered = np.stack(outputs) ** exponent
+        masks = (powered + EPSILON / len(outputs)) / (powered.sum(axis=0) + EPSILON)
+        n_extra = stft_bins - masks.shape[3]
+        if n_extra > 0:
+            if self.config["mask_extension"] == "average":
+                extension = masks.mean(axis=3, keepdims=True)
+            else:
+                extension = np.zeros(masks.shape[:3] + (1,) + masks.shape[4:], dtype=masks.dtype)
+            masks = np.concatenate([masks, np.repeat(extension, n_extra, axis=3)], axis=3)
+        # (instruments, segments, T, bins, channels) -> (instruments, frames, bins, channels)
+        return masks.reshape(masks.shape[0], -1, masks.shape[3], masks.shape[4])
+
+    def _overlap_add(self, output, frames, start):
+        """Add (instruments, channels, frames, frame_length) frames into `output` at frame `start`."""
+        length, step = self.frame_length, self.frame_step
+        count = frames.shape[2]
+        if length % step:
+            for i in range(count):
+                offset = (start + i) * step
+                output[:, :, offset:offset + length] += frames[:, :, i]
+            return
+        # Each frame spans `hops` consecutive blocks of `step` samples, so
+        # the overlap-add is `hops` vectorized block additions.
+        hops = length // step
+        blocks = frames.reshape(frames.shape[:3] + (hops, step))
+        for j in range(hops):
+            begin = (start + j) * step
+            target = output[:, :, begin:begin + count * step]
+            target += blocks[:, :, :, j, :].reshape(target.shape)
+
+    def separate(self, waveform):
+        """Separate a (samples, channels) waveform into a dict of instrument waveforms."""
+        waveform = np.asarray(waveform, dtype=np.float32)
+        if waveform.ndim == 1:
+            waveform = waveform[:, np.newaxis]
+        if waveform.shape[1] == 1:
+            waveform = np.repeat(waveform, 2, axis=1)
+        n_samples = len(waveform)
+        length, step = self.frame_length, self.frame_step
+        segment = self.config["T"]
+        bins = self.config["F"]
+
+        # Spleeter prepends one frame of zeros and pads the end (pad_end=True)
+        n_frames = -(-(n_samples + length) // step)
+        padded = np.zeros((waveform.shape[1], (n_frames - 1) * step + length), dtype=np.float32)
+        padded[:, length:length + n_samples] = waveform.T
+        output = np.zeros((len(self.instruments), waveform.shape[1], padded.shape[1]), dtype=np.float32)
+
+        frames_per_batch = segment * self.batch_size
+        for start in range(0, n_frames, frames_per_batch):
+            count = min(frames_per_batch, n_frames - start)
+            stft = np.fft.rfft(self._frames(padded, start, count), axis=-1)
+            # (channels, frames, stft bins) -> (frames, stft bins, channels)
+            stft = stft.transpose(1, 2, 0).astype(np.complex64)
+            n_segments = -(-count // segment)
+            spectrogram = np.zeros((n_segments * segment, bins, stft.shape[2]), dtype=np.float32)
+            spectrogram[:count] = np.abs(stft[:, :bins, :])
+            spectrogram = spectrogram.reshape(n_segments, segment, bins, stft.shape[2])
+            outputs = self.session.run(self.output_names, {self.input_name: spectrogram})
+            masks = self._masks(outputs, stft.shape[1])[:, :count]
+            # (instruments, frames, bins, channels) -> (instruments, channels, frames, samples)
+            frames = np.fft.irfft(masks * stft, n=length, axis=2).transpose(0, 3, 1, 2) * self.window
+            self._overlap_add(output, frames, start)
+
+        output *= WINDOW_COMPENSATION_FACTOR
+        return {
+            instrument: output[k, :, length:length + n_samples].T.copy()
+            for k, instrument in enumerate(self.instruments)
+        }
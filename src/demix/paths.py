@@ -0,0 +1,32 @@
+"""Well-known filesystem locations used by demix."""
+
+import os
+import shutil
+
+CACHE_DIR = os.environ.get("DEMIX_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "demix")
+# Files that are expensive to rebuild and survive --clean cache
+DATA_DIR = os.environ.get("DEMIX_DATA_DIR") or os.path.join(
+    os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share"), "demix"
+)
+
+
+def cache_path(*parts):
+    """Return a path inside the demix cache directory, creating its parent."""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def data_path(*parts):
+    """Return a path inside the demix data directory, creating its parent."""
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def tmpfs_dir(min_free=0):
+    """Return a RAM-backed directory for intermediate files (/dev/shm) with `min_free` bytes free, or None."""
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) \
+            and shutil.disk_usage("/dev/shm").free >= min_free:
+        return "/dev/shm"
+    return None
@@ -0,0 +1,180 @@
+"""Cache of decoded sources as memory-mapped 16-bit PCM.
+
+Decoding the source with ffmpeg is repeated by every run on the same file,
+whatever the cut. The decoded 44.1 kHz stereo PCM of a source is kept in the
+demix cache as an int16 .npy file named after a hash of the source's
+content. The file is opened memory-mapped, so a cut is a slice of the mapped
+array and only the pages it covers are read from disk. A short cut of a file
+that is not cached yet is not worth a full decode and is left to ffmpeg.
+"""
+
+import hashlib
+import io
+import os
+import subprocess
+
+import numpy as np
+
+from demix.audio import CHANNELS, SAMPLE_RATE, probe_duration
+from demix.paths import cache_path
+
+HASH_CHUNK = 1024 * 1024
+# Space reserved for the .npy header, written once the decoded length is known
+HEADER_BYTES = 128
+DEFAULT_LIMIT = 4 * 1024 ** 3
+# A cache miss decodes the whole source only for cuts covering at least this part of it
+MIN_FILL_FRACTION = 0.5
+
+
+def content_hash(path):
+    """Return the SHA-1 hex digest of a file's content."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pcm_path(digest):
+    """Return the cache location of the decoded PCM of the source with content hash `digest`."""
+    return cache_path("pcm", f"{digest}.npy")
+
+
+def _npy_header(frames, channels):
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(
+        header, {"descr": "<i2", "fortran_order": False, "shape": (frames, channels)}
+    )
+    if len(header.getvalue()) != HEADER_BYTES:
+        raise ValueError(f"Unexpected .npy header size for {frames} frames")
+    return header.getvalue()
+
+
+def decode_pcm(input_file, path, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """Decode any audio file with ffmpeg into an int16 .npy file of shape (frames, channels).
+
+    ffmpeg writes the PCM straight into the file after the space reserved for
+    the header, and the file only appears at `path` once it is complete.
+    Raises RuntimeError if ffmpeg cannot decode the file.
+    """
+    partial = f"{path}.{os.getpid()}.partial"
+    cmd = ["ffmpeg", "-v", "error", "-i", input_file, "-vn", "-f", "s16le", "-acodec", "pcm_s16le",
+           "-ar", str(sample_rate), "-ac", str(channels), "-"]
+    try:
+        with open(partial, "wb") as f:
+            f.seek(HEADER_BYTES)
+            process = subprocess.Popen(cmd, stdout=f, stderr=subprocess.PIPE)
+            _, error = process.communicate()
+            if process.returncode != 0:
+                raise RuntimeError(
+                    f"ffmpeg could not decode {input_file}: {error.decode(errors='replace').strip()}"
+                )
+            f.flush()
+            frames = (os.fstat(f.fileno()).st_size - HEADER_BYTES) // (channels * 2)
+            if not frames:
+                raise RuntimeError(f"ffmpeg found no audio in {input_file}")
+            f.truncate(HEADER_BYTES + frames * channels * 2)
+            f.seek(0)
+            f.write(_npy_header(frames, channels))
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+
+def prune_cache(limit=DEFAULT_LIMIT, keep=None):
+    """Remove the least recently used PCM files until the cache holds at most `limit` bytes.
+
+    `keep` is never removed. Returns the number of files removed.
+    """
+    directory = os.path.dirname(pcm_path("x"))
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith(".npy"):
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Pruned by another job
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        if path != keep:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+    return removed
+
+
+def _open_pcm(path):
+    pcm = np.load(path, mmap_mode="r")
+    if pcm.dtype != np.dtype("<i2") or pcm.ndim != 2 or pcm.shape[1] != CHANNELS:
+        raise ValueError(f"Unexpected PCM layout in {path}")
+    return pcm
+
+
+def worth_filling(input_file, start_time=None, end_time=None, min_fraction=MIN_FILL_FRACTION):
+    """Return whether a cache miss for the cut of `input_file` should decode the whole file.
+
+    Without a cut it always should. A cut covering less than `min_fraction`
+    of the source, or of a source whose length ffprobe can't tell, is
+    cheaper to decode on its own.
+    """
+    if start_time is None and end_time is None:
+        return True
+    duration = probe_duration(input_file)
+    if not duration:
+        return False
+    end = duration if end_time is None else min(end_time, duration)
+    return end - (start_time or 0) >= min_fraction * duration
+
+
+def _lookup(path):
+    """Return the cached PCM at `path`, or None. A truncated or otherwise unreadable file is removed."""
+    if not os.path.exists(path):
+        return None
+    try:
+        pcm = _open_pcm(path)
+    except (ValueError, EOFError):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return None
+    # The modification time orders the cache for pruning
+    os.utime(path)
+    return pcm
+
+
+def cached_pcm(input_file, limit=DEFAULT_LIMIT, start_time=None, end_time=None):
+    """Return (pcm, hit): the decoded audio of `input_file` as a read-only memory-mapped int16 array.
+
+    The file is decoded into the cache unless it is already there (`hit`).
+    A truncated or otherwise unreadable cache file is decoded again. On a
+    miss for a cut between `start_time` and `end_time` that is not worth a
+    full decode (see worth_filling), nothing is decoded and pcm is None.
+    """
+    path = pcm_path(content_hash(input_file))
+    pcm = _lookup(path)
+    if pcm is not None:
+        return pcm, True
+    if not worth_filling(input_file, start_time, end_time):
+        return None, False
+    decode_pcm(input_file, path)
+    prune_cache(limit, keep=path)
+    return _open_pcm(path), False
+
+
+def cut_pcm(pcm, start_time=None, end_time=None, sample_rate=SAMPLE_RATE):
+    """Return the frames of `pcm` between `start_time` and `end_time` (seconds) as a view, without copying."""
+    start = 0 if start_time is None else int(round(start_time * sample_rate))
+    end = None if end_time is None else int(round(end_time * sample_rate))
+    return pcm[start:end]
@@ -0,0 +1,126 @@
+"""Custom mixes of separated stems with per-stem gains and mutes.
+
+Stems are read block by block, mixed with one matrix product per block and
+written as they are mixed, so memory does not depend on the track length.
+"""
+
+import os
+import wave
+
+import numpy as np
+
+from demix.audio import iter_stem_blocks, to_int16, wav_info
+from demix.stems import STEM_MODES
+
+BLOCK_FRAMES = 65536
+CLIP_MODES = ["normalize", "soft", "none"]
+# Peak level the normalize mode scales the mix down to (-0.1 dBFS)
+CEILING = 10 ** (-0.1 / 20)
+# Level above which the soft mode starts to compress
+SOFT_KNEE = 0.9
+
+# WAV files in a separation directory that are not stems
+_NOT_STEMS = {"music", "music_active"}
+
+
+def find_stems(directory):
+    """Return {stem: path} of the stems separated into `directory`.
+
+    If the stems of a separation mode are all present, only those are
+    returned, so composite stems (accompaniment, no_<stem>) built from them
+    are not counted twice. Otherwise every WAV file except the source is a stem.
+    """
+    if not os.path.isdir(directory):
+        raise ValueError(f"Stem directory not found: {directory}")
+    files = {
+        os.path.splitext(name)[0]: os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.lower().endswith(".wav") and os.path.splitext(name)[0] not in _NOT_STEMS
+    }
+    for mode in sorted(STEM_MODES, key=lambda m: len(STEM_MODES[m]), reverse=True):
+        if all(stem in files for stem in STEM_MODES[mode]):
+            return {stem: files[stem] for stem in STEM_MODES[mode]}
+    if not files:
+        raise ValueError(f"No stem WAV files in {directory}")
+    return files
+
+
+def parse_gain(spec):
+    """Parse a STEM=DB gain, e.g. "drums=-6" -> ("drums", -6.0)."""
+    stem, sep, value = spec.partition("=")
+    try:
+        if not sep or not stem.strip():
+            raise ValueError
+        return stem.strip(), float(value)
+    except ValueError:
+        raise ValueError(f"Invalid gain: {spec}. Use STEM=DB, e.g. drums=-6") from None
+
+
+def mix_gains(stems, gains_db=None, mutes=(), only=None):
+    """Return the linear gain of every stem; muted stems and stems left out of `only` get 0."""
+    gains_db = gains_db or {}
+    for name in list(gains_db) + list(mutes) + list(only or []):
+        if name not in stems:
+            raise ValueError(f"Unknown stem: {name}. Available: {', '.join(stems)}")
+    gains = {}
+    for stem in stems:
+        if stem in mutes or (only is not None and stem not in only):
+            gains[stem] = 0.0
+        else:
+            gains[stem] = 10 ** (gains_db.get(stem, 0.0) / 20)
+    return gains
+
+
+def soft_clip(samples, knee=SOFT_KNEE):
+    """Compress samples above `knee` smoothly so that they never exceed full scale."""
+    magnitude = np.abs(samples)
+    over = magnitude > knee
+    if over.any():
+        headroom = 1.0 - knee
+        compressed = knee + headroom * np.tanh((magnitude[over] - knee) / headroom)
+        samples[over] = np.sign(samples[over]) * compressed
+    return samples
+
+
+def remix(stem_files, output_file, gains, clip="normalize", block_frames=BLOCK_FRAMES):
+    """Mix PCM WAV stems into a 16-bit WAV file.
+
+    `stem_files` and `gains` map stem names to WAV paths and linear gains.
+    Stems with a gain of 0 are not read. `clip` protects against clipping:
+    "normalize" scales the whole mix so that its peak is at -0.1 dBFS (one
+    extra read pass, only if the mix would clip), "soft" compresses peaks
+    above 0.9 block by block, and "none" clips hard.
+
+    Returns the peak level of the mix before clipping protection.
+    """
+    if clip not in CLIP_MODES:
+        raise ValueError(f"Unknown clip mode: {clip}. Choose from: {', '.join(CLIP_MODES)}")
+    active = [stem for stem in stem_files if gains.get(stem, 0.0) > 0]
+    if not active:
+        raise ValueError("All stems are muted")
+    weights = np.array([gains[stem] for stem in active], dtype=np.float32)
+    paths = [stem_files[stem] for stem in active]
+    peak = 0.0
+    scale = 1.0
+    if clip == "normalize":
+        for block in iter_stem_blocks(paths, block_frames):
+            peak = max(peak, float(np.abs(np.tensordot(weights, block, axes=1)).max(initial=0.0)))
+        if peak > CEILING:
+            scale = CEILING / peak
+    _, rate, channels = wav_info(paths[0])
+    blocks = iter_stem_blocks(paths, block_frames)
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with wave.open(output_file, "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        for block in blocks:
+            mix = np.tensordot(weights * scale, block, axes=1)
+            if clip != "normalize":
+                peak = max(peak, float(np.abs(mix).max(initial=0.0)))
+            if clip == "soft":
+                mix = soft_clip(mix)
+            out.writeframes(to_int16(mix).tobytes())
+    return peak
@@ -0,0 +1,178 @@
+"""Library scanning: key, BPM and loudness of many files, kept in an SQLite index.
+
+Files are analyzed in a process pool and the results are written by the
+parent process only. Each row is keyed by path and remembers the size and
+modification time the file had when it was analyzed, so a re-scan only
+analyzes new or changed files (and retries the ones that failed).
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from demix.analysis import BLOCK_SECONDS, analyze_blocks
+from demix.audio import CHANNELS, SAMPLE_RATE, iter_decoded_blocks, iter_wav_blocks, wav_info
+from demix.paths import data_path
+
+AUDIO_EXTENSIONS = {".aac", ".aif", ".aiff", ".alac", ".flac", ".m4a", ".mp3", ".ogg", ".opus", ".wav", ".wma"}
+EXPORT_FORMATS = ["csv", "json"]
+COMMIT_EVERY = 50
+
+COLUMNS = [
+    "path", "size", "mtime", "duration", "key", "scale", "strength", "bpm",
+    "loudness_lufs", "peak_dbfs", "error", "scanned_at",
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    duration REAL,
+    key TEXT,
+    scale TEXT,
+    strength REAL,
+    bpm REAL,
+    loudness_lufs REAL,
+    peak_dbfs REAL,
+    error TEXT,
+    scanned_at REAL NOT NULL
+)
+"""
+
+
+def default_index_path():
+    # Not in the cache: rebuilding the index means analyzing the whole library again
+    return data_path("library.sqlite")
+
+
+def open_index(path):
+    """Open (and create if needed) an index database."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute(_SCHEMA)
+    return connection
+
+
+def find_audio_files(directory):
+    """Return the sorted absolute paths of all audio files below `directory`."""
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                files.append(os.path.abspath(os.path.join(root, name)))
+    return sorted(files)
+
+
+def pending_files(connection, files):
+    """Return (path, size, mtime) of the files that are not indexed, changed since or failed before."""
+    indexed = {
+        path: (size, mtime)
+        for path, size, mtime in connection.execute("SELECT path, size, mtime FROM tracks WHERE error IS NULL")
+    }
+    pending = []
+    for path in files:
+        stat = os.stat(path)
+        if indexed.get(path) != (stat.st_size, stat.st_mtime):
+            pending.append((path, stat.st_size, stat.st_mtime))
+    return pending
+
+
+def _open_blocks(path):
+    """Return (blocks, rate, channels); PCM WAV files are read directly, the rest is decoded by ffmpeg."""
+    if path.lower().endswith(".wav"):
+        try:
+            _, rate, channels = wav_info(path)
+            return iter_wav_blocks(path, int(BLOCK_SECONDS * rate)), rate, channels
+        except (wave.Error, EOFError):
+            pass
+    return iter_decoded_blocks(path, int(BLOCK_SECONDS * SAMPLE_RATE)), SAMPLE_RATE, CHANNELS
+
+
+def analyze_file(path):
+    """Decode and analyze one file. Runs in a worker process; returns a row dict."""
+    try:
+        analysis = analyze_blocks(*_open_blocks(path))
+    except Exception as e:
+        return {"path": path, "error": str(e) or type(e).__name__}
+    loudness = analysis["loudness"]
+    return {
+        "path": path,
+        "duration": analysis["duration"],
+        "key": analysis["key"]["key"],
+        "scale": analysis["key"]["scale"],
+        "strength": analysis["key"]["strength"],
+        "bpm": analysis["tempo"]["bpm"],
+        # -inf levels of silent files are stored as NULL
+        "loudness_lufs": loudness["integrated_lufs"] if loudness["integrated_lufs"] > float("-inf") else None,
+        "peak_dbfs": loudness["peak_dbfs"] if loudness["peak_dbfs"] > float("-inf") else None,
+        "error": None,
+    }
+
+
+def _store(connection, row, size, mtime):
+    row = dict(row, size=size, mtime=mtime, scanned_at=time.time())
+    values = [row.get(column) for column in COLUMNS]
+    connection.execute(
+        f"INSERT OR REPLACE INTO tracks ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+        values,
+    )
+
+
+def scan_library(directory, connection, jobs=None, on_result=None):
+    """Analyze the new and changed audio files below `directory` into the index.
+
+    `jobs` is the number of worker processes (default: all cores).
+    `on_result(done, total, row)` is called after each file. Rows of files
+    that no longer exist below `directory` are removed. Returns the number of
+    files analyzed.
+    """
+    files = find_audio_files(directory)
+    prefix = os.path.join(os.path.abspath(directory), "")
+    existing = set(files)
+    stale = [
+        (path,) for (path,) in connection.execute("SELECT path FROM tracks")
+        if path.startswith(prefix) and path not in existing
+    ]
+    connection.executemany("DELETE FROM tracks WHERE path = ?", stale)
+    connection.commit()
+
+    pending = pending_files(connection, files)
+    if not pending:
+        return 0
+    stats = {path: (size, mtime) for path, size, mtime in pending}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(analyze_file, path) for path, _, _ in pending]
+        for done, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            _store(connection, row, *stats[row["path"]])
+            if done % COMMIT_EVERY == 0:
+                connection.commit()
+            if on_result:
+                on_result(done, len(pending), row)
+    connection.commit()
+    return len(pending)
+
+
+def export_index(connection, output_file, fmt=None):
+    """Export all index rows to CSV or JSON (by default chosen from the file extension)."""
+    fmt = fmt or os.path.splitext(output_file)[1].lstrip(".").lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt or output_file}. Use one of: {', '.join(EXPORT_FORMATS)}")
+    cursor = connection.execute(f"SELECT {', '.join(COLUMNS)} FROM tracks ORDER BY path")
+    rows = [dict(zip(COLUMNS, values)) for values in cursor]
+    with open(output_file, "w", newline="") as f:
+        if fmt == "json":
+            json.dump(rows, f, indent=2)
+            f.write("\n")
+        else:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    return len(rows)
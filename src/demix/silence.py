@@ -0,0 +1,111 @@
+"""Skip silent stretches of audio before separation."""
+
+import os
+
+import numpy as np
+
+from demix.audio import read_wav, write_wav
+
+DEFAULT_THRESHOLD_DB = -50.0
+FRAME_SECONDS = 0.05
+MIN_SILENCE_SECONDS = 2.0
+PADDING_SECONDS = 0.25
+
+
+def frame_rms_db(samples, frame_length):
+    """Return the RMS level in dBFS of consecutive frames of `samples`."""
+    mono = samples.mean(axis=1) if samples.ndim == 2 else samples
+    n_frames = -(-len(mono) // frame_length)
+    padded = np.zeros(n_frames * frame_length, dtype=np.float32)
+    padded[:len(mono)] = mono
+    frames = padded.reshape(n_frames, frame_length)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+
+def _runs(mask):
+    """Return (start, end) index pairs of the True runs in a boolean array."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def detect_active_regions(samples, sample_rate, threshold_db=DEFAULT_THRESHOLD_DB,
+                          min_silence=MIN_SILENCE_SECONDS, padding=PADDING_SECONDS):
+    """Find the regions of `samples` that are louder than `threshold_db`.
+
+    Quiet gaps shorter than `min_silence` seconds are kept as part of the
+    surrounding region, and every region is widened by `padding` seconds so
+    that note tails and onsets are not cut. Returns a list of
+    (start_frame, end_frame) sample ranges.
+    """
+    frame_length = max(1, int(sample_rate * FRAME_SECONDS))
+    active = frame_rms_db(samples, frame_length) > threshold_db
+
+    min_frames = int(np.ceil(min_silence / FRAME_SECONDS))
+    starts, ends = _runs(~active)
+    for start, end in zip(starts, ends):
+        if end - start < min_frames:
+            active[start:end] = True
+
+    pad = int(round(padding * sample_rate))
+    total = len(samples)
+    regions = []
+    for start, end in zip(*_runs(active)):
+        start = max(0, start * frame_length - pad)
+        end = min(total, end * frame_length + pad)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def splice_regions(condensed, regions, total_frames):
+    """Place consecutive chunks of `condensed` back at the offsets in `regions`.
+
+    Everything outside the regions is filled with silence.
+    """
+    output = np.zeros((total_frames, condensed.shape[1]), dtype=condensed.dtype)
+    offset = 0
+    for start, end in regions:
+        length = min(end - start, len(condensed) - offset)
+        if length <= 0:
+            break
+        output[start:start + length] = condensed[offset:offset + length]
+        offset += end - start
+    return output
+
+
+def separate_active_regions(wav_file, output_folder, stems, separate,
+                            threshold_db=DEFAULT_THRESHOLD_DB):
+    """Separate only the non-silent parts of `wav_file`.
+
+    The active regions are concatenated into a condensed WAV which is passed
+    to `separate(input_file, output_folder)`. Each resulting stem is then
+    expanded back to the original timeline, with silence in the skipped gaps.
+    Returns the fraction of the file that was skipped.
+    """
+    samples, rate = read_wav(wav_file)
+    total_frames = len(samples)
+    regions = detect_active_regions(samples, rate, threshold_db)
+    active_frames = sum(end - start for start, end in regions)
+    if active_frames >= total_frames:
+        separate(wav_file, output_folder)
+        return 0.0
+    if not regions:
+        # Nothing audible, every stem is silence
+        for stem in stems:
+            write_wav(os.path.join(output_folder, f"{stem}.wav"), np.zeros_like(samples), rate)
+        return 1.0
+
+    condensed_file = os.path.join(output_folder, "music_active.wav")
+    write_wav(condensed_file, np.concatenate([samples[start:end] for start, end in regions]), rate)
+    del samples
+    separate(condensed_file, output_folder)
+    os.remove(condensed_file)
+
+    for stem in stems:
+        stem_file = os.path.join(output_folder, f"{stem}.wav")
+        condensed, stem_rate = read_wav(stem_file)
+        write_wav(stem_file, splice_regions(condensed, regions, total_frames), stem_rate)
+    return 1.0 - active_frames / total_frames
@@ -0,0 +1,162 @@
+"""Stem layouts of the separation models and stems derived from them."""
+
+import json
+import os
+
+import numpy as np
+
+from demix.audio import read_wav, write_wav
+from demix.paths import cache_path
+
+STEM_MODES = {
+    "2stems": ["vocals", "accompaniment"],
+    "4stems": ["vocals", "drums", "bass", "other"],
+    "5stems": ["vocals", "drums", "bass", "piano", "other"],
+}
+
+QUALITY_TIERS = ["fast", "standard", "high"]
+
+# Number of STFT frequency bins the fast tier feeds to the model. The standard
+# models see 1024 bins (~11 kHz); 512 bins (~5.5 kHz) halves the U-Net work and
+# the masks of the lower band are extended over the rest of the spectrum.
+FAST_FREQUENCY_BINS = 512
+
+# Prefix of composite stems holding everything except the named stem,
+# e.g. "no_vocals" or "no_drums"
+EXCLUDE_PREFIX = "no_"
+
+
+def model_name(mode, quality="standard"):
+    """Return the name of the pretrained model used for `mode` and `quality`."""
+    if quality == "high":
+        return f"{mode}-16kHz"
+    if quality == "fast":
+        return f"{mode}-fast"
+    return mode
+
+
+def model_spec(mode, quality="standard"):
+    """Return the spleeter `-p` argument for `mode` and `quality`.
+
+    - fast: the standard model run on a reduced STFT bandwidth
+    - standard: the default 11 kHz model
+    - high: the 16 kHz bandwidth model
+    """
+    if quality == "fast":
+        return fast_model_config(mode)
+    return f"spleeter:{model_name(mode, quality)}"
+
+
+def fast_model_config(mode):
+    """Write (once) and return the path of the spleeter config for the fast tier.
+
+    The config reuses the weights of the standard `mode` model.
+    """
+    path = cache_path("configs", f"{model_name(mode, 'fast')}.json")
+    if not os.path.exists(path):
+        from importlib import resources
+        from spleeter import resources as spleeter_resources
+        config = json.loads(resources.read_text(spleeter_resources, f"{mode}.json"))
+        config["F"] = FAST_FREQUENCY_BINS
+        config["mask_extension"] = "average"
+        with open(path, "w") as f:
+            json.dump(config, f, indent=2)
+    return path
+
+
+def stem_sources(stem, mode, modes=STEM_MODES):
+    """Return the stems of `mode` that are summed to produce `stem`.
+
+    `modes` maps mode names to the stems the model outputs. Returns None if
+    `stem` cannot be produced from the `mode` model.
+    """
+    native = modes[mode]
+    if stem in native:
+        return [stem]
+    if stem == "accompaniment":
+        return [s for s in native if s != "vocals"]
+    if stem.startswith(EXCLUDE_PREFIX):
+        excluded = stem[len(EXCLUDE_PREFIX):]
+        if excluded in native:
+            return [s for s in native if s != excluded]
+    return None
+
+
+def select_mode(stems, modes=STEM_MODES):
+    """Return the smallest separation mode of `modes` that can produce all `stems`."""
+    for mode in modes:
+        if all(stem_sources(stem, mode, modes) is not None for stem in stems):
+            return mode
+    raise ValueError(f"No separation mode can produce stems: {', '.join(stems)}")
+
+
+def parse_modes(value, modes=STEM_MODES):
+    """Parse a comma-separated list of separation modes (e.g. '2stems,4stems')."""
+    requested = []
+    for name in value.split(","):
+        name = name.strip()
+        if name and name not in requested:
+            requested.append(name)
+    if not requested:
+        raise ValueError("No separation mode given")
+    for mode in requested:
+        if mode not in modes:
+            raise ValueError(f"Unknown separation mode: {mode}. Available: {', '.join(modes)}")
+    return requested
+
+
+def mode_stems(requested, modes=STEM_MODES):
+    """Return the stems of all `requested` modes, without duplicates.
+
+    The smallest mode that can produce them all (see `select_mode`) is the
+    only model that has to run; the stems of the other modes are summed from
+    its output, e.g. accompaniment = drums + bass + other.
+    """
+    stems = []
+    for mode in requested:
+        stems.extend(stem for stem in modes[mode] if stem not in stems)
+    return stems
+
+
+def parse_stems(value, modes=STEM_MODES):
+    """Parse a comma-separated list of stem names (e.g. 'vocals,no_vocals')."""
+    stems = []
+    for name in value.split(","):
+        name = name.strip()
+        if name and name not in stems:
+            stems.append(name)
+    if not stems:
+        raise ValueError("No stems given")
+    known = {stem for mode_stems in modes.values() for stem in mode_stems}
+    for stem in stems:
+        base = stem[len(EXCLUDE_PREFIX):] if stem.startswith(EXCLUDE_PREFIX) else stem
+        if base not in known:
+            raise ValueError(f"Unknown stem: {stem}. Available: {', '.join(sorted(known))}")
+    select_mode(stems, modes)
+    return stems
+
+
+def build_composite_stems(wav_dir, stems, mode, modes=STEM_MODES):
+    """Write WAVs for the requested stems that the model does not output directly.
+
+    Composite stems are built by summing the separated stem arrays, so no
+    second separation run is needed.
+    """
+    for stem in stems:
+        sources = stem_sources(stem, mode, modes)
+        if sources == [stem]:
+            continue
+        mix = None
+        for source in sources:
+            samples, rate = read_wav(os.path.join(wav_dir, f"{source}.wav"))
+            mix = samples if mix is None else _add(mix, samples)
+        write_wav(os.path.join(wav_dir, f"{stem}.wav"), mix, rate)
+
+
+def _add(a, b):
+    length = max(len(a), len(b))
+    if len(a) < length:
+        a = np.pad(a, ((0, length - len(a)), (0, 0)))
+    if len(b) < length:
+        b = np.pad(b, ((0, length - len(b)), (0, 0)))
+    return a + b
@@ -0,0 +1,167 @@
+"""Real-time separation of a PCM stream with a fixed latency.
+
+Audio arrives block by block (from stdin or a FIFO). Each block is separated
+together with some past audio (context) and some following audio
+(lookahead), so the model never sees a hard edge right at the samples it
+outputs. Consecutive blocks are crossfaded over part of the lookahead to
+hide the seams. A block can only be separated once its lookahead has
+arrived, so every output sample is `block + lookahead` frames behind the
+input, whatever the length of the stream.
+"""
+
+import time
+
+import numpy as np
+
+from demix.audio import CHANNELS, SAMPLE_RATE, iter_pcm_blocks, to_int16
+
+DEFAULT_LATENCY = 1.0
+DEFAULT_CONTEXT = 2.0
+
+
+class StreamSeparator:
+    """Separate audio fed in blocks of any size into stem blocks with a fixed latency.
+
+    `separate` maps a (frames, channels) array to {stem: array of the same
+    shape}. The audio is separated in steps of `block_frames`, each step with
+    up to `context_frames` of past audio and `lookahead_frames` of following
+    audio.
+    """
+
+    def __init__(self, separate, stems, block_frames, lookahead_frames, context_frames, channels=CHANNELS,
+                 fade_frames=None):
+        if block_frames <= 0:
+            raise ValueError("Block size must be positive")
+        self.separate = separate
+        self.stems = list(stems)
+        self.block_frames = block_frames
+        self.lookahead_frames = lookahead_frames
+        self.context_frames = context_frames
+        self.channels = channels
+        if fade_frames is None:
+            fade_frames = block_frames // 4
+        self.fade_frames = min(fade_frames, lookahead_frames, block_frames)
+        ramp = (np.arange(self.fade_frames, dtype=np.float32) + 0.5) / max(self.fade_frames, 1)
+        self._fade_in = ramp[:, np.newaxis]
+        self._buffer = np.zeros((0, channels), np.float32)
+        # Absolute frame index of the buffer start, of the next output frame and of the input end
+        self._start = 0
+        self._next = 0
+        self._received = 0
+        self._tails = None
+
+    @property
+    def latency_frames(self):
+        """Frames between an input sample arriving and its stems being emitted."""
+        return self.block_frames + self.lookahead_frames
+
+    def process(self, block):
+        """Add a (frames, channels) block of input; returns {stem: separated frames ready so far}."""
+        self._buffer = np.concatenate([self._buffer, np.asarray(block, np.float32)])
+        self._received += len(block)
+        return self._run(self._received)
+
+    def flush(self):
+        """Separate the rest of the input after it ended; returns the remaining stem frames."""
+        first, end = self._next, self._received
+        padding = self.latency_frames
+        self._buffer = np.concatenate([self._buffer, np.zeros((padding, self.channels), np.float32)])
+        outputs = self._run(end + padding)
+        return {stem: samples[:end - first] for stem, samples in outputs.items()}
+
+    def _run(self, available):
+        outputs = {stem: [] for stem in self.stems}
+        while available - self._next >= self.latency_frames:
+            for stem, samples in self._step().items():
+                outputs[stem].append(samples)
+        return {
+            stem: np.concatenate(blocks) if blocks else np.zeros((0, self.channels), np.float32)
+            for stem, blocks in outputs.items()
+        }
+
+    def _step(self):
+        window_start = max(self._start, self._next - self.context_frames)
+        window_end = self._next + self.latency_frames
+        separated = self.separate(self._buffer[window_start - self._start:window_end - self._start])
+        offset = self._next - window_start
+        fade = self.fade_frames
+        outputs = {}
+        tails = {}
+        for stem in self.stems:
+            samples = separated[stem]
+            block = np.array(samples[offset:offset + self.block_frames], np.float32)
+            if self._tails is not None and fade:
+                block[:fade] = self._tails[stem] * (1 - self._fade_in) + block[:fade] * self._fade_in
+            tails[stem] = samples[offset + self.block_frames:offset + self.block_frames + fade]
+            outputs[stem] = block
+        self._tails = tails
+        self._next += self.block_frames
+        # Keep only the context the next step needs
+        keep_from = max(self._start, self._next - self.context_frames)
+        self._buffer = self._buffer[keep_from - self._start:]
+        self._start = keep_from
+        return outputs
+
+
+class RealtimeReport:
+    """Track whether separation keeps up with audio arriving in real time."""
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.blocks = 0
+        self.late = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+        self.worst = 0.0
+
+    def add(self, frames, seconds):
+        """Record that `frames` of input took `seconds` to process. Returns True if that was too slow."""
+        duration = frames / self.sample_rate
+        self.blocks += 1
+        self.audio_seconds += duration
+        self.busy_seconds += seconds
+        load = seconds / duration if duration else 0.0
+        self.worst = max(self.worst, load)
+        if load > 1.0:
+            self.late += 1
+            return True
+        return False
+
+    @property
+    def load(self):
+        """Processing time per second of audio (below 1.0 keeps up with real time)."""
+        return self.busy_seconds / self.audio_seconds if self.audio_seconds else 0.0
+
+    @property
+    def keeps_up(self):
+        return self.late == 0
+
+
+def stream_separate(input_stream, outputs, separate, stems, sample_rate=SAMPLE_RATE, channels=CHANNELS,
+                    latency=DEFAULT_LATENCY, context=DEFAULT_CONTEXT, on_late=None):
+    """Separate 16-bit PCM from `input_stream` and write 16-bit PCM stems to `outputs` ({stem: binary stream}).
+
+    Half of `latency` (seconds) is the block size and half the lookahead.
+    `on_late(report)` is called for every input block that took longer to
+    process than it takes to play. Returns the RealtimeReport.
+    """
+    latency_frames = int(round(latency * sample_rate))
+    block_frames = max(1, latency_frames // 2)
+    separator = StreamSeparator(
+        separate, stems, block_frames, latency_frames - block_frames, int(round(context * sample_rate)), channels
+    )
+    report = RealtimeReport(sample_rate)
+
+    def write(separated):
+        for stem, samples in separated.items():
+            if len(samples):
+                outputs[stem].write(to_int16(samples).tobytes())
+                outputs[stem].flush()
+
+    for block in iter_pcm_blocks(input_stream, block_frames, channels):
+        start = time.perf_counter()
+        write(separator.process(block))
+        if report.add(len(block), time.perf_counter() - start) and on_late:
+            on_late(report)
+    write(separator.flush())
+    return report
@@ -0,0 +1,367 @@
+import json
+import os
+import sys
+
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+import essentia.standard as es
+
+# Add src directory to path for development usage
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.analysis import (  # noqa: E402
+    LoudnessMeter,
+    SpectralFrames,
+    StemLoudnessMeter,
+    KEY_PROFILES,
+    analyze_audio,
+    estimate_keys,
+    fast_key,
+    full_key,
+    key_segments,
+    key_timeline,
+    parse_key_profiles,
+    signal_hpcp,
+    gated_loudness,
+    key_consensus,
+    key_excerpt,
+    normalization_gains,
+    transpose_key,
+    write_sidecar,
+)
+from demix.audio import read_wav, write_wav  # noqa: E402
+
+RATE = 44100
+A_MINOR = [[57, 60, 64], [62, 65, 69], [64, 68, 71], [57, 60, 64]]
+E_MAJOR = [[64, 68, 71], [69, 73, 76], [71, 75, 78], [64, 68, 71]]
+
+
+def _midi(note):
+    return 440 * 2 ** ((note - 69) / 12)
+
+
+def _chords(chords, seconds=2.0):
+    """Plucked triads with a few harmonics, one chord every `seconds`."""
+    t = np.arange(int(RATE * seconds)) / RATE
+    envelope = np.exp(-3 * (t % 0.5))
+    parts = []
+    for chord in chords:
+        tone = sum(np.sin(2 * np.pi * _midi(n) * h * t) / h for n in chord for h in range(1, 5))
+        parts.append(tone * envelope)
+    signal = np.concatenate(parts)
+    return (signal / np.abs(signal).max() * 0.5).astype(np.float32)
+
+
+def _clicks(bpm, seconds=20):
+    signal = np.zeros(RATE * seconds, dtype=np.float32)
+    t = np.arange(2000) / RATE
+    click = np.sin(2 * np.pi * 1000 * t) * np.exp(-t * 200)
+    for beat in np.arange(0, seconds - 1, 60 / bpm):
+        start = int(beat * RATE)
+        signal[start:start + 2000] += click
+    return signal * 0.5
+
+
+def _stereo(signal):
+    return np.stack([signal, signal * 0.8], axis=1)
+
+
+class TestAnalyzeAudio:
+    def test_key_matches_key_extractor(self, tmp_path):
+        path = str(tmp_path / "music.wav")
+        write_wav(path, _stereo(_chords(A_MINOR * 3)))
+        analysis = analyze_audio(path, block_seconds=5)
+        key, scale, _ = es.KeyExtractor()(es.MonoLoader(filename=path)())
+        assert (analysis["key"]["key"], analysis["key"]["scale"]) == (key, scale) == ("A", "minor")
+        assert 0.0 < analysis["key"]["strength"] <= 1.0
+
+    def test_tempo_and_beats(self, tmp_path):
+        path = str(tmp_path / "music.wav")
+        write_wav(path, _stereo(_clicks(120)))
+        analysis = analyze_audio(path, block_seconds=3)
+        assert abs(analysis["tempo"]["bpm"] - 120) < 1
+        beats = np.array(analysis["tempo"]["beats"])
+        # Beats fall on the clicks, every half second
+        assert np.abs(beats - np.round(beats * 2) / 2).max() < 0.03
+
+    def test_loudness_matches_ebur128(self, tmp_path):
+        path = str(tmp_path / "music.wav")
+        samples = _stereo(_chords([[60, 64, 67], [65, 69, 72]]))
+        write_wav(path, samples)
+        analysis = analyze_audio(path, block_seconds=1)
+        stereo = es.AudioLoader(filename=path)()[0]
+        reference = es.LoudnessEBUR128()(stereo)[2]
+        assert abs(analysis["loudness"]["integrated_lufs"] - reference) < 0.1
+        assert abs(analysis["loudness"]["peak_dbfs"] - 20 * np.log10(0.5)) < 0.01
+
+    def test_block_size_does_not_change_result(self, tmp_path):
+        path = str(tmp_path / "music.wav")
+        write_wav(path, _stereo(_chords([[55, 59, 62], [60, 64, 67]] * 2) + _clicks(100, 8)))
+        small = analyze_audio(path, block_seconds=0.7)
+        large = analyze_audio(path, block_seconds=60)
+        assert small["key"] == large["key"]
+        assert small["tempo"]["beats"] == large["tempo"]["beats"]
+        assert abs(small["loudness"]["integrated_lufs"] - large["loudness"]["integrated_lufs"]) < 1e-3
+
+    def test_silence(self, tmp_path):
+        path = str(tmp_path / "silence.wav")
+        write_wav(path, np.zeros((RATE * 2, 2), dtype=np.float32))
+        analysis = analyze_audio(path)
+        assert analysis["loudness"]["integrated_lufs"] == float("-inf")
+        assert analysis["tempo"]["bpm"] == 0.0
+        assert analysis["duration"] == 2.0
+
+
+class TestFastKey:
+    def test_full_key_matches_key_extractor(self, tmp_path):
+        path = str(tmp_path / "music.wav")
+        write_wav(path, _stereo(_chords(A_MINOR * 2)))
+        key, scale, strength = full_key(path, block_seconds=3)
+        reference = es.KeyExtractor()(es.MonoLoader(filename=path)())
+        assert (key, scale) == reference[:2]
+        assert abs(strength - reference[2]) < 1e-3
+
+    def test_reads_only_excerpts(self, tmp_path):
+        path = str(tmp_path / "music.wav")
+        write_wav(path, _stereo(_chords(A_MINOR * 8)))
+        with patch("demix.analysis.read_wav", wraps=read_wav) as reads:
+            with patch("demix.analysis.full_key") as mock_full:
+                key, scale, _ = fast_key(path, excerpts=4, seconds=2, min_strength=0.3)
+        assert (key, scale) == ("A", "minor")
+        mock_full.assert_not_called()
+        assert [call[0][2] for call in reads.call_args_list] == [2 * RATE] * 4
+
+    def test_falls_back_when_not_confident(self, tmp_path):
+        path = str(tmp_path / "music.wav")
+        write_wav(path, _stereo(_chords(A_MINOR * 8)))
+        with patch("demix.analysis.full_key", return_value=("C", "major", 0.9)) as mock_full:
+            assert fast_key(path, excerpts=4, seconds=2, min_strength=1.01) == ("C", "major", 0.9)
+        mock_full.assert_called_once_with(path)
+
+    def test_short_file_is_analyzed_in_full(self, tmp_path):
+        path = str(tmp_path / "music.wav")
+        write_wav(path, _stereo(_chords(A_MINOR)))
+        with patch("demix.analysis.sampled_key") as mock_sampled:
+            key, scale, _ = fast_key(path, excerpts=8, seconds=2)
+        mock_sampled.assert_not_called()
+        assert (key, scale) == ("A", "minor")
+
+
+def _pitch_classes(notes):
+    """An HPCP frame (bins start at A) with the given pitch classes (0 = C)."""
+    frame = np.zeros(12)
+    for note in notes:
+        frame[(note - 9) % 12] = 1.0
+    return frame
+
+
+class TestKeySegments:
+    def test_modulation(self):
+        c_major = _pitch_classes([0, 2, 4, 5, 7, 9, 11]) + _pitch_classes([0, 4, 7])
+        d_major = _pitch_classes([2, 4, 6, 7, 9, 11, 1]) + _pitch_classes([2, 6, 9])
+        frames = np.array([c_major] * 600 + [d_major] * 400)
+        segments = key_segments(frames, frame_rate=10, window_seconds=10, hop_seconds=2, min_seconds=5)
+        assert [(s["key"], s["scale"]) for s in segments] == [("C", "major"), ("D", "major")]
+        assert segments[0]["start"] == 0.0
+        assert abs(segments[0]["end"] - 60) <= 5
+        assert segments[1]["end"] == 100.0
+        assert all(0.5 < s["strength"] <= 1.0 for s in segments)
+
+    def test_short_segments_are_merged(self):
+        a_minor = _pitch_classes([9, 0, 4]) + 0.5 * _pitch_classes([2, 5, 7, 11])
+        f_major = _pitch_classes([5, 9, 0]) + 0.5 * _pitch_classes([7, 10, 2, 4])
+        frames = np.array([a_minor] * 300 + [f_major] * 40 + [a_minor] * 300)
+        segments = key_segments(frames, frame_rate=10, window_seconds=2, hop_seconds=1, min_seconds=10)
+        assert [(s["key"], s["scale"]) for s in segments] == [("A", "minor")]
+        assert (segments[0]["start"], segments[0]["end"]) == (0.0, 64.0)
+
+    def test_short_input_is_one_window(self):
+        frames = np.array([_pitch_classes([7, 11, 2])] * 20)
+        segments = key_segments(frames, frame_rate=10, window_seconds=30)
+        assert len(segments) == 1
+        assert segments[0]["key"] == "G"
+
+    def test_empty(self):
+        assert key_segments(np.zeros((0, 12)), frame_rate=10) == []
+
+    def test_key_timeline_of_audio(self, tmp_path):
+        path = str(tmp_path / "music.wav")
+        write_wav(path, _stereo(np.concatenate([_chords(A_MINOR * 6), _chords(E_MAJOR * 6)])))
+        segments = key_timeline(path)
+        assert [(s["key"], s["scale"]) for s in segments] == [("A", "minor"), ("E", "major")]
+        assert abs(segments[0]["end"] - 48) < 10
+
+
+class TestKeyProfiles:
+    def test_all_profiles_on_one_hpcp(self):
+        signal = _chords(A_MINOR * 2)
+        results = estimate_keys(signal_hpcp(signal, RATE), KEY_PROFILES)
+        assert list(results) == KEY_PROFILES
+        assert results["bgate"][:2] == ("A", "minor")
+        assert sum(result[:2] == ("A", "minor") for result in results.values()) >= len(KEY_PROFILES) - 2
+
+    def test_signal_hpcp_matches_streamed_hpcp(self, tmp_path):
+        path = str(tmp_path / "music.wav")
+        samples = _stereo(_chords(A_MINOR))
+        write_wav(path, samples)
+        mono = read_wav(path)[0].mean(axis=1)
+        np.testing.assert_allclose(signal_hpcp(mono, RATE, chunk_seconds=1.3), signal_hpcp(mono, RATE), atol=1e-5)
+        assert full_key(path) == estimate_keys(signal_hpcp(mono, RATE), ["bgate"])["bgate"]
+
+    def test_every_key_path_matches_key_extractor(self, tmp_path):
+        path = str(tmp_path / "music.wav")
+        write_wav(path, _stereo(_chords(E_MAJOR * 2)))
+        mono = es.MonoLoader(filename=path)()
+        reference = es.KeyExtractor()(mono)
+        for key, scale, strength in (
+            estimate_keys(signal_hpcp(mono, RATE), ["bgate"])["bgate"],
+            full_key(path),
+            tuple(analyze_audio(path)["key"].values()),
+        ):
+            assert (key, scale) == reference[:2]
+            assert abs(strength - reference[2]) < 5e-3
+
+    def test_consensus_is_strength_weighted_vote(self):
+        results = {
+            "bgate": ("A", "minor", 0.9),
+            "edma": ("C", "major", 0.6),
+            "temperley": ("C", "major", 0.5),
+            "krumhansl": ("A", "minor", 0.8),
+        }
+        key, scale, strength = key_consensus(results)
+        assert (key, scale) == ("A", "minor")
+        assert abs(strength - 1.7 / 4) < 1e-9
+
+    def test_parse(self):
+        assert parse_key_profiles("bgate, edma") == ["bgate", "edma"]
+        assert parse_key_profiles("all") == KEY_PROFILES
+        with pytest.raises(ValueError, match="Unknown key profile: major"):
+            parse_key_profiles("bgate,major")
+        with pytest.raises(ValueError):
+            parse_key_profiles(",")
+
+
+class TestTransposeKey:
+    def test_up_and_down(self):
+        assert transpose_key("C", 3) == "Eb"
+        assert transpose_key("A", -2) == "G"
+        assert transpose_key("B", 1) == "C"
+        assert transpose_key("F#", 12) == "F#"
+
+    def test_enharmonic_input(self):
+        assert transpose_key("G#", 2) == "Bb"
+
+    def test_matches_detection_of_transposed_audio(self, tmp_path):
+        path = str(tmp_path / "music.wav")
+        # A minor progression shifted up 3 semitones
+        write_wav(path, _stereo(_chords([[60, 63, 67], [65, 68, 72], [67, 71, 74], [60, 63, 67]] * 3)))
+        analysis = analyze_audio(path)
+        assert (analysis["key"]["key"], analysis["key"]["scale"]) == (transpose_key("A", 3), "minor")
+
+    def test_unknown_key(self):
+        with pytest.raises(ValueError):
+            transpose_key("H", 1)
+
+
+class TestKeyExcerpt:
+    def test_middle_of_audio(self):
+        assert key_excerpt(100, 30) == (35.0, 65.0)
+
+    def test_short_audio(self):
+        assert key_excerpt(20, 30) == (0.0, 20)
+
+
+class TestGatedLoudness:
+    def test_quiet_blocks_are_gated(self):
+        loud = [0.1] * 10
+        assert abs(gated_loudness(loud + [1e-9] * 100) - gated_loudness(loud)) < 1e-9
+
+    def test_empty(self):
+        assert gated_loudness([]) == float("-inf")
+
+
+class TestLoudnessMeter:
+    def test_peak(self):
+        meter = LoudnessMeter(RATE, 2)
+        meter.process(np.array([[0.25, -0.5]] * 10, dtype=np.float32))
+        assert meter.peak_db() == 20 * np.log10(0.5)
+
+
+class TestStemLoudnessMeter:
+    def test_matches_single_meters(self):
+        t = np.arange(RATE * 5) / RATE
+        stems = np.stack([
+            _stereo(0.3 * np.sin(2 * np.pi * 220 * t)),
+            _stereo(0.1 * np.sin(2 * np.pi * 3000 * t)),
+        ]).astype(np.float32)
+        meter = StemLoudnessMeter(RATE, 2, 2)
+        for i in range(0, stems.shape[1], RATE):
+            meter.process(stems[:, i:i + RATE])
+        for stem, loudness, peak in zip(stems, meter.integrated(), meter.peaks_db()):
+            single = LoudnessMeter(RATE, 2)
+            single.process(stem)
+            assert loudness == pytest.approx(single.integrated(), abs=1e-6)
+            assert peak == pytest.approx(single.peak_db())
+
+
+class TestNormalizationGains:
+    @pytest.fixture
+    def stems(self, tmp_path):
+        t = np.arange(RATE * 5) / RATE
+        vocals = _stereo(0.2 * np.sin(2 * np.pi * 440 * t))
+        drums = _stereo(0.05 * np.sin(2 * np.pi * 110 * t))
+        write_wav(str(tmp_path / "vocals.wav"), vocals)
+        write_wav(str(tmp_path / "drums.wav"), drums)
+        write_wav(str(tmp_path / "silence.wav"), np.zeros_like(vocals))
+        write_wav(str(tmp_path / "music.wav"), vocals + drums)
+        files = {name: str(tmp_path / f"{name}.wav") for name in ("vocals", "drums", "silence")}
+        return files, str(tmp_path / "music.wav")
+
+    def _loudness(self, path, gain_db=0.0):
+        meter = LoudnessMeter(RATE, 2)
+        meter.process(read_wav(path)[0] * 10 ** (gain_db / 20))
+        return meter.integrated()
+
+    def test_common_gain_keeps_balance(self, stems):
+        files, mix = stems
+        gains, mix_gain = normalization_gains(files, mix, -30)
+        assert set(gains.values()) == {mix_gain}
+        assert self._loudness(mix, mix_gain) == pytest.approx(-30, abs=0.01)
+
+    def test_per_stem_gains(self, stems):
+        files, mix = stems
+        gains, mix_gain = normalization_gains(files, mix, -30, per_stem=True)
+        assert self._loudness(files["vocals"], gains["vocals"]) == pytest.approx(-30, abs=0.01)
+        assert self._loudness(files["drums"], gains["drums"]) == pytest.approx(-30, abs=0.01)
+        assert gains["silence"] == 0.0
+        assert self._loudness(mix, mix_gain) == pytest.approx(-30, abs=0.01)
+
+    def test_gain_limited_by_peak(self, stems):
+        files, mix = stems
+        _, mix_gain = normalization_gains(files, mix, 0)
+        peak = np.abs(read_wav(mix)[0]).max()
+        assert mix_gain == pytest.approx(-20 * np.log10(peak), abs=0.01)
+
+
+class TestSpectralFrames:
+    def test_frames_span_blocks(self):
+        signal = np.random.default_rng(0).standard_normal(20000).astype(np.float32)
+        whole = SpectralFrames(256, 64).spectra(signal)
+        framer = SpectralFrames(256, 64)
+        pieces = [framer.spectra(signal[i:i + 1000]) for i in range(0, len(signal), 1000)]
+        np.testing.assert_allclose(np.concatenate(pieces), whole, atol=1e-3)
+
+    def test_final_pads_last_frame(self):
+        framer = SpectralFrames(256, 64)
+        assert len(framer.spectra(np.ones(100, dtype=np.float32))) == 0
+        assert len(framer.spectra(np.zeros(0, dtype=np.float32), final=True)) == 1
+
+
+class TestWriteSidecar:
+    def test_infinite_levels_become_null(self, tmp_path):
+        path = str(tmp_path / "analysis.json")
+        write_sidecar(path, {"loudness": {"integrated_lufs": float("-inf"), "peak_dbfs": -3.0}})
+        with open(path) as f:
+            assert json.load(f) == {"loudness": {"integrated_lufs": None, "peak_dbfs": -3.0}}
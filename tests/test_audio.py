@@ -0,0 +1,175 @@
+import os
+import sys
+import tempfile
+import wave
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+# Add src directory to path for development usage
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import (  # noqa: E402
+    iter_decoded_blocks,
+    iter_pcm_blocks,
+    iter_stem_blocks,
+    iter_wav_blocks,
+    read_wav,
+    to_int16,
+    wav_info,
+    write_interleaved_wav,
+    write_wav,
+)
+
+
+class TestWavRoundTrip:
+    def test_write_and_read_stereo(self):
+        t = np.arange(4410) / 44100
+        samples = np.stack([np.sin(2 * np.pi * 440 * t), 0.5 * np.cos(2 * np.pi * 220 * t)], axis=1)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "sub", "tone.wav")
+            write_wav(path, samples, 44100)
+            result, rate = read_wav(path)
+        assert rate == 44100
+        assert result.shape == (4410, 2)
+        assert result.dtype == np.float32
+        np.testing.assert_allclose(result, samples, atol=1e-4)
+
+    def test_read_range(self):
+        samples = np.linspace(-1, 1, 1000).reshape(-1, 2)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "ramp.wav")
+            write_wav(path, samples, 8000)
+            result, _ = read_wav(path, start=100, frames=50)
+            assert wav_info(path) == (500, 8000, 2)
+        np.testing.assert_allclose(result, samples[100:150], atol=1e-4)
+
+    def test_write_mono_vector(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "mono.wav")
+            write_wav(path, np.zeros(10), 44100)
+            assert wav_info(path) == (10, 44100, 1)
+
+    def test_read_24bit(self):
+        values = np.array([0, 1 << 22, -(1 << 22), (1 << 23) - 1], dtype=np.int32)
+        raw = b"".join(int(v & 0xFFFFFF).to_bytes(3, "little") for v in values)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "hi.wav")
+            with wave.open(path, "wb") as w:
+                w.setnchannels(1)
+                w.setsampwidth(3)
+                w.setframerate(48000)
+                w.writeframes(raw)
+            result, rate = read_wav(path)
+        assert rate == 48000
+        np.testing.assert_allclose(result[:, 0], [0.0, 0.5, -0.5, 1.0], atol=1e-6)
+
+
+class TestToInt16:
+    def test_clips_out_of_range(self):
+        result = to_int16(np.array([2.0, -2.0, 0.0]))
+        assert result.tolist() == [32767, -32767, 0]
+
+    def test_unsupported_width(self):
+        from demix.audio import _decode_frames
+        with pytest.raises(ValueError):
+            _decode_frames(b"\x00" * 5, 5, 1)
+
+
+class TestIterWavBlocks:
+    def test_blocks_cover_file(self):
+        samples = np.linspace(-1, 1, 2000).reshape(-1, 2)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "ramp.wav")
+            write_wav(path, samples)
+            blocks = list(iter_wav_blocks(path, 300))
+        assert [len(block) for block in blocks] == [300, 300, 300, 100]
+        np.testing.assert_allclose(np.concatenate(blocks), samples, atol=1e-4)
+
+
+class TestIterStemBlocks:
+    def test_lockstep_with_padding(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            long_path = os.path.join(tmpdir, "vocals.wav")
+            short_path = os.path.join(tmpdir, "drums.wav")
+            write_wav(long_path, np.full((500, 2), 0.5))
+            write_wav(short_path, np.full((350, 2), -0.25))
+            blocks = list(iter_stem_blocks([long_path, short_path], 200))
+        assert [block.shape for block in blocks] == [(2, 200, 2), (2, 200, 2), (2, 100, 2)]
+        stems = np.concatenate(blocks, axis=1)
+        np.testing.assert_allclose(stems[0], 0.5, atol=1e-4)
+        np.testing.assert_allclose(stems[1, :350], -0.25, atol=1e-4)
+        assert not stems[1, 350:].any()
+
+    def test_mismatched_rates(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = [os.path.join(tmpdir, "a.wav"), os.path.join(tmpdir, "b.wav")]
+            write_wav(paths[0], np.zeros((10, 2)), 44100)
+            write_wav(paths[1], np.zeros((10, 2)), 22050)
+            with pytest.raises(ValueError):
+                iter_stem_blocks(paths, 100)
+
+
+class TestIterPcmBlocks:
+    def test_blocks_and_partial_frame(self):
+        pcm = to_int16(np.full((250, 2), 0.5)).tobytes() + b"\x01"
+        blocks = list(iter_pcm_blocks(BytesIO(pcm), 100))
+        assert [len(block) for block in blocks] == [100, 100, 50]
+        np.testing.assert_allclose(blocks[-1], 0.5, atol=1e-4)
+
+
+class TestWriteInterleavedWav:
+    def test_to_a_pipe(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = [os.path.join(tmpdir, "vocals.wav"), os.path.join(tmpdir, "drums.wav")]
+            write_wav(paths[0], np.full((300, 2), 0.5))
+            write_wav(paths[1], np.full((200, 2), 0.4))
+            read_fd, write_fd = os.pipe()
+            # A pipe can't seek, so the header has to be right from the start
+            with os.fdopen(write_fd, "wb") as pipe:
+                write_interleaved_wav(paths, pipe, [1.0, 0.5], block_frames=128)
+            with os.fdopen(read_fd, "rb") as pipe:
+                samples, rate = read_wav(BytesIO(pipe.read()))
+        assert rate == 44100
+        assert samples.shape == (300, 4)
+        np.testing.assert_allclose(samples[:, :2], 0.5, atol=1e-4)
+        np.testing.assert_allclose(samples[:200, 2:], 0.2, atol=1e-4)
+        assert not samples[200:, 2:].any()
+
+
+def _ffmpeg(pcm, returncode=0, error=b""):
+    process = MagicMock()
+    process.stdout = BytesIO(pcm)
+    process.stderr = BytesIO(error)
+    process.wait.return_value = returncode
+    return process
+
+
+class TestIterDecodedBlocks:
+    @patch("demix.audio.subprocess.Popen")
+    def test_streams_pcm_from_ffmpeg(self, mock_popen):
+        pcm = to_int16(np.full((1000, 2), 0.25)).tobytes()
+        mock_popen.return_value = _ffmpeg(pcm)
+        blocks = list(iter_decoded_blocks("song.mp3", 400))
+        assert [block.shape for block in blocks] == [(400, 2), (400, 2), (200, 2)]
+        np.testing.assert_allclose(blocks[0], 0.25, atol=1e-4)
+        cmd = mock_popen.call_args[0][0]
+        assert cmd[:5] == ["ffmpeg", "-v", "error", "-i", "song.mp3"]
+        assert cmd[-1] == "-"
+
+    @patch("demix.audio.subprocess.Popen")
+    def test_decode_error(self, mock_popen):
+        mock_popen.return_value = _ffmpeg(b"", returncode=1, error=b"Invalid data found")
+        with pytest.raises(RuntimeError, match="Invalid data found"):
+            list(iter_decoded_blocks("broken.mp3", 400))
+
+    @patch("demix.audio.subprocess.Popen")
+    def test_early_close_stops_ffmpeg(self, mock_popen):
+        process = _ffmpeg(to_int16(np.zeros((1000, 2))).tobytes(), returncode=-9)
+        mock_popen.return_value = process
+        blocks = iter_decoded_blocks("song.mp3", 100)
+        next(blocks)
+        blocks.close()
+        process.kill.assert_called_once()
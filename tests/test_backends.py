@@ -0,0 +1,124 @@
+import os
+import sys
+import tempfile
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+# Add src directory to path for development usage
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import read_wav, write_wav  # noqa: E402
+from demix.backends import (  # noqa: E402
+    BACKENDS,
+    SeparationBackend,
+    get_backend,
+    register_backend,
+)
+
+
+def _mix(frames=1000):
+    rng = np.random.default_rng(0)
+    return (rng.uniform(-0.5, 0.5, (frames, 2))).astype(np.float32)
+
+
+class TestRegistry:
+    def test_builtin_backends_registered(self):
+        assert {"spleeter", "spleeter-tf", "passthrough"} <= set(BACKENDS)
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError) as excinfo:
+            get_backend("nope")
+        assert "Unknown separation backend: nope" in str(excinfo.value)
+
+    def test_get_backend_returns_shared_instance(self):
+        assert get_backend("passthrough") is get_backend("passthrough")
+
+    def test_register_custom_backend(self):
+        @register_backend
+        class VocalsOnly(SeparationBackend):
+            name = "test-vocals-only"
+            modes = {"2stems": ["vocals", "accompaniment"]}
+
+            def separate(self, audio, mode, quality="standard"):
+                return {"vocals": audio, "accompaniment": np.zeros_like(audio)}
+
+        try:
+            backend = get_backend("test-vocals-only")
+            assert backend.supports("2stems")
+            assert not backend.supports("4stems")
+        finally:
+            del BACKENDS["test-vocals-only"]
+
+
+class TestPassthroughBackend:
+    def test_stems_sum_to_mix(self):
+        mix = _mix()
+        stems = get_backend("passthrough").separate(mix, "4stems")
+        assert list(stems) == ["vocals", "drums", "bass", "other"]
+        np.testing.assert_allclose(sum(stems.values()), mix, atol=1e-6)
+
+    def test_separate_to_files(self):
+        mix = _mix()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_file = os.path.join(tmpdir, "music.wav")
+            write_wav(input_file, mix, 22050)
+            get_backend("passthrough").separate_to_files(input_file, os.path.join(tmpdir, "out"), "2stems")
+            vocals, rate = read_wav(os.path.join(tmpdir, "out", "vocals.wav"))
+        assert rate == 22050
+        np.testing.assert_allclose(vocals, mix / 2, atol=1e-4)
+
+
+class TestSpleeterCLIBackend:
+    @patch("demix.backends.subprocess.run")
+    def test_separate_to_files_runs_cli(self, mock_run):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            get_backend("spleeter").separate_to_files("/input/music.wav", tmpdir, "5stems", "high")
+        args = mock_run.call_args[0][0]
+        assert args[:2] == ["spleeter", "separate"]
+        assert "spleeter:5stems-16kHz" in args
+        assert args[-1] == "/input/music.wav"
+
+    @patch("demix.backends.subprocess.run")
+    def test_separate_array_round_trips_through_files(self, mock_run):
+        mix = _mix()
+
+        def fake_cli(cmd, **kwargs):
+            output_folder = cmd[cmd.index("-o") + 1]
+            samples, rate = read_wav(cmd[-1])
+            write_wav(os.path.join(output_folder, "vocals.wav"), samples, rate)
+            write_wav(os.path.join(output_folder, "accompaniment.wav"), samples * 0, rate)
+
+        mock_run.side_effect = fake_cli
+        stems = get_backend("spleeter").separate(mix, "2stems")
+        np.testing.assert_allclose(stems["vocals"], mix, atol=1e-4)
+        assert not stems["accompaniment"].any()
+
+
+class TestSpleeterBackend:
+    def test_separator_is_loaded_once(self):
+        backend = BACKENDS["spleeter-tf"]()
+        separator = MagicMock()
+        separator.separate.side_effect = lambda waveform: {
+            "vocals": waveform, "accompaniment": np.zeros_like(waveform)
+        }
+        separator_module = MagicMock()
+        separator_module.Separator.return_value = separator
+        with patch.dict(sys.modules, {"spleeter": MagicMock(), "spleeter.separator": separator_module}):
+            backend.separate(_mix(), "2stems")
+            stems = backend.separate(_mix(), "2stems")
+        separator_module.Separator.assert_called_once_with("spleeter:2stems", multiprocess=False)
+        assert stems["vocals"].dtype == np.float32
+
+
+class TestOnnxBackend:
+    @patch("demix.backends.load_separator")
+    def test_separator_loaded_once_per_configuration(self, mock_load):
+        mock_load.return_value.separate.side_effect = lambda samples: {"vocals": samples}
+        backend = BACKENDS["onnx"]()
+        backend.configure(threads=2)
+        backend.separate(_mix(), "2stems")
+        stems = backend.separate(_mix(), "2stems")
+        mock_load.assert_called_once_with("2stems", "standard", 2)
+        np.testing.assert_allclose(stems["vocals"], _mix())
@@ -1,3 +1,4 @@
+import json
 import os
 import sys
 import tempfile
@@ -18,16 +19,64 @@ from demix import (  # noqa: E402
     remove_dir,
     clean,
     convert_wav_to_mp3,
+    encode_audio,
+    export_audio,
+    publish_wav,
     convert_to_wav,
+    decode_source,
     separate_audio,
     detect_key,
+    detect_key_profiles,
     download_video,
     create_empty_mkv_with_audio,
+    mux_tracks,
+    parse_stem_effects,
+    parse_stdout_stems,
+    job_slug,
     check_ffmpeg,
     search_youtube,
     _resolve_search,
     main,
 )
+# Bound before fixed_workdir patches the module attribute
+from demix.cli import _create_workdir, _publish_outputs, _replace_dir, publish_file  # noqa: E402
+from demix.cli import _output_settings, _resolve_stems  # noqa: E402
+
+
+# Scratch directory of main() jobs in the tests, see fixed_workdir
+WORK = "work"
+
+
+def _slug(argv=None):
+    """Return the output subdirectory of a job run with `argv` (default: the patched sys.argv)."""
+    with patch.object(sys, "argv", list(argv or sys.argv)):
+        args = parse_args()
+    mode, stems = _resolve_stems(args)
+    return job_slug(args.url, args.file, parse_time(args.start), parse_time(args.end),
+                    _output_settings(args, mode, stems))
+
+
+@pytest.fixture(autouse=True, scope="module")
+def isolated_cwd(tmp_path_factory):
+    """Run the tests in a scratch directory so that outputs don't land in the repo."""
+    workdir = tmp_path_factory.mktemp("cwd")
+    # main() tests mock os.makedirs, so the default output directory has to exist up front
+    (workdir / "output").mkdir()
+    original_cwd = os.getcwd()
+    os.chdir(workdir)
+    yield workdir
+    os.chdir(original_cwd)
+
+
+@pytest.fixture(autouse=True)
+def fixed_workdir():
+    """Run jobs in ./work instead of a random scratch directory, so that tests can check its paths."""
+    for sub in ("wav", "mp3", "stems"):
+        os.makedirs(os.path.join(WORK, "music", sub), exist_ok=True)
+    # Keep the decoded-PCM cache of the jobs out of the user's cache directory
+    with patch("demix.cli._create_workdir", return_value=WORK), \
+            patch("demix.paths.CACHE_DIR", os.path.abspath("cache")):
+        yield WORK
 
 
 class TestVersion:
@@ -109,6 +158,37 @@ class TestFormatTime:
         assert result == "0:00.00"
 
 
+class TestJobSlug:
+    def test_file(self):
+        slug = job_slug(file="/music/My Song (Live).mp3")
+        assert slug.startswith("my-song-live-")
+        assert slug == job_slug(file="/music/My Song (Live).mp3")
+
+    def test_youtube_url(self):
+        assert job_slug(url="https://www.youtube.com/watch?v=dQw4w9WgXcQ").startswith("dqw4w9wgxcq-")
+        assert job_slug(url="https://youtu.be/dQw4w9WgXcQ").startswith("dqw4w9wgxcq-")
+
+    def test_cut_changes_hash(self):
+        assert job_slug(file="song.mp3") != job_slug(file="song.mp3", start_time=30)
+
+    def test_same_name_in_different_folders(self):
+        assert job_slug(file="/a/song.mp3") != job_slug(file="/b/song.mp3")
+
+    @pytest.mark.parametrize("options", [
+        ["-m", "4stems"], ["--stems", "vocals"], ["--format", "wav"], ["-q", "high"], ["-t", "0.9"],
+        ["-p", "2"], ["-b", "passthrough"], ["--normalize", "-14"], ["--keep-wav"],
+    ])
+    def test_options_change_hash(self, options):
+        assert _slug(["demix", "-f", "song.mp3"]) != _slug(["demix", "-f", "song.mp3"] + options)
+
+    def test_options_without_effect_on_the_outputs(self):
+        assert _slug(["demix", "-f", "song.mp3"]) == _slug(["demix", "-f", "song.mp3", "-k", "--preview", "20"])
+
+    def test_stdin_is_unique(self):
+        assert job_slug(file="-").startswith("stdin-")
+        assert job_slug(file="-") != job_slug(file="-")
+
+
 class TestParseArgs:
     def test_url_argument(self):
         with patch.object(sys, "argv", ["demix", "-u", "https://youtube.com/watch?v=test"]):
@@ -343,10 +423,13 @@ class TestClean:
             try:
                 os.chdir(tmpdir)
                 models_dir = os.path.join(tmpdir, "pretrained_models")
+                onnx_dir = os.path.join(tmpdir, "data", "onnx")
                 os.makedirs(models_dir)
-                assert os.path.exists(models_dir)
-                clean("models")
+                os.makedirs(onnx_dir)
+                with patch("demix.cli.DATA_DIR", os.path.join(tmpdir, "data")):
+                    clean("models")
                 assert not os.path.exists(models_dir)
+                assert not os.path.exists(onnx_dir)
             finally:
                 os.chdir(original_cwd)
 
@@ -357,14 +440,41 @@ class TestClean:
                 os.chdir(tmpdir)
                 output_dir = os.path.join(tmpdir, "output")
                 models_dir = os.path.join(tmpdir, "pretrained_models")
+                cache_dir = os.path.join(tmpdir, "cache")
                 os.makedirs(output_dir)
                 os.makedirs(models_dir)
-                clean("all", output_dir)
+                os.makedirs(cache_dir)
+                with patch("demix.cli.CACHE_DIR", cache_dir), \
+                        patch("demix.cli.DATA_DIR", os.path.join(tmpdir, "data")):
+                    clean("all", output_dir)
                 assert not os.path.exists(output_dir)
                 assert not os.path.exists(models_dir)
+                assert not os.path.exists(cache_dir)
             finally:
                 os.chdir(original_cwd)
 
+    def test_clean_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_dir = os.path.join(tmpdir, "cache")
+            os.makedirs(cache_dir)
+            onnx_dir = os.path.join(tmpdir, "data", "onnx")
+            os.makedirs(onnx_dir)
+            with patch("demix.cli.CACHE_DIR", cache_dir), patch("demix.cli.DATA_DIR", os.path.join(tmpdir, "data")):
+                clean("cache")
+            assert not os.path.exists(cache_dir)
+            # Exported models need TensorFlow to rebuild, they are not cache
+            assert os.path.exists(onnx_dir)
+
+    def test_clean_cache_keeps_library_index(self, tmp_path):
+        from demix.scan import default_index_path, open_index
+        with patch("demix.paths.CACHE_DIR", str(tmp_path / "cache")), \
+                patch("demix.paths.DATA_DIR", str(tmp_path / "data")), \
+                patch("demix.cli.CACHE_DIR", str(tmp_path / "cache")):
+            open_index(default_index_path()).close()
+            index = default_index_path()
+            clean("cache")
+        assert os.path.exists(index)
+
 
 class TestConvertWavToMp3:
     @patch("demix.cli.subprocess.run")
@@ -536,6 +646,59 @@ class TestConvertToWav:
         assert to_index < i_index
 
 
+class TestDecodeSource:
+    def _cache(self, tmp_path, seconds=3):
+        """Put a decoded source in the cache; returns its path and PCM."""
+        import numpy as np
+        from demix.pcmcache import content_hash, pcm_path
+        source = tmp_path / "song.mp3"
+        source.write_bytes(b"compressed audio")
+        pcm = np.arange(44100 * seconds * 2, dtype="<i2").reshape(-1, 2)
+        np.save(pcm_path(content_hash(str(source))), pcm)
+        return str(source), pcm
+
+    @patch("demix.cli.convert_to_wav")
+    def test_cut_from_cache(self, mock_convert, tmp_path):
+        import numpy as np
+        import wave
+        source, pcm = self._cache(tmp_path)
+        output = str(tmp_path / "music.wav")
+        assert decode_source(source, output, start_time=1, end_time=2.5) is True
+        mock_convert.assert_not_called()
+        with wave.open(output, "rb") as w:
+            assert w.getframerate() == 44100
+            frames = np.frombuffer(w.readframes(w.getnframes()), "<i2").reshape(-1, 2)
+        np.testing.assert_array_equal(frames, pcm[44100:110250])
+
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.pcmcache.probe_duration", return_value=300.0)
+    @patch("demix.pcmcache.decode_pcm")
+    def test_short_cut_decoded_on_its_own(self, mock_decode, mock_probe, mock_convert, tmp_path):
+        source = tmp_path / "song.mp3"
+        # Content no other test puts in the cache
+        source.write_bytes(b"audio that is not cached")
+        assert decode_source(str(source), "music.wav", 60, 90) is False
+        mock_decode.assert_not_called()
+        mock_convert.assert_called_once_with(str(source), "music.wav", 60, 90)
+
+    @patch("demix.cli.convert_to_wav")
+    def test_disabled(self, mock_convert, tmp_path):
+        source, _ = self._cache(tmp_path)
+        assert decode_source(source, "music.wav", 30, None, use_cache=False) is False
+        mock_convert.assert_called_once_with(source, "music.wav", 30, None)
+
+    @patch("demix.cli.convert_to_wav")
+    def test_stdin_is_not_cached(self, mock_convert):
+        assert decode_source("-", "music.wav") is False
+        mock_convert.assert_called_once_with("-", "music.wav", None, None)
+
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.cached_pcm", side_effect=RuntimeError("ffmpeg could not decode song.mp3"))
+    def test_falls_back_to_ffmpeg(self, mock_cached, mock_convert):
+        assert decode_source("song.mp3", "music.wav", 10) is False
+        mock_convert.assert_called_once_with("song.mp3", "music.wav", 10, None)
+
+
 class TestSeparateAudio:
     @patch("demix.cli.subprocess.run")
     @patch("demix.cli.os.makedirs")
@@ -566,13 +729,18 @@ class TestSeparateAudio:
 
 
 class TestDownloadVideo:
+    @patch("demix.cli.partial_download_path", return_value="/cache/downloads/test-140.mp4.part")
+    @patch("demix.cli.download_resumable")
     @patch("demix.cli.YouTube")
     @patch("demix.cli.os.makedirs")
-    def test_download_video(self, mock_makedirs, mock_youtube):
+    def test_download_video(self, mock_makedirs, mock_youtube, mock_download, mock_part_path):
         mock_stream = MagicMock()
         mock_stream.mime_type = "audio/mp4"
-        mock_stream.download.return_value = None
+        mock_stream.itag = 140
+        mock_stream.url = "https://media.example/audio"
+        mock_stream.filesize = 1234
         mock_yt = MagicMock()
+        mock_yt.video_id = "test"
         mock_yt.streams.filter.return_value.order_by.return_value.desc.return_value.first.return_value = mock_stream
         mock_youtube.return_value = mock_yt
 
@@ -582,6 +750,31 @@ class TestDownloadVideo:
         mock_youtube.assert_called_once_with("https://youtube.com/watch?v=test")
         assert result == "/output/video.mp4"
 
+    @patch("demix.cli.partial_download_path", return_value="/cache/downloads/test-140.mp4.part")
+    @patch("demix.cli.download_resumable")
+    @patch("demix.cli.YouTube")
+    @patch("demix.cli.os.makedirs")
+    def test_download_video_uses_partial_file_outside_output(
+        self, mock_makedirs, mock_youtube, mock_download, mock_part_path
+    ):
+        mock_stream = MagicMock()
+        mock_stream.mime_type = "audio/webm"
+        mock_stream.itag = 251
+        mock_stream.url = "https://media.example/audio"
+        mock_stream.filesize = 1234
+        mock_yt = MagicMock()
+        mock_yt.video_id = "abc"
+        mock_yt.streams.filter.return_value.order_by.return_value.desc.return_value.first.return_value = mock_stream
+        mock_youtube.return_value = mock_yt
+
+        download_video("https://youtube.com/watch?v=abc", "/output")
+
+        mock_part_path.assert_called_once_with("abc-251.webm")
+        mock_download.assert_called_once_with(
+            "https://media.example/audio", "/output/video.webm",
+            "/cache/downloads/test-140.mp4.part", expected_size=1234
+        )
+
 
 class TestSearchYoutube:
     @patch("demix.cli.Search")
@@ -1129,6 +1322,33 @@ class TestDetectKey:
         assert scale == "major"
         assert strength == 0.91
 
+    @patch("demix.cli.es.KeyExtractor")
+    @patch("demix.cli.es.EasyLoader")
+    @patch("demix.cli.es.MonoLoader")
+    def test_detect_key_excerpt(self, mock_mono_loader, mock_easy_loader, mock_key_extractor):
+        mock_key_extractor.return_value = MagicMock(return_value=("D", "minor", 0.6))
+
+        assert detect_key("/path/to/audio.mp3", 60.0, 90.0) == ("D", "minor", 0.6)
+        mock_easy_loader.assert_called_once_with(filename="/path/to/audio.mp3", startTime=60.0, endTime=90.0)
+        mock_mono_loader.assert_not_called()
+
+    @patch("demix.cli.es.KeyExtractor")
+    @patch("demix.cli.signal_hpcp", return_value="hpcp")
+    @patch("demix.cli.estimate_keys", return_value={
+        "bgate": ("A", "minor", 0.9), "edma": ("C", "major", 0.5), "temperley": ("A", "minor", 0.7)
+    })
+    @patch("demix.cli.es.MonoLoader")
+    def test_detect_key_profiles(self, mock_mono_loader, mock_estimate, mock_hpcp, mock_key_extractor):
+        mock_mono_loader.return_value = MagicMock(return_value="audio")
+
+        results, consensus = detect_key_profiles("/path/to/audio.wav", ["bgate", "edma", "temperley"])
+
+        mock_hpcp.assert_called_once_with("audio", 44100)
+        mock_estimate.assert_called_once_with("hpcp", ["bgate", "edma", "temperley"])
+        mock_key_extractor.assert_not_called()
+        assert results["edma"] == ("C", "major", 0.5)
+        assert consensus[:2] == ("A", "minor")
+
 
 class TestMainWithKeyDetection:
     @patch("demix.cli.detect_key", return_value=("G", "major", 0.88))
@@ -1206,13 +1426,94 @@ class TestMainWithKeyDetection:
         self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
         mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_detect_key, capsys
     ):
-        """Key detection should run twice when -k and -p are both specified."""
+        """The key after transpose is derived from the original key without a second detection."""
         main()
-        # Should be called twice: once for original, once after transpose
-        assert mock_detect_key.call_count == 2
+        mock_detect_key.assert_called_once()
         captured = capsys.readouterr()
         assert "Detected key: C major" in captured.out
-        assert "Detected key (after transpose): C major" in captured.out
+        assert "Detected key (after transpose): Eb major" in captured.out
+
+    @patch("demix.cli.wav_info", return_value=(44100 * 200, 44100, 2))
+    @patch("demix.cli.detect_key", side_effect=[("C", "major", 0.75), ("Eb", "major", 0.7)])
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "-k", "-p", "3", "-t", "0.5", "--verify-key"])
+    def test_main_verify_key_uses_excerpt(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_detect_key, mock_info, capsys
+    ):
+        main()
+        # 200 s at half tempo is 400 s, the excerpt is the middle 30 s
+        mock_detect_key.assert_called_with(os.path.join(WORK, "music", "music_modified.mp3"), 185.0, 215.0)
+        captured = capsys.readouterr()
+        assert "Detected key (after transpose): Eb major" in captured.out
+        assert "Excerpt analysis" not in captured.out
+
+    @patch("demix.cli.wav_info", return_value=(44100 * 10, 44100, 2))
+    @patch("demix.cli.detect_key", side_effect=[("A", "minor", 0.8), ("E", "minor", 0.4)])
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "-k", "-p", "-2", "--verify-key"])
+    def test_main_verify_key_reports_mismatch(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_detect_key, mock_info, capsys
+    ):
+        main()
+        captured = capsys.readouterr()
+        assert "Excerpt analysis after transpose found E minor (confidence: 40%)" in captured.out
+        assert "Detected key (after transpose): G minor" in captured.out
+
+    @patch("demix.cli.fast_key", return_value=("D", "major", 0.8))
+    @patch("demix.cli.detect_key")
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "-k", "--fast-key"])
+    def test_main_fast_key(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_detect_key, mock_fast_key, capsys
+    ):
+        main()
+        mock_fast_key.assert_called_once_with(os.path.join(WORK, "music", "wav", "music.wav"))
+        mock_detect_key.assert_not_called()
+        captured = capsys.readouterr()
+        assert "Detected key: D major (confidence: 80%)" in captured.out
+
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--fast-key"])
+    def test_fast_key_requires_key(self, mock_isfile, mock_check, capsys):
+        main()
+        captured = capsys.readouterr()
+        assert "Error: --fast-key requires --key" in captured.out
+
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--verify-key"])
+    def test_verify_key_requires_key(self, mock_isfile, mock_check, capsys):
+        main()
+        captured = capsys.readouterr()
+        assert "Error: --verify-key requires --key" in captured.out
 
     @patch("demix.cli.detect_key", return_value=("A", "minor", 0.80))
     @patch("demix.cli.create_empty_mkv_with_audio")
@@ -1235,3 +1536,1268 @@ class TestMainWithKeyDetection:
         mock_detect_key.assert_called_once()
         captured = capsys.readouterr()
         assert "after transpose" not in captured.out
+
+
+class TestSkipSilence:
+    def test_skip_silence_default_false(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3"]):
+            args = parse_args()
+            assert args.skip_silence is False
+            assert args.silence_threshold == -50.0
+
+    def test_skip_silence_with_threshold(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3", "--skip-silence", "--silence-threshold", "-40"]):
+            args = parse_args()
+            assert args.skip_silence is True
+            assert args.silence_threshold == -40.0
+
+    @patch("demix.cli.separate_active_regions", return_value=0.4)
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--skip-silence"])
+    def test_main_skip_silence(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_active, capsys
+    ):
+        main()
+        mock_active.assert_called_once()
+        args = mock_active.call_args[0]
+        assert args[2] == ["vocals", "accompaniment"]
+        assert args[4] == -50.0
+        # the separator callback runs spleeter in the selected mode
+        args[3]("/tmp/music_active.wav", "/tmp/wav")
+        mock_separate.assert_called_once_with("/tmp/music_active.wav", "/tmp/wav", "2stems", "standard", "spleeter")
+        captured = capsys.readouterr()
+        assert "Skipped 40% of the audio as silence" in captured.out
+
+
+class TestSelectiveStems:
+    def test_stems_default_none(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3"]):
+            args = parse_args()
+            assert args.stems is None
+
+    def test_stems_argument(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3", "--stems", "vocals,bass"]):
+            args = parse_args()
+            assert args.stems == "vocals,bass"
+
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--stems", "vocals,kazoo"])
+    def test_main_unknown_stem(self, mock_isfile, mock_check, capsys):
+        main()
+        captured = capsys.readouterr()
+        assert "Error: Unknown stem: kazoo" in captured.out
+
+    @patch("demix.cli.build_composite_stems")
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--stems", "vocals"])
+    def test_main_vocals_only(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_composite
+    ):
+        main()
+        assert mock_separate.call_args[0][2] == "2stems"
+        # only the vocals stem is encoded, no music.mp3
+        mock_wav_to_mp3.assert_called_once()
+        assert mock_wav_to_mp3.call_args[0][1].endswith("vocals.mp3")
+        mock_composite.assert_not_called()
+        mock_mkv.assert_not_called()
+
+    @patch("demix.cli.build_composite_stems")
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--stems", "bass,accompaniment"])
+    def test_main_composite_stems(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_composite, capsys
+    ):
+        main()
+        assert mock_separate.call_args[0][2] == "4stems"
+        mock_composite.assert_called_once()
+        assert mock_composite.call_args[0][1:] == (["accompaniment"], "4stems", STEM_MODES)
+        outputs = [os.path.basename(call[0][1]) for call in mock_wav_to_mp3.call_args_list]
+        assert outputs == ["bass.mp3", "accompaniment.mp3"]
+        # accompaniment video is available in any mode
+        mock_mkv.assert_called_once()
+        captured = capsys.readouterr()
+        assert "Separation mode: 4stems (bass, accompaniment)" in captured.out
+
+    @patch("demix.cli.build_composite_stems")
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "-m", "2stems,4stems"])
+    def test_main_several_modes_run_one_model(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_composite, capsys
+    ):
+        main()
+        mock_separate.assert_called_once()
+        assert mock_separate.call_args[0][2] == "4stems"
+        assert mock_composite.call_args[0][1:] == (["accompaniment"], "4stems", STEM_MODES)
+        outputs = [os.path.basename(call[0][1]) for call in mock_wav_to_mp3.call_args_list]
+        assert outputs == ["music.mp3", "vocals.mp3", "accompaniment.mp3", "drums.mp3", "bass.mp3", "other.mp3"]
+        mock_mkv.assert_called_once()
+        captured = capsys.readouterr()
+        assert "Separation mode: 4stems (vocals, accompaniment, drums, bass, other)" in captured.out
+
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "-m", "2stems,6stems"])
+    def test_main_unknown_mode(self, mock_isfile, mock_check, capsys):
+        main()
+        assert "Error: Unknown separation mode: 6stems" in capsys.readouterr().out
+
+
+class TestQuality:
+    def test_quality_default_standard(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3"]):
+            args = parse_args()
+            assert args.quality == "standard"
+
+    def test_quality_fast(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3", "-q", "fast"]):
+            args = parse_args()
+            assert args.quality == "fast"
+
+    def test_quality_invalid(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3", "--quality", "ultra"]):
+            with pytest.raises(SystemExit):
+                parse_args()
+
+    @patch("demix.cli.subprocess.run")
+    @patch("demix.cli.os.makedirs")
+    def test_separate_audio_high_quality_uses_16khz_model(self, mock_makedirs, mock_run):
+        separate_audio("/input/music.wav", "/output", mode="4stems", quality="high")
+        args = mock_run.call_args[0][0]
+        assert "spleeter:4stems-16kHz" in args
+
+    @patch("demix.backends.model_spec", return_value="/cache/configs/2stems-fast.json")
+    @patch("demix.cli.subprocess.run")
+    @patch("demix.cli.os.makedirs")
+    def test_separate_audio_fast_uses_reduced_config(self, mock_makedirs, mock_run, mock_spec):
+        separate_audio("/input/music.wav", "/output", quality="fast")
+        mock_spec.assert_called_once_with("2stems", "fast")
+        args = mock_run.call_args[0][0]
+        assert "/cache/configs/2stems-fast.json" in args
+
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "-q", "high", "-m", "4stems"])
+    def test_main_records_quality_in_manifest(
+        self, mock_isfile, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, capsys
+    ):
+        main()
+        assert mock_separate.call_args[0][3] == "high"
+        with open(os.path.join("output", _slug(), "demix.json")) as f:
+            manifest = json.load(f)
+        assert manifest["quality"] == "high"
+        assert manifest["model"] == "4stems-16kHz"
+        assert manifest["stems"] == ["vocals", "drums", "bass", "other"]
+        captured = capsys.readouterr()
+        assert "Quality: high" in captured.out
+
+
+class TestBackendOption:
+    def test_backend_default(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3"]):
+            args = parse_args()
+            assert args.backend == "spleeter"
+
+    def test_backend_passthrough(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3", "--backend", "passthrough"]):
+            args = parse_args()
+            assert args.backend == "passthrough"
+
+    @patch("demix.cli.get_backend")
+    def test_separate_audio_delegates_to_backend(self, mock_get_backend):
+        separate_audio("/input/music.wav", "/output", "4stems", "fast", "spleeter-tf")
+        mock_get_backend.assert_called_once_with("spleeter-tf")
+        mock_get_backend.return_value.separate_to_files.assert_called_once_with(
+            "/input/music.wav", "/output", "4stems", "fast"
+        )
+
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.backends.PassthroughBackend.separate_to_files")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "-b", "passthrough", "-m", "5stems"])
+    def test_main_with_passthrough_backend(
+        self, mock_backend_separate, mock_isfile, mock_check, mock_remove,
+        mock_convert_wav, mock_wav_to_mp3, mock_mkv
+    ):
+        main()
+        mock_backend_separate.assert_called_once()
+        assert mock_backend_separate.call_args[0][2:] == ("5stems", "standard")
+        with open(os.path.join("output", _slug(), "demix.json")) as f:
+            assert json.load(f)["backend"] == "passthrough"
+
+
+class TestExportOnnxCommand:
+    @patch("demix.cli.export_model", return_value="/cache/onnx/4stems.onnx")
+    @patch.object(sys, "argv", ["demix", "export-onnx", "-m", "2stems", "4stems"])
+    def test_export_selected_modes(self, mock_export, capsys):
+        main()
+        assert [call[0] for call in mock_export.call_args_list] == [("2stems", "standard"), ("4stems", "standard")]
+        captured = capsys.readouterr()
+        assert "Saved: /cache/onnx/4stems.onnx" in captured.out
+
+    @patch("demix.cli.export_model", return_value="/cache/onnx/5stems-16kHz.onnx")
+    @patch.object(sys, "argv", ["demix", "export-onnx", "-q", "high"])
+    def test_export_all_modes_by_default(self, mock_export):
+        main()
+        assert [call[0] for call in mock_export.call_args_list] == [
+            ("2stems", "high"), ("4stems", "high"), ("5stems", "high")
+        ]
+
+    def test_threads_option(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3", "-b", "onnx", "--threads", "4"]):
+            args = parse_args()
+            assert args.backend == "onnx"
+            assert args.threads == 4
+
+
+ANALYSIS = {
+    "duration": 180.0,
+    "key": {"key": "E", "scale": "minor", "strength": 0.7},
+    "tempo": {"bpm": 128.0, "beats": [0.5, 0.97]},
+    "loudness": {"integrated_lufs": -9.2, "peak_dbfs": -0.3},
+}
+
+
+class TestAnalyzeOption:
+    def test_analyze_default_false(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3"]):
+            assert parse_args().analyze is False
+
+    def test_analyze_short_form(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3", "-a"]):
+            assert parse_args().analyze is True
+
+    @patch("demix.cli.write_sidecar")
+    @patch("demix.cli.analyze_audio", return_value=ANALYSIS)
+    @patch("demix.cli.detect_key")
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--analyze"])
+    def test_main_writes_sidecar(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_detect_key,
+        mock_analyze, mock_sidecar, capsys
+    ):
+        main()
+        mock_analyze.assert_called_once_with(os.path.join(WORK, "music", "wav", "music.wav"))
+        mock_sidecar.assert_called_once_with(os.path.join(WORK, "music", "mp3", "analysis.json"), ANALYSIS)
+        mock_detect_key.assert_not_called()
+        captured = capsys.readouterr()
+        assert "Tempo: 128.0 BPM, loudness: -9.2 LUFS (peak -0.3 dBFS)" in captured.out
+        # The published location is printed, not the scratch directory
+        assert f"Saved: {os.path.join('output', _slug(), 'music', 'mp3', 'analysis.json')}" in captured.out
+
+    @patch("demix.cli.write_sidecar")
+    @patch("demix.cli.analyze_audio", return_value=ANALYSIS)
+    @patch("demix.cli.detect_key")
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "-a", "-k"])
+    def test_key_comes_from_analysis(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_detect_key,
+        mock_analyze, mock_sidecar, capsys
+    ):
+        main()
+        mock_detect_key.assert_not_called()
+        captured = capsys.readouterr()
+        assert "Detected key: E minor (confidence: 70%)" in captured.out
+
+
+class TestKeyTimelineOption:
+    @patch("demix.cli.write_sidecar")
+    @patch("demix.cli.key_timeline", return_value=[
+        {"start": 0.0, "end": 95.5, "key": "A", "scale": "minor", "strength": 0.81},
+        {"start": 95.5, "end": 180.0, "key": "B", "scale": "minor", "strength": 0.74},
+    ])
+    @patch("demix.cli.detect_key")
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--key-timeline"])
+    def test_main_prints_and_saves_segments(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_detect_key,
+        mock_timeline, mock_sidecar, capsys
+    ):
+        main()
+        mock_timeline.assert_called_once_with(os.path.join(WORK, "music", "wav", "music.wav"))
+        mock_detect_key.assert_not_called()
+        assert mock_sidecar.call_args[0][0] == os.path.join(WORK, "music", "mp3", "key_timeline.json")
+        captured = capsys.readouterr()
+        assert "0:00.00 - 1:35.50  A minor (confidence: 81%)" in captured.out
+        assert "1:35.50 - 3:00.00  B minor (confidence: 74%)" in captured.out
+        assert f"Saved: {os.path.join('output', _slug(), 'music', 'mp3', 'key_timeline.json')}" in captured.out
+
+
+class TestScanCommand:
+    @patch("demix.cli.scan_library", return_value=2)
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    def test_scan_directory(self, mock_check, mock_scan, tmp_path, capsys):
+        index = str(tmp_path / "library.sqlite")
+        with patch.object(sys, "argv", ["demix", "scan", str(tmp_path), "-j", "3", "--index", index]):
+            main()
+        assert mock_scan.call_args[0][0] == str(tmp_path)
+        assert mock_scan.call_args[0][2] == 3
+        report = mock_scan.call_args[0][3]
+        report(1, 2, {"path": str(tmp_path / "a.mp3"), "key": "F", "scale": "minor", "bpm": 98.0, "error": None})
+        report(2, 2, {"path": str(tmp_path / "b.mp3"), "error": "ffmpeg could not decode"})
+        captured = capsys.readouterr()
+        assert "Analyzed 2 new or changed file(s)" in captured.out
+        assert "[1/2] a.mp3: F minor, 98.0 BPM" in captured.out
+        assert "[2/2] b.mp3:" in captured.out and "ffmpeg could not decode" in captured.out
+        assert os.path.exists(index)
+
+    @patch("demix.cli.export_index", return_value=5)
+    @patch("demix.cli.scan_library")
+    def test_export_only(self, mock_scan, mock_export, tmp_path, capsys):
+        out = str(tmp_path / "tracks.csv")
+        with patch.object(sys, "argv", ["demix", "scan", "--export", out, "--index", str(tmp_path / "i.sqlite")]):
+            main()
+        mock_scan.assert_not_called()
+        assert mock_export.call_args[0][1:] == (out, None)
+        assert "Exported 5 track(s)" in capsys.readouterr().out
+
+    def test_requires_directory_or_export(self, capsys):
+        with patch.object(sys, "argv", ["demix", "scan"]):
+            main()
+        assert "Error: a directory to scan or --export is required" in capsys.readouterr().out
+
+    def test_missing_directory(self, capsys):
+        with patch.object(sys, "argv", ["demix", "scan", "/no/such/dir"]):
+            main()
+        assert "Error: Directory not found: /no/such/dir" in capsys.readouterr().out
+
+    @pytest.mark.parametrize("jobs", ["0", "-2", "two"])
+    @patch("demix.cli.scan_library")
+    def test_invalid_jobs(self, mock_scan, jobs, tmp_path, capsys):
+        with patch.object(sys, "argv", ["demix", "scan", str(tmp_path), "-j", jobs]):
+            with pytest.raises(SystemExit) as exc:
+                main()
+        assert exc.value.code == 2
+        assert "argument -j/--jobs" in capsys.readouterr().err
+        mock_scan.assert_not_called()
+
+
+class TestStemEffects:
+    def test_parse(self):
+        stems = ["vocals", "drums", "bass", "other"]
+        assert parse_stem_effects("drums=tempo, bass = none", stems) == {"drums": "tempo", "bass": "none"}
+
+    @pytest.mark.parametrize("value, error", [
+        ("drums", "Invalid stem effects: drums"),
+        ("drums=reverb", "Invalid stem effects: drums=reverb"),
+        ("piano=none", "Stem not in the output: piano"),
+    ])
+    def test_parse_errors(self, value, error):
+        with pytest.raises(ValueError, match=error):
+            parse_stem_effects(value, ["vocals", "drums"])
+
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", [
+        "demix", "-f", "/path/to/song.mp3", "-m", "4stems", "-t", "0.9", "-p", "-2",
+        "--stem-effects", "drums=tempo,other=none",
+    ])
+    def test_main_skips_effects_per_stem(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, capsys
+    ):
+        main()
+        outputs = {os.path.basename(call[0][1]): call[0][2:4] for call in mock_wav_to_mp3.call_args_list}
+        assert outputs == {
+            "music.mp3": (1.0, 0),
+            "vocals.mp3": (0.9, -2),
+            "drums.mp3": (0.9, 0),
+            "bass.mp3": (0.9, -2),
+            "other.mp3": (1.0, 0),
+            "music_modified.mp3": (0.9, -2),
+        }
+        assert "Effects per stem: drums (tempo), other (none)" in capsys.readouterr().out
+
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--stem-effects", "drums=tempo"])
+    def test_main_stem_not_in_output(self, mock_isfile, mock_check, capsys):
+        main()
+        assert "Error: Stem not in the output: drums" in capsys.readouterr().out
+
+
+class TestStretchEngine:
+    @patch("demix.cli.stretch_files")
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", [
+        "demix", "-f", "/path/to/song.mp3", "-m", "4stems", "-t", "0.9", "-p", "-2",
+        "--stem-effects", "drums=tempo,other=none", "--stretch-engine", "numpy", "--stretch-quality", "high",
+    ])
+    def test_tracks_stretched_in_groups(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_stretch, capsys
+    ):
+        main()
+        wav_dir = os.path.join(WORK, "music", "wav")
+        stretch_dir = os.path.join(wav_dir, "stretched")
+        groups = {call[0][2:]: [os.path.basename(path) for path in call[0][0]] for call in mock_stretch.call_args_list}
+        # Tracks sharing the same effects are stretched in one batch
+        assert groups == {
+            (0.9, -2, "high"): ["music.wav", "vocals.wav", "bass.wav"],
+            (0.9, 0, "high"): ["drums.wav"],
+        }
+        sources = {os.path.basename(call[0][1]): call[0][0] for call in mock_wav_to_mp3.call_args_list}
+        assert sources["vocals.mp3"] == os.path.join(stretch_dir, "vocals.wav")
+        assert sources["drums.mp3"] == os.path.join(stretch_dir, "drums.wav")
+        assert sources["other.mp3"] == os.path.join(wav_dir, "other.wav")
+        assert sources["music_modified.mp3"] == os.path.join(stretch_dir, "original.wav")
+        # ffmpeg only encodes, the effects are already applied
+        assert all(call[0][2:4] == (1.0, 0) for call in mock_wav_to_mp3.call_args_list)
+        assert "Stretching 3 tracks in process (tempo: 0.9x, transpose: -2 semitones, high quality)" in \
+            capsys.readouterr().out
+
+    @patch("demix.cli.stretch_files")
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--stretch-engine", "numpy"])
+    def test_no_effects_no_stretch(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_stretch
+    ):
+        main()
+        mock_stretch.assert_not_called()
+
+    @patch("demix.cli.stretch_files")
+    @patch("demix.cli.mux_tracks")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", [
+        "demix", "-f", "/path/to/song.mp3", "-t", "1.1", "--container", "mka", "--stretch-engine", "numpy",
+    ])
+    def test_container_tracks_use_stretched_files(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_mux, mock_stretch
+    ):
+        main()
+        stretch_dir = os.path.join(WORK, "music", "wav", "stretched")
+        tracks = mock_mux.call_args[0][0]
+        assert tracks == [
+            ("original", os.path.join(stretch_dir, "original.wav")),
+            ("vocals", os.path.join(stretch_dir, "vocals.wav")),
+            ("accompaniment", os.path.join(stretch_dir, "accompaniment.wav")),
+        ]
+        assert mock_mux.call_args[1]["track_effects"] == [(1.0, 0)] * 3
+
+
+class TestPreview:
+    @patch("demix.cli._publish_preview", side_effect=lambda stems_dir, job_output: os.path.join(job_output, "preview"))
+    @patch("demix.cli.shutil.rmtree")
+    @patch("demix.cli.os.rmdir")
+    @patch("demix.cli.os.replace")
+    @patch("demix.cli.os.listdir", return_value=["accompaniment.mp3", "vocals.mp3"])
+    @patch("demix.cli.write_wav")
+    @patch("demix.cli.read_wav", return_value=(MagicMock(), 44100))
+    @patch("demix.cli.wav_info", return_value=(44100 * 600, 44100, 2))
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--preview", "15"])
+    def test_preview_published_before_full_job(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove, mock_convert_wav,
+        mock_separate, mock_wav_to_mp3, mock_mkv, mock_info, mock_read, mock_write, mock_listdir,
+        mock_replace, mock_rmdir, mock_rmtree, mock_preview, capsys
+    ):
+        manager = MagicMock()
+        manager.attach_mock(mock_separate, "separate")
+        manager.attach_mock(mock_wav_to_mp3, "encode")
+        manager.attach_mock(mock_preview, "preview")
+        manager.attach_mock(mock_replace, "publish")
+        main()
+        wav_dir = os.path.join(WORK, "music", "wav")
+        staging = os.path.join(WORK, "music", ".staging")
+        mock_read.assert_called_once_with(os.path.join(wav_dir, "music.wav"), frames=44100 * 15)
+        assert [call[0][:2] for call in mock_separate.call_args_list] == [
+            (os.path.join(wav_dir, "preview", "music.wav"), os.path.join(wav_dir, "preview")),
+            (os.path.join(wav_dir, "music.wav"), wav_dir),
+        ]
+        # The preview is published to the output right away, the full outputs when the job is done
+        assert [name for name, _, _ in manager.mock_calls][:7] == [
+            "separate", "encode", "encode", "preview", "separate", "encode", "encode",
+        ]
+        assert [call[0][1] for call in mock_wav_to_mp3.call_args_list][:2] == [
+            os.path.join(staging, "vocals.mp3"), os.path.join(staging, "accompaniment.mp3"),
+        ]
+        assert all(call[0][1].startswith(os.path.join(WORK, "music", "mp3"))
+                   for call in mock_wav_to_mp3.call_args_list[2:])
+        mock_preview.assert_called_once_with(staging, os.path.join("output", _slug()))
+        # The full outputs go through a staging directory next to the job's output directory
+        published = {source: target for source, target in (call[0] for call in mock_replace.call_args_list)}
+        target = published[os.path.join(WORK, "demix.json")]
+        assert os.path.basename(os.path.dirname(target)).startswith(f".{_slug()}.")
+        output = capsys.readouterr().out
+        assert f"Preview of 15 s ready in {os.path.join('output', _slug(), 'preview')}/" in output
+        assert "Preview replaced with the full-length stems" in output
+
+    @patch("demix.cli.wav_info", return_value=(44100 * 10, 44100, 2))
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--preview", "15"])
+    def test_short_track_has_no_preview(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove, mock_convert_wav,
+        mock_separate, mock_wav_to_mp3, mock_mkv, mock_info
+    ):
+        main()
+        mock_separate.assert_called_once()
+        mp3_dir = os.path.join(WORK, "music", "mp3")
+        assert {os.path.dirname(call[0][1]) for call in mock_wav_to_mp3.call_args_list} == {mp3_dir}
+
+    @pytest.mark.parametrize("argv, error", [
+        (["--preview", "0"], "Error: --preview must be greater than 0 seconds"),
+        (["--preview", "10", "--container", "mka"], "Error: --preview cannot be used with --container"),
+    ])
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    def test_invalid(self, mock_isfile, mock_check, argv, error, capsys):
+        with patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3"] + argv):
+            main()
+        assert error in capsys.readouterr().out
+
+
+class TestNormalizeOption:
+    @patch("demix.cli.normalization_gains", return_value=({"vocals": -3.0, "accompaniment": -3.0}, -3.0))
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--normalize", "-14", "-t", "0.9"])
+    def test_common_gain_applied_in_encode(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_gains, capsys
+    ):
+        manager = MagicMock()
+        manager.attach_mock(mock_separate, "separate")
+        manager.attach_mock(mock_gains, "gains")
+        manager.attach_mock(mock_wav_to_mp3, "encode")
+        main()
+        wav_dir = os.path.join(WORK, "music", "wav")
+        mock_gains.assert_called_once_with(
+            {"vocals": os.path.join(wav_dir, "vocals.wav"), "accompaniment": os.path.join(wav_dir, "accompaniment.wav")},
+            os.path.join(wav_dir, "music.wav"), -14.0, False,
+        )
+        # The mix is encoded once, after its gain is known
+        assert [name for name, _, _ in manager.mock_calls][:3] == ["separate", "gains", "encode"]
+        outputs = {os.path.basename(call[0][1]): call[0][2:] for call in mock_wav_to_mp3.call_args_list}
+        assert outputs == {
+            "music.mp3": (1.0, 0, -3.0),
+            "vocals.mp3": (0.9, 0, -3.0),
+            "accompaniment.mp3": (0.9, 0, -3.0),
+            "music_modified.mp3": (0.9, 0, -3.0),
+        }
+        assert "Gain to -14 LUFS: -3.0 dB (all stems)" in capsys.readouterr().out
+        with open(os.path.join("output", _slug(), "demix.json")) as f:
+            assert json.load(f)["normalize"] == -14.0
+
+    @patch("demix.cli.normalization_gains", return_value=({"vocals": 2.0, "accompaniment": -1.5}, -3.0))
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--normalize", "-16", "--normalize-stems"])
+    def test_per_stem_gains(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_gains, capsys
+    ):
+        main()
+        assert mock_gains.call_args[0][3] is True
+        outputs = {os.path.basename(call[0][1]): call[0][4] for call in mock_wav_to_mp3.call_args_list}
+        assert outputs == {"music.mp3": -3.0, "vocals.mp3": 2.0, "accompaniment.mp3": -1.5}
+        assert "vocals +2.0 dB, accompaniment -1.5 dB" in capsys.readouterr().out
+
+    @pytest.mark.parametrize("argv, error", [
+        (["--normalize-stems"], "Error: --normalize-stems requires --normalize"),
+        (["--normalize", "3"], "Error: --normalize must be between -70 and 0 LUFS"),
+    ])
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    def test_invalid(self, mock_isfile, mock_check, argv, error, capsys):
+        with patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3"] + argv):
+            main()
+        assert error in capsys.readouterr().out
+
+
+class TestStdoutStreaming:
+    def _run(self, tmp_path, argv):
+        """Run main with real separation (passthrough backend); returns (stdout bytes, stderr)."""
+        import io
+        import numpy as np
+        from demix.audio import write_wav
+
+        def decode(input_file, output_file, start_time=None, end_time=None):
+            write_wav(output_file, np.full((1000, 2), 0.5, dtype=np.float32))
+
+        stdout = io.TextIOWrapper(io.BytesIO())
+        with patch("demix.cli.convert_to_wav", side_effect=decode) as mock_convert, \
+                patch("demix.cli.check_ffmpeg", return_value=True), \
+                patch.object(sys, "stdout", stdout), \
+                patch.object(sys, "argv", ["demix", "-b", "passthrough"] + argv):
+            main()
+        # Intermediate files are gone and nothing is published
+        assert not os.path.exists(WORK)
+        assert not os.path.exists(os.path.join("output", "music", "wav", "vocals.wav"))
+        self.convert = mock_convert
+        return stdout.buffer.getvalue()
+
+    def test_stems_interleaved_on_stdout(self, tmp_path, capsys):
+        import io
+        from demix.audio import read_wav
+        song = tmp_path / "song.mp3"
+        song.write_bytes(b"")
+        audio = self._run(tmp_path, ["-f", str(song), "--stdout", "accompaniment,vocals"])
+        samples, rate = read_wav(io.BytesIO(audio))
+        assert samples.shape == (1000, 4)
+        assert abs(samples[0, 0] - 0.25) < 1e-3
+        err = capsys.readouterr().err
+        assert "Streaming accompaniment, vocals to stdout as WAV" in err
+
+    def test_stdin_input(self, tmp_path, capsys):
+        audio = self._run(tmp_path, ["-f", "-", "--stdout", "vocals"])
+        assert audio[:4] == b"RIFF"
+        assert self.convert.call_args[0][0] == "-"
+        assert "Processing: stdin" in capsys.readouterr().err
+
+    @patch("demix.cli.subprocess.Popen")
+    def test_flac_and_effects_through_ffmpeg(self, mock_popen, tmp_path):
+        import io
+
+        class Pipe(io.BytesIO):
+            def close(self):
+                pass
+
+        mock_popen.return_value.stdin = Pipe()
+        self._run(tmp_path, ["-f", "-", "--stdout", "vocals", "--stdout-format", "flac", "-t", "0.8"])
+        cmd = mock_popen.call_args[0][0]
+        assert cmd[:7] == ["ffmpeg", "-v", "error", "-f", "wav", "-i", "-"]
+        assert cmd[cmd.index("-af") + 1] == "atempo=0.8"
+        assert cmd[-3:] == ["-f", "flac", "-"]
+        assert mock_popen.return_value.stdin.getvalue()[:4] == b"RIFF"
+
+    def test_parse_stdout_stems(self):
+        assert parse_stdout_stems("vocals, bass", ["vocals", "drums", "bass"]) == ["vocals", "bass"]
+        with pytest.raises(ValueError, match="Stem not in the output: piano"):
+            parse_stdout_stems("piano", ["vocals", "drums"])
+        with pytest.raises(ValueError, match="FLAC holds at most 4 stereo stems"):
+            parse_stdout_stems("a,b,c,d,e", list("abcde"), "flac")
+
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch.object(sys, "argv", ["demix", "-f", "-", "--stdout", "vocals", "--container", "mka"])
+    def test_invalid_combination_reported_on_stderr(self, mock_check, capsys):
+        main()
+        captured = capsys.readouterr()
+        assert "Error: --stdout cannot be used with --container" in captured.err
+        assert captured.out == ""
+
+
+class TestWorkdir:
+    def _job(self, tmp_path, extra=(), name="song.mp3"):
+        """Run a job into tmp_path/out; returns (scratch directory, result directory of the job)."""
+        import numpy as np
+        from demix.audio import write_wav
+
+        def decode(input_file, output_file, start_time=None, end_time=None):
+            write_wav(output_file, np.full((1000, 2), 0.5, dtype=np.float32))
+
+        song = tmp_path / name
+        song.write_bytes(b"")
+        scratch = tmp_path / "scratch"
+        out = tmp_path / "out"
+        argv = ["demix", "-f", str(song), "-o", str(out), "-b", "passthrough", "--format", "wav",
+                "--workdir", str(scratch)] + list(extra)
+        with patch("demix.cli._create_workdir", side_effect=_create_workdir), \
+                patch("demix.cli.convert_to_wav", side_effect=decode), \
+                patch("demix.cli.create_empty_mkv_with_audio"), \
+                patch("demix.cli.check_ffmpeg", return_value=True), \
+                patch.object(sys, "argv", argv):
+            main()
+        return scratch, out / _slug(argv)
+
+    def test_only_final_outputs_are_published(self, tmp_path, capsys):
+        scratch, out = self._job(tmp_path)
+        assert sorted(os.listdir(out / "music" / "stems")) == ["accompaniment.wav", "music.wav", "vocals.wav"]
+        assert (out / "demix.json").exists()
+        assert not (out / "music" / "wav").exists()
+        # The scratch directory of the job is removed
+        assert os.listdir(scratch) == []
+        assert f"Working directory: {scratch}" in capsys.readouterr().out
+
+    def test_keep_wav(self, tmp_path):
+        _, out = self._job(tmp_path, ["--keep-wav"])
+        assert (out / "music" / "wav" / "vocals.wav").exists()
+
+    def test_cleanup_on_failure(self, tmp_path):
+        with patch("demix.cli.separate_audio", side_effect=RuntimeError("model crashed")):
+            with pytest.raises(RuntimeError):
+                self._job(tmp_path)
+        assert os.listdir(tmp_path / "scratch") == []
+        # Nothing is published, not even a staging directory
+        assert not (tmp_path / "out").exists()
+
+    def test_preview_is_replaced_by_the_result(self, tmp_path, capsys):
+        _, out = self._job(tmp_path, ["--preview", "0.01"])
+        assert f"Preview of 0.01 s ready in {out / 'preview'}/" in capsys.readouterr().out
+        assert sorted(os.listdir(out)) == ["demix.json", "music"]
+        assert (out / "music" / "stems" / "vocals.wav").exists()
+
+    def test_publish_preview_keeps_the_previous_result(self, tmp_path):
+        from demix.cli import _publish_preview
+        job_output = tmp_path / "out" / "song"
+        (job_output / "music").mkdir(parents=True)
+        (job_output / "music" / "vocals.mp3").write_text("full length")
+        for run in ("first", "second"):
+            stems = tmp_path / "stems"
+            stems.mkdir()
+            (stems / "vocals.mp3").write_text(run)
+            assert _publish_preview(str(stems), str(job_output)) == str(job_output / "preview")
+            assert not stems.exists()
+        assert (job_output / "preview" / "vocals.mp3").read_text() == "second"
+        assert sorted(os.listdir(job_output)) == ["music", "preview"]
+        assert (job_output / "music" / "vocals.mp3").read_text() == "full length"
+
+    def test_options_get_separate_directories(self, tmp_path):
+        _, two = self._job(tmp_path)
+        _, four = self._job(tmp_path, ["-m", "4stems"])
+        assert two != four
+        assert (two / "music" / "stems" / "accompaniment.wav").exists()
+        assert (four / "music" / "stems" / "drums.wav").exists()
+
+    def test_jobs_get_separate_directories(self, tmp_path):
+        _, first = self._job(tmp_path, name="first.mp3")
+        _, second = self._job(tmp_path, name="second.mp3")
+        assert first != second
+        assert sorted(os.listdir(tmp_path / "out")) == sorted([first.name, second.name])
+        for result in (first, second):
+            assert (result / "music" / "stems" / "vocals.wav").exists()
+
+    def test_rerun_replaces_the_result(self, tmp_path):
+        _, result = self._job(tmp_path)
+        (result / "stale.txt").write_text("from the first run")
+        _, again = self._job(tmp_path)
+        assert again == result
+        assert not (result / "stale.txt").exists()
+        assert (result / "demix.json").exists()
+        assert os.listdir(tmp_path / "out") == [result.name]
+
+    def test_replace_dir(self, tmp_path):
+        (tmp_path / "new").mkdir()
+        (tmp_path / "new" / "a").write_text("new")
+        (tmp_path / "old").mkdir()
+        (tmp_path / "old" / "b").write_text("old")
+        _replace_dir(str(tmp_path / "new"), str(tmp_path / "old"))
+        assert os.listdir(tmp_path / "old") == ["a"]
+        assert sorted(os.listdir(tmp_path)) == ["old"]
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="exchange renames are Linux-only")
+    def test_replace_dir_never_leaves_target_missing(self, tmp_path):
+        (tmp_path / "new").mkdir()
+        (tmp_path / "new" / "a").write_text("new")
+        (tmp_path / "old").mkdir()
+        real_rename = os.rename
+
+        def rename(source, target):
+            assert source != str(tmp_path / "old"), "the result was moved out of the way"
+            real_rename(source, target)
+
+        with patch("demix.cli.os.rename", side_effect=rename):
+            _replace_dir(str(tmp_path / "new"), str(tmp_path / "old"))
+        assert (tmp_path / "old" / "a").read_text() == "new"
+        assert sorted(os.listdir(tmp_path)) == ["old"]
+
+    @patch("demix.cli._exchange_paths", return_value=False)
+    def test_replace_dir_without_exchange_rename(self, mock_exchange, tmp_path):
+        (tmp_path / "new").mkdir()
+        (tmp_path / "new" / "a").write_text("new")
+        (tmp_path / "old").mkdir()
+        _replace_dir(str(tmp_path / "new"), str(tmp_path / "old"))
+        assert os.listdir(tmp_path / "old") == ["a"]
+        assert sorted(os.listdir(tmp_path)) == ["old"]
+
+    @patch("demix.cli.tmpfs_dir", return_value=None)
+    def test_default_next_to_output(self, mock_tmpfs, tmp_path):
+        work_dir = _create_workdir(None, str(tmp_path / "out"), 1000)
+        assert os.path.dirname(work_dir) == str(tmp_path)
+        mock_tmpfs.assert_called_once_with(1000)
+
+    @pytest.mark.parametrize("argv, duration, size", [
+        # 4 stems and the 4 outputs, each of them stretched, plus the source and modified original
+        (["-m", "4stems"], 200.0, 200 * 176400 * 14),
+        # A cut needs no probe, only its length counts
+        (["-m", "2stems", "-ss", "1:00", "-to", "1:30"], None, 30 * 176400 * 8),
+        # Unknown length: 15 minutes are assumed
+        (["-m", "2stems"], None, 900 * 176400 * 8),
+    ])
+    def test_workdir_size_from_source_length(self, argv, duration, size):
+        from demix.cli import _workdir_size
+        with patch("demix.cli.probe_duration", return_value=duration) as mock_probe, \
+                patch.object(sys, "argv", ["demix", "-f", "song.mp3"] + argv):
+            args = parse_args()
+            start, end = parse_time(args.start), parse_time(args.end)
+            assert _workdir_size(args, start, end) == size
+        assert mock_probe.called == (end is None)
+
+    @patch("demix.cli.tmpfs_dir", return_value=None)
+    @patch("demix.cli.probe_duration", return_value=60.0)
+    def test_tmpfs_needs_room_for_the_job(self, mock_probe, mock_tmpfs, tmp_path):
+        with pytest.raises(RuntimeError), patch("demix.cli._create_workdir", side_effect=_create_workdir), \
+                patch("demix.cli.convert_to_wav", side_effect=RuntimeError), \
+                patch("demix.cli.check_ffmpeg", return_value=True), \
+                patch.object(sys, "argv", ["demix", "-f", str(tmp_path / "song.mp3"), "-o", str(tmp_path / "out"),
+                                           "-m", "2stems", "--no-pcm-cache"]):
+            (tmp_path / "song.mp3").write_bytes(b"")
+            main()
+        mock_probe.assert_called_once_with(str(tmp_path / "song.mp3"))
+        mock_tmpfs.assert_called_once_with(60 * 176400 * 8)
+
+    def test_publish_outputs_skips_separation_wavs(self, tmp_path):
+        work = tmp_path / "work"
+        for path in ("music/wav/vocals.wav", "music/mp3/vocals.mp3", "demix.json"):
+            (work / path).parent.mkdir(parents=True, exist_ok=True)
+            (work / path).write_text(path)
+        assert _publish_outputs(str(work), str(tmp_path / "out")) == 2
+        assert (tmp_path / "out" / "music" / "mp3" / "vocals.mp3").read_text() == "music/mp3/vocals.mp3"
+        assert not (tmp_path / "out" / "music" / "wav").exists()
+
+    def test_publish_file_across_filesystems(self, tmp_path):
+        import errno
+        source = tmp_path / "a.mp3"
+        source.write_text("audio")
+        target = tmp_path / "out" / "a.mp3"
+        real_replace = os.replace
+        calls = []
+
+        def replace(src, dst):
+            calls.append((src, dst))
+            if len(calls) == 1:
+                raise OSError(errno.EXDEV, "Invalid cross-device link")
+            real_replace(src, dst)
+
+        with patch("demix.cli.os.replace", side_effect=replace):
+            publish_file(str(source), str(target))
+        assert target.read_text() == "audio"
+        assert not source.exists()
+        # The copy is renamed into place from a temporary name next to the target
+        assert calls[1] == (f"{target}.partial", str(target))
+
+
+class TestStreamCommand:
+    def test_stream_from_fifo_path(self, tmp_path, capsys):
+        import numpy as np
+        pcm = tmp_path / "input.pcm"
+        pcm.write_bytes(np.full((44100, 2), 4000, dtype="<i2").tobytes())
+        out = tmp_path / "stems"
+        with patch.object(sys, "argv", [
+            "demix", "stream", "-i", str(pcm), "-d", str(out), "-b", "passthrough", "--latency", "0.2",
+        ]):
+            main()
+        vocals = np.frombuffer((out / "vocals.pcm").read_bytes(), "<i2")
+        assert len(vocals) == 44100 * 2
+        assert np.all(vocals == 2000)
+        captured = capsys.readouterr()
+        assert "Streaming 2stems (vocals, accompaniment)" in captured.out
+        assert "Separated 1.0 s" in captured.out and "kept up with real time" in captured.out
+
+    @pytest.mark.parametrize("argv, error", [
+        (["--latency", "0"], "Error: --latency must be greater than 0 seconds"),
+        (["--context", "-1"], "Error: --context cannot be negative"),
+        (["-m", "7stems"], "Error: Backend 'passthrough' does not support 7stems"),
+    ])
+    def test_invalid(self, tmp_path, capsys, argv, error):
+        with patch.object(sys, "argv", ["demix", "stream", "-b", "passthrough", "-d", str(tmp_path)] + argv):
+            main()
+        assert error in capsys.readouterr().out
+
+
+class TestRemixCommand:
+    def _stems(self, tmp_path):
+        import numpy as np
+        from demix.audio import write_wav
+        for name, value in (("vocals", 0.5), ("accompaniment", 0.7)):
+            write_wav(str(tmp_path / f"{name}.wav"), np.full((100, 2), value, dtype=np.float32))
+        return str(tmp_path)
+
+    @patch("demix.cli.export_audio")
+    def test_remix_to_wav(self, mock_export, tmp_path, capsys):
+        out = str(tmp_path / "mix.wav")
+        with patch.object(sys, "argv", ["demix", "remix", out, "-d", self._stems(tmp_path), "-g", "vocals=3"]):
+            main()
+        mock_export.assert_not_called()
+        captured = capsys.readouterr()
+        assert "Mixing vocals, accompaniment" in captured.out
+        assert "Mix peaked at" in captured.out and "protected with normalize" in captured.out
+        assert "Saved" in captured.out
+        assert os.path.exists(out)
+
+    @patch("demix.cli.export_audio")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    def test_remix_encodes_other_formats(self, mock_check, mock_export, tmp_path):
+        out = str(tmp_path / "karaoke.mp3")
+        with patch.object(sys, "argv", ["demix", "remix", out, "-d", self._stems(tmp_path), "-m", "vocals", "-t", "0.8"]):
+            main()
+        wav_file = str(tmp_path / "karaoke.remix.wav")
+        mock_export.assert_called_once_with(wav_file, out, 0.8, 0, "mp3")
+        assert not os.path.exists(wav_file)
+
+    def test_unknown_stem(self, tmp_path, capsys):
+        with patch.object(sys, "argv", ["demix", "remix", "mix.wav", "-d", self._stems(tmp_path), "--only", "drums"]):
+            main()
+        assert "Error: Unknown stem: drums" in capsys.readouterr().out
+
+    def test_unsupported_format(self, tmp_path, capsys):
+        with patch.object(sys, "argv", ["demix", "remix", "mix.aac", "-d", self._stems(tmp_path)]):
+            main()
+        assert "Error: Unsupported output format: aac" in capsys.readouterr().out
+
+
+class TestKeyProfilesOption:
+    @patch("demix.cli.detect_key_profiles", return_value=(
+        {"bgate": ("G", "major", 0.8), "edma": ("E", "minor", 0.6)}, ("G", "major", 0.4)
+    ))
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "-k", "--key-profiles", "bgate,edma", "-p", "2"])
+    def test_main_displays_profiles_and_consensus(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_mkv, mock_detect_key, capsys
+    ):
+        main()
+        mock_detect_key.assert_called_once_with(os.path.join(WORK, "music", "wav", "music.wav"), ["bgate", "edma"])
+        captured = capsys.readouterr()
+        assert "bgate          G major (80%)" in captured.out
+        assert "edma           E minor (60%)" in captured.out
+        assert "Detected key (consensus): G major (confidence: 40%)" in captured.out
+        assert "Detected key (after transpose): A major" in captured.out
+
+    @pytest.mark.parametrize("argv, message", [
+        (["--key-profiles", "bgate"], "Error: --key-profiles requires --key"),
+        (["-k", "--key-profiles", "nope"], "Error: Unknown key profile: nope"),
+        (["-k", "--fast-key", "--key-profiles", "all"], "Error: --key-profiles and --fast-key cannot be used together"),
+    ])
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    def test_invalid(self, mock_isfile, mock_check, argv, message, capsys):
+        with patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3"] + argv):
+            main()
+        assert message in capsys.readouterr().out
+
+
+class TestOutputFormats:
+    @pytest.mark.parametrize("fmt, codec", [("wav", "pcm_s16le"), ("flac", "flac"), ("opus", "libopus")])
+    @patch("demix.cli.subprocess.run")
+    @patch("demix.cli.os.makedirs")
+    def test_encode_audio_codec(self, mock_makedirs, mock_run, fmt, codec):
+        encode_audio("/in/vocals.wav", f"/out/vocals.{fmt}", tempo=0.9, fmt=fmt)
+        args = mock_run.call_args[0][0]
+        assert args[args.index("-c:a") + 1] == codec
+        assert "atempo=0.9" in args[args.index("-af") + 1]
+        assert args[-1] == f"/out/vocals.{fmt}"
+
+    def test_publish_wav_hardlinks(self, tmp_path):
+        source = tmp_path / "wav" / "vocals.wav"
+        source.parent.mkdir()
+        source.write_bytes(b"RIFF")
+        target = tmp_path / "out" / "vocals.wav"
+        publish_wav(str(source), str(target))
+        assert os.path.samefile(source, target)
+
+    def test_publish_wav_onto_itself_keeps_file(self, tmp_path):
+        source = tmp_path / "vocals.wav"
+        source.write_bytes(b"RIFF")
+        publish_wav(str(source), str(source), keep_source=False)
+        assert source.read_bytes() == b"RIFF"
+
+    @patch("demix.cli.os.link", side_effect=OSError("cross-device link"))
+    def test_publish_wav_falls_back_to_move(self, mock_link, tmp_path):
+        source = tmp_path / "vocals.wav"
+        source.write_bytes(b"RIFF")
+        publish_wav(str(source), str(tmp_path / "out" / "vocals.wav"), keep_source=False)
+        assert not source.exists()
+        assert (tmp_path / "out" / "vocals.wav").read_bytes() == b"RIFF"
+
+    @patch("demix.cli.os.link", side_effect=OSError("cross-device link"))
+    def test_publish_wav_falls_back_to_copy(self, mock_link, tmp_path):
+        source = tmp_path / "music.wav"
+        source.write_bytes(b"RIFF")
+        publish_wav(str(source), str(tmp_path / "out" / "music.wav"))
+        assert source.exists()
+        assert (tmp_path / "out" / "music.wav").read_bytes() == b"RIFF"
+
+    @patch("demix.cli.encode_audio")
+    @patch("demix.cli.publish_wav")
+    @patch("demix.cli.convert_wav_to_mp3")
+    def test_export_audio_paths(self, mock_mp3, mock_publish, mock_encode):
+        export_audio("a.wav", "a.mp3", fmt="mp3")
+        export_audio("a.wav", "b.wav", fmt="wav", keep_source=False)
+        export_audio("a.wav", "c.wav", transpose=2, fmt="wav")
+        export_audio("a.wav", "d.flac", fmt="flac")
+        export_audio("a.wav", "e.wav", fmt="wav", gain_db=-3.0)
+        mock_mp3.assert_called_once_with("a.wav", "a.mp3", 1.0, 0, 0.0)
+        mock_publish.assert_called_once_with("a.wav", "b.wav", False)
+        assert [call[0][1] for call in mock_encode.call_args_list] == ["c.wav", "d.flac", "e.wav"]
+        assert mock_encode.call_args[0][5] == -3.0
+
+    def test_format_default_mp3(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3"]):
+            assert parse_args().format == "mp3"
+
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.encode_audio")
+    @patch("demix.cli.publish_wav")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--format", "wav"])
+    def test_main_wav_without_effects_is_not_encoded(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_publish, mock_encode, mock_mkv
+    ):
+        main()
+        mock_wav_to_mp3.assert_not_called()
+        mock_encode.assert_not_called()
+        stems_dir = os.path.join(WORK, "music", "stems")
+        assert [call[0][1] for call in mock_publish.call_args_list] == [
+            os.path.join(stems_dir, name) for name in ("music.wav", "vocals.wav", "accompaniment.wav")
+        ]
+        # The separation input is kept, the stems are not needed in their old place
+        assert [call[0][2] for call in mock_publish.call_args_list] == [True, False, False]
+        assert mock_mkv.call_args[0][0] == os.path.join(stems_dir, "accompaniment.wav")
+
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.encode_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", ["demix", "-f", "/path/to/song.mp3", "--format", "flac", "-t", "0.8"])
+    def test_main_flac(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove,
+        mock_convert_wav, mock_separate, mock_wav_to_mp3, mock_encode, mock_mkv
+    ):
+        main()
+        mock_wav_to_mp3.assert_not_called()
+        outputs = [os.path.basename(call[0][1]) for call in mock_encode.call_args_list]
+        assert outputs == ["music.flac", "vocals.flac", "accompaniment.flac", "music_modified.flac"]
+        assert all(call[0][4] == "flac" for call in mock_encode.call_args_list)
+        with open(os.path.join("output", _slug(), "demix.json")) as f:
+            assert json.load(f)["format"] == "flac"
+
+
+class TestContainer:
+    @patch("demix.cli.subprocess.run")
+    @patch("demix.cli.os.makedirs")
+    def test_mux_tracks_single_command(self, mock_makedirs, mock_run):
+        tracks = [("original", "/w/music.wav"), ("vocals", "/w/vocals.wav"), ("accompaniment", "/w/acc.wav")]
+        mux_tracks(tracks, "/out/stems.mka", fmt="flac")
+        mock_run.assert_called_once()
+        args = mock_run.call_args[0][0]
+        assert [args[i + 1] for i, arg in enumerate(args) if arg == "-i"] == [path for _, path in tracks]
+        assert [args[i + 1] for i, arg in enumerate(args) if arg == "-map"] == ["0:a", "1:a", "2:a"]
+        assert args[args.index("-c:a") + 1] == "flac"
+        assert args[args.index("-metadata:s:a:1") + 1] == "title=vocals"
+        assert args[args.index("-disposition:a:0") + 1] == "default"
+        assert args[args.index("-disposition:a:2") + 1] == "0"
+        assert "-filter_complex" not in args
+        assert "lavfi" not in args
+        assert args[-1] == "/out/stems.mka"
+
+    @patch("demix.cli.subprocess.run")
+    @patch("demix.cli.os.makedirs")
+    def test_mux_tracks_effects_and_video(self, mock_makedirs, mock_run):
+        mux_tracks([("original", "a.wav"), ("vocals", "b.wav")], "/out/stems.mkv", tempo=0.8, transpose=2, video=True)
+        args = mock_run.call_args[0][0]
+        graph = args[args.index("-filter_complex") + 1]
+        assert graph.startswith("[0:a]rubberband=")
+        assert "[1:a]" in graph and graph.endswith("atempo=0.8[a1]")
+        assert [args[i + 1] for i, arg in enumerate(args) if arg == "-map"] == ["[a0]", "[a1]", "2:v"]
+        assert "-shortest" in args
+        assert args[args.index("-c:a") + 1] == "libmp3lame"
+
+    @patch("demix.cli.subprocess.run")
+    @patch("demix.cli.os.makedirs")
+    def test_mux_tracks_gains(self, mock_makedirs, mock_run):
+        mux_tracks([("original", "a.wav"), ("vocals", "b.wav")], "/out/stems.mka", gains=[0.0, -2.5])
+        args = mock_run.call_args[0][0]
+        assert args[args.index("-filter_complex") + 1] == "[0:a]anull[a0];[1:a]volume=-2.50dB[a1]"
+
+    @patch("demix.cli.subprocess.run")
+    @patch("demix.cli.os.makedirs")
+    def test_mux_tracks_per_track_effects(self, mock_makedirs, mock_run):
+        mux_tracks([("original", "a.wav"), ("drums", "b.wav")], "/out/stems.mka", tempo=0.8, transpose=2,
+                   track_effects=[(0.8, 2), (0.8, 0)])
+        args = mock_run.call_args[0][0]
+        graph = args[args.index("-filter_complex") + 1]
+        assert graph.startswith("[0:a]rubberband=")
+        assert graph.endswith("[1:a]atempo=0.8[a1]")
+
+    def test_container_default_none(self):
+        with patch.object(sys, "argv", ["demix", "-f", "song.mp3"]):
+            assert parse_args().container is None
+
+    @patch("demix.cli.detect_key", side_effect=[("C", "major", 0.9), ("D", "major", 0.8)])
+    @patch("demix.cli.wav_info", return_value=(44100 * 60, 44100, 2))
+    @patch("demix.cli.mux_tracks")
+    @patch("demix.cli.create_empty_mkv_with_audio")
+    @patch("demix.cli.convert_wav_to_mp3")
+    @patch("demix.cli.separate_audio")
+    @patch("demix.cli.convert_to_wav")
+    @patch("demix.cli.remove_dir")
+    @patch("demix.cli.check_ffmpeg", return_value=True)
+    @patch("demix.cli.os.path.exists", return_value=True)
+    @patch("demix.cli.os.path.isfile", return_value=True)
+    @patch("demix.cli.os.makedirs")
+    @patch.object(sys, "argv", [
+        "demix", "-f", "/path/to/song.mp3", "-m", "4stems", "--container", "mkv", "-p", "2", "-k", "--verify-key"
+    ])
+    def test_main_writes_one_container(
+        self, mock_makedirs, mock_isfile, mock_exists, mock_check, mock_remove, mock_convert_wav,
+        mock_separate, mock_wav_to_mp3, mock_mkv, mock_mux, mock_info, mock_detect_key, capsys
+    ):
+        main()
+        mock_wav_to_mp3.assert_not_called()
+        mock_mkv.assert_not_called()
+        mock_mux.assert_called_once()
+        tracks, output_file = mock_mux.call_args[0][:2]
+        assert [title for title, _ in tracks] == ["original", "vocals", "drums", "bass", "other"]
+        container = os.path.join(WORK, "music", "stems.mkv")
+        assert output_file == container
+        assert mock_mux.call_args[0][2:] == (1.0, 2, "mp3")
+        assert mock_mux.call_args[1] == {"video": True, "gains": [0.0] * 5, "track_effects": None}
+        # The key is verified on the original track of the container
+        assert mock_detect_key.call_args[0][0] == container
+        assert "Detected key (after transpose): D major" in capsys.readouterr().out
@@ -0,0 +1,199 @@
+import io
+import os
+import sys
+import tempfile
+import urllib.error
+from unittest.mock import patch
+import pytest
+
+# Add src directory to path for development usage
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.download import backoff_delay, download_resumable  # noqa: E402
+
+
+class FakeResponse(io.BytesIO):
+    def __init__(self, data, status=200, headers=None):
+        super().__init__(data)
+        self.status = status
+        self.headers = headers or {}
+
+
+def _range_server(payload, fail_after=None):
+    """Build a fake urlopen that honours Range headers and can drop the connection once."""
+    calls = []
+
+    def urlopen(request, timeout=None):
+        range_header = request.get_header("Range")
+        calls.append(range_header)
+        start = int(range_header[len("bytes="):-1]) if range_header else 0
+        body = payload[start:]
+        if fail_after is not None and len(calls) == 1:
+            body = body[:fail_after]
+        status = 206 if range_header else 200
+        headers = {"Content-Length": str(len(payload) - start)}
+        if range_header:
+            headers["Content-Range"] = f"bytes {start}-{len(payload) - 1}/{len(payload)}"
+        return FakeResponse(body, status, headers)
+
+    return urlopen, calls
+
+
+class TestBackoffDelay:
+    def test_delay_within_exponential_bound(self):
+        for attempt in range(5):
+            assert 0 <= backoff_delay(attempt, base=1.0, cap=100.0) <= 2 ** attempt
+
+    def test_delay_is_capped(self):
+        assert backoff_delay(20, base=1.0, cap=3.0) <= 3.0
+
+
+class TestDownloadResumable:
+    @patch("demix.download.time.sleep")
+    def test_fresh_download(self, mock_sleep):
+        payload = b"x" * 1000
+        urlopen, calls = _range_server(payload)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            part = os.path.join(tmpdir, "cache", "a.part")
+            os.makedirs(os.path.dirname(part))
+            out = os.path.join(tmpdir, "out", "video.mp4")
+            with patch("demix.download.urllib.request.urlopen", side_effect=urlopen):
+                download_resumable("http://example/a", out, part, expected_size=len(payload))
+            with open(out, "rb") as f:
+                assert f.read() == payload
+            assert not os.path.exists(part)
+        assert calls == [None]
+        mock_sleep.assert_not_called()
+
+    @patch("demix.download.time.sleep")
+    def test_resumes_after_dropped_connection(self, mock_sleep):
+        payload = bytes(range(256)) * 10
+        urlopen, calls = _range_server(payload, fail_after=700)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            part = os.path.join(tmpdir, "a.part")
+            out = os.path.join(tmpdir, "video.mp4")
+            with patch("demix.download.urllib.request.urlopen", side_effect=urlopen):
+                download_resumable("http://example/a", out, part, expected_size=len(payload))
+            with open(out, "rb") as f:
+                assert f.read() == payload
+        assert calls == [None, "bytes=700-"]
+        mock_sleep.assert_called_once()
+
+    @patch("demix.download.time.sleep")
+    def test_resumes_existing_partial_file(self, mock_sleep):
+        payload = b"abcdefghij" * 100
+        urlopen, calls = _range_server(payload)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            part = os.path.join(tmpdir, "a.part")
+            with open(part, "wb") as f:
+                f.write(payload[:400])
+            out = os.path.join(tmpdir, "video.mp4")
+            with patch("demix.download.urllib.request.urlopen", side_effect=urlopen):
+                download_resumable("http://example/a", out, part, expected_size=len(payload))
+            with open(out, "rb") as f:
+                assert f.read() == payload
+        assert calls == ["bytes=400-"]
+
+    @patch("demix.download.time.sleep")
+    def test_complete_partial_file_skips_request(self, mock_sleep):
+        payload = b"done" * 10
+        with tempfile.TemporaryDirectory() as tmpdir:
+            part = os.path.join(tmpdir, "a.part")
+            with open(part, "wb") as f:
+                f.write(payload)
+            out = os.path.join(tmpdir, "video.mp4")
+            with patch("demix.download.urllib.request.urlopen") as mock_urlopen:
+                download_resumable("http://example/a", out, part, expected_size=len(payload))
+            mock_urlopen.assert_not_called()
+            assert os.path.getsize(out) == len(payload)
+
+    @patch("demix.download.time.sleep")
+    def test_server_ignoring_range_restarts(self, mock_sleep):
+        payload = b"0123456789" * 50
+        with tempfile.TemporaryDirectory() as tmpdir:
+            part = os.path.join(tmpdir, "a.part")
+            with open(part, "wb") as f:
+                f.write(b"garbage")
+            out = os.path.join(tmpdir, "video.mp4")
+            response = FakeResponse(payload, 200, {"Content-Length": str(len(payload))})
+            with patch("demix.download.urllib.request.urlopen", return_value=response):
+                download_resumable("http://example/a", out, part, expected_size=len(payload))
+            with open(out, "rb") as f:
+                assert f.read() == payload
+
+    @patch("demix.download.time.sleep")
+    def test_gives_up_after_retries(self, mock_sleep):
+        error = urllib.error.URLError("connection reset")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            part = os.path.join(tmpdir, "a.part")
+            out = os.path.join(tmpdir, "video.mp4")
+            with patch("demix.download.urllib.request.urlopen", side_effect=error):
+                with pytest.raises(urllib.error.URLError):
+                    download_resumable("http://example/a", out, part, expected_size=10, retries=3)
+            assert not os.path.exists(out)
+        assert mock_sleep.call_count == 3
+
+    @patch("demix.download.time.sleep")
+    def test_client_error_is_not_retried(self, mock_sleep):
+        error = urllib.error.HTTPError("http://example/a", 403, "Forbidden", {}, None)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            part = os.path.join(tmpdir, "a.part")
+            out = os.path.join(tmpdir, "video.mp4")
+            with patch("demix.download.urllib.request.urlopen", side_effect=error):
+                with pytest.raises(urllib.error.HTTPError):
+                    download_resumable("http://example/a", out, part, expected_size=10)
+        mock_sleep.assert_not_called()
+
+    @patch("demix.download.time.sleep")
+    def test_disk_full_is_not_retried(self, mock_sleep):
+        import errno
+        payload = b"0123456789"
+        urlopen, calls = _range_server(payload)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            part = os.path.join(tmpdir, "a.part")
+            out = os.path.join(tmpdir, "video.mp4")
+            with patch("demix.download.urllib.request.urlopen", side_effect=urlopen), \
+                    patch("demix.download.shutil.copyfileobj", side_effect=OSError(errno.ENOSPC, "No space left")):
+                with pytest.raises(OSError, match="No space left"):
+                    download_resumable("http://example/a", out, part, expected_size=len(payload))
+        assert len(calls) == 1
+        mock_sleep.assert_not_called()
+
+    @patch("demix.download.time.sleep")
+    def test_complete_partial_file_kept_on_416(self, mock_sleep):
+        payload = b"done" * 10
+        error = urllib.error.HTTPError(
+            "http://example/a", 416, "Range Not Satisfiable", {"Content-Range": f"bytes */{len(payload)}"}, None
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            part = os.path.join(tmpdir, "a.part")
+            with open(part, "wb") as f:
+                f.write(payload)
+            out = os.path.join(tmpdir, "video.mp4")
+            with patch("demix.download.urllib.request.urlopen", side_effect=error) as mock_urlopen:
+                download_resumable("http://example/a", out, part)
+            mock_urlopen.assert_called_once()
+            with open(out, "rb") as f:
+                assert f.read() == payload
+
+    @pytest.mark.skipif(sys.platform == "win32", reason="no flock on Windows")
+    @patch("demix.download.time.sleep")
+    def test_concurrent_job_uses_own_partial_file(self, mock_sleep):
+        import fcntl
+        payload = b"x" * 100
+        urlopen, calls = _range_server(payload)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            part = os.path.join(tmpdir, "a.part")
+            # Another job is appending to the shared partial file
+            with open(part, "wb") as f:
+                f.write(b"other")
+            with open(f"{part}.lock", "a") as other:
+                fcntl.flock(other, fcntl.LOCK_EX)
+                out = os.path.join(tmpdir, "video.mp4")
+                with patch("demix.download.urllib.request.urlopen", side_effect=urlopen):
+                    download_resumable("http://example/a", out, part, expected_size=len(payload))
+            with open(out, "rb") as f:
+                assert f.read() == payload
+            with open(part, "rb") as f:
+                assert f.read() == b"other"
+        assert calls == [None]
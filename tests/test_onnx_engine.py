@@ -0,0 +1,118 @@
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+# Add src directory to path for development usage
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.onnx_engine import OnnxSeparator, load_separator  # noqa: E402
+
+
+class FakeSession:
+    """Stands in for an onnxruntime session running a U-Net.
+
+    The first instrument receives the input spectrogram, the others
+    `leak` times it, so the ratio masks are known in advance.
+    """
+
+    def __init__(self, n_outputs, leak=0.0):
+        self.n_outputs = n_outputs
+        self.leak = leak
+        self.batch_shapes = []
+
+    def get_inputs(self):
+        return [MagicMock(name="input")]
+
+    def get_outputs(self):
+        return [MagicMock() for _ in range(self.n_outputs)]
+
+    def run(self, output_names, feed):
+        spectrogram = next(iter(feed.values()))
+        self.batch_shapes.append(spectrogram.shape)
+        return [spectrogram] + [spectrogram * self.leak] * (self.n_outputs - 1)
+
+
+def _config(frame_length=256, frame_step=64, segment=8, bins=129, extension="zeros"):
+    return {
+        "instrument_list": ["vocals", "accompaniment"],
+        "sample_rate": 44100,
+        "frame_length": frame_length,
+        "frame_step": frame_step,
+        "T": segment,
+        "F": bins,
+        "n_channels": 2,
+        "separation_exponent": 2,
+        "mask_extension": extension,
+        "output_names": ["vocals_spectrogram:0", "accompaniment_spectrogram:0"],
+    }
+
+
+def _waveform(samples=3000):
+    rng = np.random.default_rng(1)
+    return rng.uniform(-0.5, 0.5, (samples, 2)).astype(np.float32)
+
+
+class TestOnnxSeparator:
+    def test_full_mask_reconstructs_input(self):
+        waveform = _waveform()
+        separator = OnnxSeparator(_config(), FakeSession(2))
+        stems = separator.separate(waveform)
+        assert stems["vocals"].shape == waveform.shape
+        np.testing.assert_allclose(stems["vocals"], waveform, atol=1e-4)
+        assert np.abs(stems["accompaniment"]).max() < 1e-3
+
+    def test_stems_sum_to_mix(self):
+        waveform = _waveform()
+        separator = OnnxSeparator(_config(), FakeSession(2, leak=0.5))
+        stems = separator.separate(waveform)
+        np.testing.assert_allclose(stems["vocals"] + stems["accompaniment"], waveform, atol=1e-4)
+        # masks are 1 / (1 + 0.25) and 0.25 / (1 + 0.25)
+        np.testing.assert_allclose(stems["vocals"], waveform * 0.8, atol=1e-4)
+
+    def test_batch_size_does_not_change_result(self):
+        waveform = _waveform(5000)
+        single = OnnxSeparator(_config(), FakeSession(2, leak=0.3), batch_size=1).separate(waveform)
+        session = FakeSession(2, leak=0.3)
+        batched = OnnxSeparator(_config(), session, batch_size=3).separate(waveform)
+        assert all(shape[0] <= 3 for shape in session.batch_shapes)
+        np.testing.assert_allclose(single["vocals"], batched["vocals"], atol=1e-6)
+
+    def test_segments_have_model_shape(self):
+        session = FakeSession(2)
+        OnnxSeparator(_config(bins=64), session, batch_size=2).separate(_waveform())
+        assert all(shape[1:] == (8, 64, 2) for shape in session.batch_shapes)
+
+    def test_zeros_extension_removes_high_band(self):
+        rate = 8000
+        t = np.arange(4000) / rate
+        high = np.sin(2 * np.pi * 3500 * t).astype(np.float32)
+        waveform = np.stack([high, high], axis=1)
+        separator = OnnxSeparator(_config(bins=64), FakeSession(2))
+        stems = separator.separate(waveform)
+        assert np.abs(stems["vocals"][500:-500]).max() < 0.05
+
+    def test_average_extension_keeps_high_band(self):
+        rate = 8000
+        t = np.arange(4000) / rate
+        mix = (np.sin(2 * np.pi * 3500 * t) + np.sin(2 * np.pi * 200 * t)).astype(np.float32)
+        waveform = np.stack([mix, mix], axis=1)
+        separator = OnnxSeparator(_config(bins=64, extension="average"), FakeSession(2))
+        stems = separator.separate(waveform)
+        total = stems["vocals"] + stems["accompaniment"]
+        np.testing.assert_allclose(total[300:-300], waveform[300:-300], atol=1e-3)
+
+    def test_mono_input_is_upmixed(self):
+        waveform = _waveform()[:, 0]
+        stems = OnnxSeparator(_config(), FakeSession(2)).separate(waveform)
+        assert stems["vocals"].shape == (len(waveform), 2)
+
+
+class TestLoadSeparator:
+    def test_missing_model_explains_export(self, tmp_path):
+        with patch("demix.paths.DATA_DIR", str(tmp_path)):
+            with pytest.raises(FileNotFoundError) as excinfo:
+                load_separator("4stems")
+        assert "demix export-onnx -m 4stems" in str(excinfo.value)
@@ -0,0 +1,145 @@
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+# Add src directory to path for development usage
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.pcmcache import (  # noqa: E402
+    cached_pcm, content_hash, cut_pcm, decode_pcm, pcm_path, prune_cache, worth_filling,
+)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path):
+    with patch("demix.paths.CACHE_DIR", str(tmp_path / "cache")):
+        yield tmp_path / "cache"
+
+
+def _ffmpeg(pcm, returncode=0, error=b""):
+    """Popen replacement that writes `pcm` to the stdout file it is given, as ffmpeg does."""
+    def popen(cmd, stdout, stderr):
+        stdout.write(pcm)
+        process = MagicMock()
+        process.returncode = returncode
+        process.communicate.return_value = (None, error)
+        return process
+    return popen
+
+
+def _source(tmp_path, content=b"compressed audio"):
+    path = tmp_path / "song.mp3"
+    path.write_bytes(content)
+    return str(path)
+
+
+class TestDecodePcm:
+    def test_npy_file(self, tmp_path):
+        pcm = np.arange(2000, dtype="<i2").reshape(-1, 2)
+        path = str(tmp_path / "song.npy")
+        # A trailing half frame is dropped
+        with patch("demix.pcmcache.subprocess.Popen", side_effect=_ffmpeg(pcm.tobytes() + b"\x01")) as mock_popen:
+            decode_pcm("song.mp3", path)
+        cmd = mock_popen.call_args[0][0]
+        assert cmd[cmd.index("-f") + 1] == "s16le"
+        loaded = np.load(path, mmap_mode="r")
+        assert isinstance(loaded, np.memmap)
+        np.testing.assert_array_equal(loaded, pcm)
+
+    def test_decode_error(self, tmp_path):
+        path = str(tmp_path / "song.npy")
+        with patch("demix.pcmcache.subprocess.Popen", side_effect=_ffmpeg(b"", 1, b"Invalid data found")):
+            with pytest.raises(RuntimeError, match="Invalid data found"):
+                decode_pcm("broken.mp3", path)
+        assert os.listdir(tmp_path) == []
+
+
+class TestCachedPcm:
+    def test_decoded_once(self, tmp_path):
+        pcm = np.ones((100, 2), dtype="<i2")
+        source = _source(tmp_path)
+        with patch("demix.pcmcache.subprocess.Popen", side_effect=_ffmpeg(pcm.tobytes())) as mock_popen:
+            first, first_hit = cached_pcm(source)
+            second, second_hit = cached_pcm(source)
+        assert (first_hit, second_hit) == (False, True)
+        assert mock_popen.call_count == 1
+        np.testing.assert_array_equal(second, pcm)
+        assert os.path.exists(pcm_path(content_hash(source)))
+
+    @pytest.mark.parametrize("keep", [0, 50, 500])
+    def test_truncated_cache_file_is_decoded_again(self, tmp_path, keep):
+        pcm = np.ones((1000, 2), dtype="<i2")
+        source = _source(tmp_path)
+        path = pcm_path(content_hash(source))
+        np.save(path, pcm)
+        with open(path, "r+b") as f:
+            f.truncate(keep)
+        with patch("demix.pcmcache.subprocess.Popen", side_effect=_ffmpeg(pcm.tobytes())) as mock_popen:
+            loaded, hit = cached_pcm(source)
+        assert hit is False
+        assert mock_popen.call_count == 1
+        np.testing.assert_array_equal(loaded, pcm)
+
+    @patch("demix.pcmcache.probe_duration", return_value=300.0)
+    def test_short_cut_is_not_decoded(self, mock_probe, tmp_path):
+        source = _source(tmp_path)
+        with patch("demix.pcmcache.subprocess.Popen") as mock_popen:
+            assert cached_pcm(source, start_time=60, end_time=90) == (None, False)
+        mock_popen.assert_not_called()
+        assert not os.path.exists(pcm_path(content_hash(source)))
+
+    @patch("demix.pcmcache.probe_duration", return_value=300.0)
+    def test_short_cut_of_a_cached_file_is_a_hit(self, mock_probe, tmp_path):
+        pcm = np.ones((100, 2), dtype="<i2")
+        source = _source(tmp_path)
+        np.save(pcm_path(content_hash(source)), pcm)
+        loaded, hit = cached_pcm(source, start_time=60, end_time=90)
+        assert hit is True
+        np.testing.assert_array_equal(loaded, pcm)
+        mock_probe.assert_not_called()
+
+    def test_keyed_by_content(self, tmp_path):
+        source = _source(tmp_path)
+        digest = content_hash(source)
+        _source(tmp_path, b"edited audio")
+        assert content_hash(source) != digest
+
+
+class TestWorthFilling:
+    @pytest.mark.parametrize("start, end, duration, worth", [
+        (None, None, None, True),
+        (None, 200, 300.0, True),
+        (100, None, 300.0, True),
+        (60, 90, 300.0, False),
+        (250, 400, 300.0, False),
+        (0, 30, None, False),
+    ])
+    def test_cut_covers_most_of_the_source(self, start, end, duration, worth):
+        with patch("demix.pcmcache.probe_duration", return_value=duration):
+            assert worth_filling("song.mp3", start, end) is worth
+
+
+class TestCutPcm:
+    def test_view_of_the_cut(self):
+        pcm = np.zeros((44100 * 4, 2), dtype="<i2")
+        cut = cut_pcm(pcm, 1.5, 3)
+        assert cut.shape == (44100 * 3 // 2, 2)
+        assert np.shares_memory(cut, pcm)
+        assert len(cut_pcm(pcm, end_time=1)) == 44100
+        assert len(cut_pcm(pcm, start_time=3.5)) == 22050
+
+
+class TestPruneCache:
+    def test_least_recently_used_removed_first(self, cache_dir):
+        paths = []
+        for i, name in enumerate(("old", "used", "new")):
+            path = pcm_path(name)
+            np.save(path, np.zeros((1000, 2), dtype="<i2"))
+            os.utime(path, (1000 + i, 1000 + i))
+            paths.append(path)
+        size = os.path.getsize(paths[0])
+        assert prune_cache(limit=2 * size, keep=paths[0]) == 1
+        assert sorted(os.listdir(cache_dir / "pcm")) == ["new.npy", "old.npy"]
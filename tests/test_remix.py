@@ -0,0 +1,132 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Add src directory to path for development usage
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import read_wav, write_wav  # noqa: E402
+from demix.remix import CEILING, find_stems, mix_gains, parse_gain, remix, soft_clip  # noqa: E402
+
+RATE = 44100
+
+
+def _constant(path, value, frames=RATE, rate=RATE):
+    write_wav(str(path), np.full((frames, 2), value, dtype=np.float32), rate)
+
+
+@pytest.fixture
+def stems(tmp_path):
+    for name, value in (("vocals", 0.1), ("drums", 0.2), ("bass", 0.3), ("other", 0.05)):
+        _constant(tmp_path / f"{name}.wav", value)
+    # Composites and the source must not be mixed in again
+    _constant(tmp_path / "accompaniment.wav", 0.55)
+    _constant(tmp_path / "music.wav", 0.65)
+    return tmp_path
+
+
+class TestFindStems:
+    def test_separation_layout(self, stems):
+        found = find_stems(str(stems))
+        assert sorted(found) == ["bass", "drums", "other", "vocals"]
+        assert found["drums"] == str(stems / "drums.wav")
+
+    def test_other_files_fall_back_to_all(self, tmp_path):
+        _constant(tmp_path / "guitar.wav", 0.1)
+        _constant(tmp_path / "music.wav", 0.1)
+        assert list(find_stems(str(tmp_path))) == ["guitar"]
+
+    def test_missing_directory(self, tmp_path):
+        with pytest.raises(ValueError):
+            find_stems(str(tmp_path / "missing"))
+
+    def test_no_stems(self, tmp_path):
+        with pytest.raises(ValueError):
+            find_stems(str(tmp_path))
+
+
+class TestGains:
+    def test_parse_gain(self):
+        assert parse_gain("drums=-6") == ("drums", -6.0)
+        assert parse_gain(" vocals = 3.5") == ("vocals", 3.5)
+
+    @pytest.mark.parametrize("spec", ["drums", "=3", "drums=loud"])
+    def test_invalid_gain(self, spec):
+        with pytest.raises(ValueError):
+            parse_gain(spec)
+
+    def test_mix_gains(self):
+        gains = mix_gains(["vocals", "drums", "bass"], {"drums": -20}, mutes=["vocals"])
+        assert gains["vocals"] == 0.0
+        assert gains["drums"] == pytest.approx(0.1)
+        assert gains["bass"] == 1.0
+
+    def test_only(self):
+        gains = mix_gains(["vocals", "drums", "bass"], only=["bass"])
+        assert gains == {"vocals": 0.0, "drums": 0.0, "bass": 1.0}
+
+    def test_unknown_stem(self):
+        with pytest.raises(ValueError, match="Unknown stem: piano"):
+            mix_gains(["vocals", "drums"], mutes=["piano"])
+
+
+class TestRemix:
+    def test_gains_and_mutes(self, stems, tmp_path):
+        output = str(tmp_path / "out" / "mix.wav")
+        gains = mix_gains(find_stems(str(stems)), {"bass": -6.0206}, mutes=["vocals"])
+        peak = remix(find_stems(str(stems)), output, gains, block_frames=1000)
+        data, rate = read_wav(output)
+        assert rate == RATE
+        assert data.shape == (RATE, 2)
+        assert peak == pytest.approx(0.4, abs=1e-3)
+        assert np.allclose(data, 0.4, atol=1e-3)
+
+    def test_shorter_stems_are_padded(self, tmp_path):
+        _constant(tmp_path / "vocals.wav", 0.25, frames=1500)
+        _constant(tmp_path / "accompaniment.wav", 0.25, frames=1000)
+        output = str(tmp_path / "mix.wav")
+        remix(find_stems(str(tmp_path)), output, {"vocals": 1.0, "accompaniment": 1.0}, block_frames=512)
+        data, _ = read_wav(output)
+        assert len(data) == 1500
+        assert np.allclose(data[:1000], 0.5, atol=1e-3)
+        assert np.allclose(data[1000:], 0.25, atol=1e-3)
+
+    def test_normalize_prevents_clipping(self, stems, tmp_path):
+        output = str(tmp_path / "mix.wav")
+        files = find_stems(str(stems))
+        peak = remix(files, output, {stem: 2.0 for stem in files})
+        data, _ = read_wav(output)
+        assert peak == pytest.approx(1.3, abs=1e-3)
+        assert np.abs(data).max() == pytest.approx(CEILING, abs=1e-3)
+
+    def test_soft_clip(self, stems, tmp_path):
+        output = str(tmp_path / "mix.wav")
+        files = find_stems(str(stems))
+        remix(files, output, {stem: 2.0 for stem in files}, clip="soft")
+        data, _ = read_wav(output)
+        assert 0.9 < np.abs(data).max() < 1.0
+
+    def test_all_muted(self, stems, tmp_path):
+        files = find_stems(str(stems))
+        with pytest.raises(ValueError):
+            remix(files, str(tmp_path / "mix.wav"), {stem: 0.0 for stem in files})
+
+    def test_sample_rate_mismatch(self, tmp_path):
+        _constant(tmp_path / "vocals.wav", 0.1)
+        _constant(tmp_path / "accompaniment.wav", 0.1, rate=22050)
+        with pytest.raises(ValueError):
+            remix(find_stems(str(tmp_path)), str(tmp_path / "mix.wav"), {"vocals": 1.0, "accompaniment": 1.0})
+
+
+class TestSoftClip:
+    def test_below_knee_unchanged(self):
+        samples = np.array([0.5, -0.8], dtype=np.float32)
+        assert np.array_equal(soft_clip(samples.copy()), samples)
+
+    def test_peaks_stay_below_full_scale(self):
+        samples = soft_clip(np.array([1.5, -3.0, 0.95], dtype=np.float32))
+        assert np.all(np.abs(samples) <= 1.0)
+        assert samples[1] < 0
+        assert samples[2] > 0.9
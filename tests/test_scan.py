@@ -0,0 +1,137 @@
+import csv
+import json
+import os
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+# Add src directory to path for development usage
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import write_wav  # noqa: E402
+from demix.scan import (  # noqa: E402
+    analyze_file,
+    export_index,
+    find_audio_files,
+    open_index,
+    pending_files,
+    scan_library,
+)
+
+RATE = 44100
+
+
+def _song(path, seconds=6, note=57):
+    t = np.arange(RATE * seconds) / RATE
+    tone = sum(np.sin(2 * np.pi * 440 * 2 ** ((n - 69) / 12) * t) for n in (note, note + 3, note + 7))
+    tone *= np.exp(-3 * (t % 0.5))
+    tone = (tone / np.abs(tone).max() * 0.5).astype(np.float32)
+    write_wav(str(path), np.stack([tone, tone], axis=1))
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "library"
+    (root / "album").mkdir(parents=True)
+    _song(root / "a.wav")
+    _song(root / "album" / "b.wav", note=62)
+    (root / "cover.jpg").write_bytes(b"jpg")
+    return root
+
+
+@pytest.fixture
+def index(tmp_path):
+    connection = open_index(str(tmp_path / "index" / "library.sqlite"))
+    yield connection
+    connection.close()
+
+
+class TestFindAudioFiles:
+    def test_recursive_audio_only(self, library):
+        files = find_audio_files(str(library))
+        assert files == [str(library / "a.wav"), str(library / "album" / "b.wav")]
+
+
+class TestAnalyzeFile:
+    def test_wav_is_read_directly(self, library):
+        with patch("demix.scan.iter_decoded_blocks") as mock_decode:
+            row = analyze_file(str(library / "a.wav"))
+        mock_decode.assert_not_called()
+        assert row["error"] is None
+        assert (row["key"], row["scale"]) == ("A", "minor")
+        assert row["duration"] == 6.0
+        assert row["loudness_lufs"] < 0
+
+    def test_error_is_reported(self, tmp_path):
+        path = tmp_path / "broken.mp3"
+        path.write_bytes(b"not audio")
+        with patch("demix.scan.iter_decoded_blocks", side_effect=RuntimeError("ffmpeg could not decode")):
+            row = analyze_file(str(path))
+        assert row == {"path": str(path), "error": "ffmpeg could not decode"}
+
+
+class TestScanLibrary:
+    def test_scan_and_rescan(self, library, index):
+        results = []
+        assert scan_library(str(library), index, jobs=2, on_result=lambda *args: results.append(args)) == 2
+        assert sorted(row["path"] for _, _, row in results) == find_audio_files(str(library))
+        assert [done for done, _, _ in results] == [1, 2]
+        rows = dict(index.execute("SELECT path, key FROM tracks"))
+        assert rows == {str(library / "a.wav"): "A", str(library / "album" / "b.wav"): "D"}
+
+        # Nothing changed: nothing to analyze
+        assert scan_library(str(library), index, jobs=2) == 0
+
+        # Changed and new files are analyzed again, deleted ones leave the index
+        _song(library / "a.wav", seconds=7)
+        _song(library / "c.wav")
+        os.remove(library / "album" / "b.wav")
+        assert pending_files(index, find_audio_files(str(library))) == [
+            (str(library / f), os.stat(library / f).st_size, os.stat(library / f).st_mtime)
+            for f in ("a.wav", "c.wav")
+        ]
+        assert scan_library(str(library), index, jobs=1) == 2
+        paths = [path for (path,) in index.execute("SELECT path FROM tracks ORDER BY path")]
+        assert paths == [str(library / "a.wav"), str(library / "c.wav")]
+
+    def test_failed_files_are_retried(self, library, index):
+        index.execute(
+            "INSERT INTO tracks (path, size, mtime, error, scanned_at) VALUES (?, ?, ?, ?, 0)",
+            (str(library / "a.wav"), os.stat(library / "a.wav").st_size,
+             os.stat(library / "a.wav").st_mtime, "failed"),
+        )
+        pending = pending_files(index, [str(library / "a.wav")])
+        assert [path for path, _, _ in pending] == [str(library / "a.wav")]
+
+
+class TestExportIndex:
+    def _fill(self, index):
+        index.execute(
+            "INSERT INTO tracks (path, size, mtime, key, scale, bpm, scanned_at) "
+            "VALUES ('/music/a.mp3', 10, 1.5, 'C', 'major', 120.0, 2.0)"
+        )
+
+    def test_json(self, index, tmp_path):
+        self._fill(index)
+        path = str(tmp_path / "tracks.json")
+        assert export_index(index, path) == 1
+        with open(path) as f:
+            rows = json.load(f)
+        assert rows[0]["path"] == "/music/a.mp3"
+        assert rows[0]["bpm"] == 120.0
+        assert rows[0]["loudness_lufs"] is None
+
+    def test_csv(self, index, tmp_path):
+        self._fill(index)
+        path = str(tmp_path / "tracks.txt")
+        export_index(index, path, "csv")
+        with open(path) as f:
+            rows = list(csv.DictReader(f))
+        assert rows[0]["key"] == "C"
+        assert rows[0]["scale"] == "major"
+
+    def test_unknown_format(self, index, tmp_path):
+        with pytest.raises(ValueError):
+            export_index(index, str(tmp_path / "tracks.xml"))
@@ -0,0 +1,123 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Add src directory to path for development usage
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import read_wav, write_wav  # noqa: E402
+from demix.silence import (  # noqa: E402
+    detect_active_regions,
+    frame_rms_db,
+    separate_active_regions,
+    splice_regions,
+)
+
+RATE = 8000
+
+
+def _tone(seconds, amplitude=0.5):
+    t = np.arange(int(seconds * RATE)) / RATE
+    mono = amplitude * np.sin(2 * np.pi * 440 * t)
+    return np.stack([mono, mono], axis=1).astype(np.float32)
+
+
+def _silence(seconds):
+    return np.zeros((int(seconds * RATE), 2), dtype=np.float32)
+
+
+class TestFrameRmsDb:
+    def test_full_scale_square_is_zero_db(self):
+        samples = np.ones((400, 2), dtype=np.float32)
+        np.testing.assert_allclose(frame_rms_db(samples, 100), 0.0, atol=1e-6)
+
+    def test_silence_is_very_low(self):
+        assert (frame_rms_db(np.zeros((400, 2)), 100) < -150).all()
+
+    def test_partial_last_frame(self):
+        assert len(frame_rms_db(np.ones((450, 2)), 100)) == 5
+
+
+class TestDetectActiveRegions:
+    def test_all_active(self):
+        samples = _tone(5)
+        assert detect_active_regions(samples, RATE) == [(0, len(samples))]
+
+    def test_long_gap_is_skipped(self):
+        samples = np.concatenate([_tone(2), _silence(10), _tone(2)])
+        regions = detect_active_regions(samples, RATE, padding=0.25)
+        assert len(regions) == 2
+        first, second = regions
+        assert first[0] == 0
+        assert abs(first[1] - int(2.25 * RATE)) <= RATE * 0.05
+        assert abs(second[0] - int(11.75 * RATE)) <= RATE * 0.05
+        assert second[1] == len(samples)
+
+    def test_short_gap_is_kept(self):
+        samples = np.concatenate([_tone(2), _silence(1), _tone(2)])
+        assert detect_active_regions(samples, RATE) == [(0, len(samples))]
+
+    def test_only_silence(self):
+        assert detect_active_regions(_silence(5), RATE) == []
+
+
+class TestSpliceRegions:
+    def test_places_chunks_at_offsets(self):
+        condensed = np.arange(10, dtype=np.float32).reshape(-1, 1)
+        result = splice_regions(condensed, [(2, 5), (10, 17)], 20)
+        assert result[:, 0].tolist() == [0, 0, 0, 1, 2, 0, 0, 0, 0, 0, 3, 4, 5, 6, 7, 8, 9, 0, 0, 0]
+
+    def test_short_condensed_output(self):
+        condensed = np.ones((4, 2), dtype=np.float32)
+        result = splice_regions(condensed, [(0, 3), (5, 8)], 10)
+        assert result[:, 0].tolist() == [1, 1, 1, 0, 0, 1, 0, 0, 0, 0]
+
+
+class TestSeparateActiveRegions:
+    def _fake_separate(self, calls):
+        def separate(input_file, output_folder):
+            samples, rate = read_wav(input_file)
+            calls.append(len(samples))
+            write_wav(os.path.join(output_folder, "vocals.wav"), samples * 0.5, rate)
+            write_wav(os.path.join(output_folder, "accompaniment.wav"), samples * 0.5, rate)
+        return separate
+
+    def test_separates_condensed_audio_and_restores_timeline(self):
+        samples = np.concatenate([_tone(2), _silence(20), _tone(3)])
+        calls = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            wav_file = os.path.join(tmpdir, "music.wav")
+            write_wav(wav_file, samples, RATE)
+            skipped = separate_active_regions(
+                wav_file, tmpdir, ["vocals", "accompaniment"], self._fake_separate(calls)
+            )
+            vocals, _ = read_wav(os.path.join(tmpdir, "vocals.wav"))
+            assert not os.path.exists(os.path.join(tmpdir, "music_active.wav"))
+        assert calls[0] < len(samples) * 0.3
+        assert skipped > 0.7
+        assert vocals.shape == samples.shape
+        np.testing.assert_allclose(vocals, samples * 0.5, atol=1e-3)
+
+    def test_no_silence_uses_original_file(self):
+        samples = _tone(3)
+        calls = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            wav_file = os.path.join(tmpdir, "music.wav")
+            write_wav(wav_file, samples, RATE)
+            skipped = separate_active_regions(
+                wav_file, tmpdir, ["vocals", "accompaniment"], self._fake_separate(calls)
+            )
+        assert skipped == 0.0
+        assert calls == [len(samples)]
+
+    def test_all_silence_skips_separation(self):
+        calls = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            wav_file = os.path.join(tmpdir, "music.wav")
+            write_wav(wav_file, _silence(5), RATE)
+            skipped = separate_active_regions(wav_file, tmpdir, ["vocals"], self._fake_separate(calls))
+            assert os.path.exists(os.path.join(tmpdir, "vocals.wav"))
+        assert skipped == 1.0
+        assert calls == []
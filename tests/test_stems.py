@@ -0,0 +1,138 @@
+import json
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+# Add src directory to path for development usage
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import read_wav, write_wav  # noqa: E402
+from demix.stems import (  # noqa: E402
+    build_composite_stems,
+    model_name,
+    mode_stems,
+    model_spec,
+    parse_modes,
+    parse_stems,
+    select_mode,
+    stem_sources,
+)
+
+
+class TestStemSources:
+    def test_native_stem(self):
+        assert stem_sources("vocals", "2stems") == ["vocals"]
+
+    def test_accompaniment_from_4stems(self):
+        assert stem_sources("accompaniment", "4stems") == ["drums", "bass", "other"]
+
+    def test_accompaniment_from_5stems(self):
+        assert stem_sources("accompaniment", "5stems") == ["drums", "bass", "piano", "other"]
+
+    def test_exclude_stem(self):
+        assert stem_sources("no_drums", "4stems") == ["vocals", "bass", "other"]
+
+    def test_no_vocals_from_2stems(self):
+        assert stem_sources("no_vocals", "2stems") == ["accompaniment"]
+
+    def test_unavailable_stem(self):
+        assert stem_sources("piano", "4stems") is None
+        assert stem_sources("no_piano", "4stems") is None
+
+
+class TestSelectMode:
+    def test_vocals_only_uses_2stems(self):
+        assert select_mode(["vocals"]) == "2stems"
+
+    def test_vocals_and_no_vocals_uses_2stems(self):
+        assert select_mode(["vocals", "no_vocals"]) == "2stems"
+
+    def test_bass_uses_4stems(self):
+        assert select_mode(["vocals", "bass"]) == "4stems"
+
+    def test_piano_uses_5stems(self):
+        assert select_mode(["piano"]) == "5stems"
+
+    def test_unknown_raises(self):
+        with pytest.raises(ValueError):
+            select_mode(["kazoo"])
+
+
+class TestParseModes:
+    def test_parse_list(self):
+        assert parse_modes("4stems, 2stems,4stems") == ["4stems", "2stems"]
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError) as excinfo:
+            parse_modes("2stems,6stems")
+        assert "Unknown separation mode: 6stems" in str(excinfo.value)
+
+    def test_empty(self):
+        with pytest.raises(ValueError):
+            parse_modes(",")
+
+
+class TestModeStems:
+    def test_single_mode(self):
+        assert mode_stems(["4stems"]) == ["vocals", "drums", "bass", "other"]
+
+    def test_several_modes_need_one_model(self):
+        stems = mode_stems(["2stems", "5stems"])
+        assert stems == ["vocals", "accompaniment", "drums", "bass", "piano", "other"]
+        assert select_mode(stems) == "5stems"
+
+
+class TestParseStems:
+    def test_parse_list(self):
+        assert parse_stems("vocals, bass,vocals") == ["vocals", "bass"]
+
+    def test_unknown_stem(self):
+        with pytest.raises(ValueError) as excinfo:
+            parse_stems("vocals,kazoo")
+        assert "Unknown stem: kazoo" in str(excinfo.value)
+
+    def test_empty(self):
+        with pytest.raises(ValueError):
+            parse_stems(" , ")
+
+
+class TestBuildCompositeStems:
+    def test_sums_sources(self):
+        rate = 8000
+        parts = {
+            "vocals": np.full((100, 2), 0.1, dtype=np.float32),
+            "drums": np.full((100, 2), 0.2, dtype=np.float32),
+            "bass": np.full((100, 2), 0.3, dtype=np.float32),
+            "other": np.full((90, 2), 0.1, dtype=np.float32),
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name, samples in parts.items():
+                write_wav(os.path.join(tmpdir, f"{name}.wav"), samples, rate)
+            build_composite_stems(tmpdir, ["vocals", "accompaniment", "no_bass"], "4stems")
+            accompaniment, _ = read_wav(os.path.join(tmpdir, "accompaniment.wav"))
+            no_bass, _ = read_wav(os.path.join(tmpdir, "no_bass.wav"))
+        assert accompaniment.shape == (100, 2)
+        np.testing.assert_allclose(accompaniment[:90], 0.6, atol=1e-3)
+        np.testing.assert_allclose(accompaniment[90:], 0.5, atol=1e-3)
+        np.testing.assert_allclose(no_bass[:90], 0.4, atol=1e-3)
+
+
+class TestModelSpec:
+    def test_standard(self):
+        assert model_spec("2stems") == "spleeter:2stems"
+
+    def test_high_uses_16khz_model(self):
+        assert model_spec("5stems", "high") == "spleeter:5stems-16kHz"
+        assert model_name("5stems", "high") == "5stems-16kHz"
+
+    def test_fast_uses_reduced_bandwidth_config(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config_path = os.path.join(tmpdir, "2stems-fast.json")
+            with open(config_path, "w") as f:
+                json.dump({"F": 512}, f)
+            with patch("demix.stems.cache_path", return_value=config_path):
+                assert model_spec("2stems", "fast") == config_path
@@ -0,0 +1,120 @@
+import io
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+# Add src directory to path for development usage
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import to_int16  # noqa: E402
+from demix.streaming import RealtimeReport, StreamSeparator, stream_separate  # noqa: E402
+
+RATE = 44100
+STEMS = ["vocals", "accompaniment"]
+
+
+def _split(samples):
+    return {"vocals": samples * 0.25, "accompaniment": samples * 0.75}
+
+
+def _noise(frames, seed=0):
+    return (np.random.default_rng(seed).standard_normal((frames, 2)) * 0.1).astype(np.float32)
+
+
+def _feed(separator, samples, block):
+    outputs = [separator.process(samples[i:i + block]) for i in range(0, len(samples), block)]
+    outputs.append(separator.flush())
+    return {stem: np.concatenate([output[stem] for output in outputs]) for stem in STEMS}
+
+
+class TestStreamSeparator:
+    @pytest.mark.parametrize("block", [100, 1234, 20000])
+    def test_output_matches_input_whatever_the_block_size(self, block):
+        samples = _noise(10007)
+        outputs = _feed(StreamSeparator(_split, STEMS, 1000, 500, 2000, 2), samples, block)
+        assert outputs["vocals"].shape == samples.shape
+        assert np.allclose(outputs["vocals"], samples * 0.25, atol=1e-6)
+        assert np.allclose(outputs["accompaniment"], samples * 0.75, atol=1e-6)
+
+    def test_fixed_latency(self):
+        separator = StreamSeparator(_split, STEMS, 1000, 500, 2000, 2)
+        assert separator.latency_frames == 1500
+        assert len(separator.process(_noise(1499))["vocals"]) == 0
+        # Every new block releases one block, 1500 frames behind the input
+        assert len(separator.process(_noise(1))["vocals"]) == 1000
+        assert len(separator.process(_noise(1000))["vocals"]) == 1000
+
+    def test_window_has_context_and_lookahead(self):
+        windows = []
+
+        def separate(samples):
+            windows.append(len(samples))
+            return _split(samples)
+
+        _feed(StreamSeparator(separate, STEMS, 1000, 500, 2000, 2), _noise(6000), 6000)
+        # The window grows with the context until it holds 2000 frames of it
+        assert windows[:4] == [1500, 2500, 3500, 3500]
+
+    def test_seams_are_crossfaded(self):
+        calls = []
+
+        def separate(samples):
+            # A model whose output depends on the window, e.g. a different gain per call
+            calls.append(None)
+            return {stem: samples * len(calls) for stem in STEMS}
+
+        samples = np.ones((4000, 2), np.float32)
+        outputs = _feed(StreamSeparator(separate, STEMS, 1000, 500, 0, 2, fade_frames=100), samples, 4000)
+        vocals = outputs["vocals"][:, 0]
+        assert vocals[999] == 1.0
+        # The second block fades from the first window's gain to its own
+        assert 1.0 < vocals[1050] < 2.0
+        assert vocals[1100] == 2.0
+
+
+class TestRealtimeReport:
+    def test_late_blocks(self):
+        report = RealtimeReport(RATE)
+        assert not report.add(RATE, 0.5)
+        assert report.add(RATE, 1.5)
+        assert report.late == 1
+        assert not report.keeps_up
+        assert report.load == pytest.approx(1.0)
+        assert report.worst == pytest.approx(1.5)
+
+
+class TestStreamSeparate:
+    def test_pcm_in_pcm_out(self):
+        samples = _noise(RATE)
+        outputs = {stem: io.BytesIO() for stem in STEMS}
+        report = stream_separate(io.BytesIO(to_int16(samples).tobytes()), outputs, _split, STEMS, latency=0.2)
+        vocals = np.frombuffer(outputs["vocals"].getvalue(), "<i2").reshape(-1, 2)
+        # Input and output are both 16-bit, allow one step of rounding
+        assert np.abs(vocals.astype(int) - to_int16(samples * 0.25)).max() <= 1
+        assert vocals.shape == samples.shape
+        assert report.audio_seconds == pytest.approx(1.0)
+
+    def test_pipe_at_real_time_speed(self):
+        samples = _noise(RATE // 2)
+        read_fd, write_fd = os.pipe()
+        block = RATE // 20
+
+        def play():
+            with os.fdopen(write_fd, "wb") as pipe:
+                for start in range(0, len(samples), block):
+                    pipe.write(to_int16(samples[start:start + block]).tobytes())
+                    pipe.flush()
+                    time.sleep(block / RATE)
+
+        player = threading.Thread(target=play)
+        player.start()
+        outputs = {stem: io.BytesIO() for stem in STEMS}
+        with os.fdopen(read_fd, "rb") as pipe:
+            report = stream_separate(pipe, outputs, _split, STEMS, latency=0.1, context=0.2)
+        player.join()
+        assert report.keeps_up
+        assert len(outputs["accompaniment"].getvalue()) == len(samples) * 4
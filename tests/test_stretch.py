@@ -0,0 +1,103 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Add src directory to path for development usage
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from demix.audio import read_wav, write_wav  # noqa: E402
+from demix.stretch import PhaseVocoder, Resampler, Stretcher, stretch_files  # noqa: E402
+
+RATE = 44100
+
+
+def _sine(frequency, seconds=1.0, amplitude=0.5):
+    t = np.arange(int(RATE * seconds)) / RATE
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def _frequency(signal):
+    spectrum = np.abs(np.fft.rfft(signal * np.hanning(len(signal))))
+    return np.argmax(spectrum) * RATE / len(signal)
+
+
+def _run(processor, signals, block=10000):
+    outputs = [processor.process(signals[:, i:i + block]) for i in range(0, signals.shape[1], block)]
+    outputs.append(processor.process(signals[:, :0], final=True))
+    return np.concatenate(outputs, axis=1)
+
+
+class TestPhaseVocoder:
+    @pytest.mark.parametrize("stretch", [0.8, 1.25])
+    def test_length_and_pitch(self, stretch):
+        signal = _sine(440)[None]
+        output = _run(PhaseVocoder(1, stretch, 2048, 4, True), signal)
+        assert output.shape == (1, round(RATE * stretch))
+        middle = output[0, 4096:-4096]
+        assert _frequency(middle) == pytest.approx(440, abs=3)
+        assert np.sqrt(np.mean(middle ** 2)) == pytest.approx(0.5 / np.sqrt(2), rel=0.05)
+
+    def test_block_size_independent(self):
+        signal = np.stack([_sine(440), _sine(660)])
+        small = _run(PhaseVocoder(2, 0.9, 2048, 4, True), signal, block=777)
+        large = _run(PhaseVocoder(2, 0.9, 2048, 4, True), signal, block=RATE)
+        assert np.allclose(small, large, atol=1e-5)
+
+
+class TestResampler:
+    def test_ratio(self):
+        output = _run(Resampler(1, 2.0, 16), _sine(440)[None])
+        assert output.shape[1] == pytest.approx(RATE / 2, abs=1)
+        # Reading twice as fast doubles the frequency
+        assert _frequency(output[0, 1000:-1000]) == pytest.approx(880, abs=5)
+
+
+class TestStretcher:
+    def test_transpose(self):
+        output = _run(Stretcher(1, 1.0, 2, "standard"), _sine(440)[None])
+        assert output.shape == (1, RATE)
+        assert _frequency(output[0, 4096:-4096]) == pytest.approx(440 * 2 ** (2 / 12), abs=3)
+
+    def test_tempo_and_transpose(self):
+        output = _run(Stretcher(1, 1.25, -3, "fast"), _sine(440)[None])
+        assert output.shape == (1, round(RATE / 1.25))
+        assert _frequency(output[0, 4096:-4096]) == pytest.approx(440 * 2 ** (-3 / 12), abs=3)
+
+    @pytest.mark.parametrize("quality", ["fast", "standard", "high"])
+    @pytest.mark.parametrize("tempo, transpose", [(0.5, 0), (1.0, 12), (0.8, -3), (1.25, 5)])
+    def test_level_is_kept(self, quality, tempo, transpose):
+        output = _run(Stretcher(1, tempo, transpose, quality), _sine(440)[None])[0]
+        middle = output[len(output) // 4:-len(output) // 4]
+        assert 20 * np.log10(np.sqrt(np.mean(middle ** 2)) / (0.5 / np.sqrt(2))) == pytest.approx(0, abs=1)
+        assert 20 * np.log10(np.abs(middle).max() / 0.5) == pytest.approx(0, abs=1)
+
+    def test_level_after_silence(self):
+        # A stem that comes in after a few seconds of silence
+        signal = np.concatenate([np.zeros(RATE, np.float32), _sine(440, seconds=2.0)])[None]
+        output = _run(Stretcher(1, 0.5, 0, "fast"), signal)[0]
+        middle = output[3 * RATE:-RATE]
+        assert np.abs(middle).max() == pytest.approx(0.5, abs=0.03)
+
+    def test_unknown_quality(self):
+        with pytest.raises(ValueError, match="Unknown stretch quality"):
+            Stretcher(1, 0.9, 0, "best")
+
+
+class TestStretchFiles:
+    def test_batched_files(self, tmp_path):
+        inputs = []
+        for name, frequency in (("vocals", 440), ("bass", 110)):
+            path = str(tmp_path / f"{name}.wav")
+            write_wav(path, np.stack([_sine(frequency), _sine(frequency, amplitude=0.25)], axis=1), RATE)
+            inputs.append(path)
+        outputs = [str(tmp_path / "out" / "vocals.wav"), str(tmp_path / "out" / "bass.wav")]
+        stretch_files(inputs, outputs, tempo=0.8, block_frames=5000)
+        for path, frequency in zip(outputs, (440, 110)):
+            data, rate = read_wav(path)
+            assert rate == RATE
+            assert data.shape == (round(RATE / 0.8), 2)
+            assert _frequency(data[4096:-4096, 0]) == pytest.approx(frequency, abs=3)
+            # Channels stay apart
+            assert np.abs(data[4096:-4096, 1]).max() == pytest.approx(0.25, abs=0.03)